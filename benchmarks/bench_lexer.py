@@ -0,0 +1,96 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+# Measures the throughput of the lexer (in tokens per second) on a large Clojure file, once reading character by
+# character (`Lexer.__next__`), and once through the compiled regular expression (`Lexer.tokens()`). Finally, the
+# time for reading the entire file into Clojure forms is reported.
+#
+# Usage: python benchmarks/bench_lexer.py [FILE.clj] [--size MEGABYTES] [--repeat N]
+#
+# Without a file, a model with a large data vector (of the given size) is generated.
+#
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pyppl.fe_clojure.ppl_clojure_lexer import ClojureLexer
+
+
+def generate_source(size: int) -> str:
+    rng = random.Random(42)
+    result = [
+        "; A linear regression with a large data set\n",
+        "(def xs [",
+    ]
+    length = sum([len(s) for s in result])
+    count = 0
+    while length < size:
+        item = "{:.6f} ".format(rng.gauss(0, 10)) if count % 2 == 0 else "{} ".format(rng.randint(-1000, 1000))
+        if count % 16 == 15:
+            item += "\n   "
+        result.append(item)
+        length += len(item)
+        count += 1
+    result.append("])\n")
+    result.append("(let [slope (sample (normal 0.0 10.0))\n"
+                  "      bias  (sample (normal 0.0 10.0))]\n"
+                  "  (loop 10 nil (fn [i _] (observe (normal (+ (* slope (get xs i)) bias) 1.0) 2.5)))\n"
+                  "  [slope bias])\n")
+    return ''.join(result)
+
+
+def make_lexer(source: str):
+    return ClojureLexer(source).lexer
+
+
+def measure(source: str, compiled: bool, repeat: int):
+    best = None
+    count = 0
+    for _ in range(repeat):
+        lexer = make_lexer(source)
+        tokens = lexer.tokens() if compiled else lexer
+        start = time.perf_counter()
+        count = 0
+        for _ in tokens:
+            count += 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="benchmark the lexer on a large Clojure file")
+    arg_parser.add_argument('filename', nargs='?', default=None)
+    arg_parser.add_argument('--size', type=float, default=4.0, help="size of the generated source in megabytes")
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    if args.filename is not None:
+        with open(args.filename) as f:
+            source = f.read()
+    else:
+        source = generate_source(int(args.size * 1024 * 1024))
+    print("source: {:.2f} MB".format(len(source) / (1024 * 1024)))
+
+    results = {}
+    for name, compiled in (('character-based', False), ('compiled', True)):
+        count, elapsed = measure(source, compiled, args.repeat)
+        results[name] = elapsed
+        print("{:>16}: {:>9} tokens in {:7.3f} s = {:>12,.0f} tokens/s".format(name, count, elapsed, count / elapsed))
+    print("speed-up: {:.1f}x".format(results['character-based'] / results['compiled']))
+
+    # The complete reader, including the line numbers of all forms
+    start = time.perf_counter()
+    forms = list(ClojureLexer(source))
+    elapsed = time.perf_counter() - start
+    print("{:>16}: {:>9} forms  in {:7.3f} s".format('reader', len(forms), elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+# Compares plain recursive visiting of the AST with the bounded-depth engine in `ppl_ast` (`__visit_iteratively__`).
+# For each visitor, we report the time on a long, flat body (as produced by unrolling loops), and on a left-deep
+# sum (as produced by `reduce` or loops accumulating a value), once with plain recursion and once with the engine.
+# The last column shows the largest number of Python frames on any one stack (thread) during the visit.
+#
+# Usage: python benchmarks/bench_visitor.py [--size N] [--depth N] [--repeat N]
+#
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pyppl.ppl_ast import *
+from pyppl.ppl_ast_annotators import InfoAnnotator
+from pyppl.backend.ppl_code_generator import CodeGenerator
+from pyppl.transforms.ppl_raw_simplifier import RawSimplifier
+from pyppl.types.ppl_type_inference import TypeInferencer
+
+
+def make_flat_body(size: int):
+    return AstBody([AstDef('x{}'.format(i), AstBinary(AstSymbol('a'), '+', AstValue(i))) for i in range(size)])
+
+
+def make_deep_sum(depth: int):
+    result = AstSymbol('x')
+    for i in range(depth):
+        result = AstBinary(result, '+', AstValue(i))
+    return result
+
+
+VISITORS = [
+    ('InfoAnnotator', InfoAnnotator, lambda: InfoAnnotator()),
+    ('CodeGenerator', CodeGenerator, lambda: CodeGenerator()),
+    ('RawSimplifier', RawSimplifier, lambda: RawSimplifier({})),
+    ('TypeInferencer', TypeInferencer, lambda: TypeInferencer(None)),
+]
+
+
+class _StackMeter(object):
+    """
+    Records the maximal number of nested Python frames per thread, through the profiling hooks.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.max_depth = 0
+
+    def __call__(self, frame, event, arg):
+        depth = getattr(self.local, 'depth', None)
+        if depth is None:
+            depth = 0
+            f = frame
+            while f is not None:
+                depth += 1
+                f = f.f_back
+        elif event == 'call':
+            depth += 1
+        elif event == 'return':
+            depth -= 1
+        self.local.depth = depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def __enter__(self):
+        sys.setprofile(self)
+        threading.setprofile(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        sys.setprofile(None)
+        threading.setprofile(None)
+
+
+def run(visitor_class, factory, make_input, iterative: bool, repeat: int):
+    saved = visitor_class.__dict__.get('__visit_iteratively__', None)
+    visitor_class.__visit_iteratively__ = iterative
+    try:
+        best = None
+        for _ in range(repeat):
+            ast = make_input()      # a fresh AST, as `InfoAnnotator` caches its results on the nodes
+            start = time.perf_counter()
+            factory().visit(ast)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        ast = make_input()
+        with _StackMeter() as meter:
+            factory().visit(ast)
+        return "{:8.3f} s {:>6} frames".format(best, meter.max_depth)
+    except RecursionError:
+        return "{:>22}".format('RecursionError')
+    finally:
+        if saved is None:
+            del visitor_class.__visit_iteratively__
+        else:
+            visitor_class.__visit_iteratively__ = saved
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="benchmark the visitors on flat and on deeply nested ASTs")
+    arg_parser.add_argument('--size', type=int, default=10000, help="number of statements in the flat body")
+    arg_parser.add_argument('--depth', type=int, default=10000, help="number of terms in the deep sum")
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    inputs = [
+        ('flat body ({})'.format(args.size), lambda: make_flat_body(args.size)),
+        ('deep sum ({})'.format(args.depth), lambda: make_deep_sum(args.depth)),
+    ]
+    print("{:<16}{:<20}{:>24}{:>24}".format('visitor', 'input', 'recursive', 'iterative'))
+    for name, visitor_class, factory in VISITORS:
+        for input_name, make_input in inputs:
+            recursive = run(visitor_class, factory, make_input, False, args.repeat)
+            iterative = run(visitor_class, factory, make_input, True, args.repeat)
+            print("{:<16}{:<20}{:>24}{:>24}".format(name, input_name, recursive, iterative))
+
+
+if __name__ == '__main__':
+    main()
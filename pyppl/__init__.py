@@ -7,8 +7,12 @@
 # 26. Mar 2018, Tobias Kohn
 #
 from typing import Optional
-from . import distributions, parser
-from .backend import ppl_graph_generator
+from . import distributions, parser, ppl_model_io
+from .types import ppl_types
+from .backend import ppl_graph_generator, ppl_graph_factory
+from .ppl_batch_compiler import compile_models
+from .ppl_model_io import load_model
+from .transforms.ppl_pass_manager import PassManager
 
 
 
@@ -16,7 +20,14 @@ def compile_model(source, *,
                   language: Optional[str]=None,
                   imports=None,
                   base_class: Optional[str]=None,
-                  namespace: Optional[dict]=None):
+                  namespace: Optional[dict]=None,
+                  query: Optional[list]=None,
+                  data_dir: Optional[str]=None,
+                  data: Optional[dict]=None,
+                  collapse_iid: bool=False,
+                  output_dir: Optional[str]=None,
+                  module_name: str='model',
+                  passes=None):
     if type(imports) in (list, set, tuple):
         imports = '\n'.join(imports)
     if namespace is not None:
@@ -25,18 +36,38 @@ def compile_model(source, *,
         namespace = ns
     else:
         namespace = distributions.namespace
-    ast = parser.parse(source, language=language, namespace=namespace)
-    gg = ppl_graph_generator.GraphGenerator()
+    if data is not None:
+        data_types = { key: ppl_types.from_data(data[key]) for key in data }
+    else:
+        data_types = None
+    ast = parser.parse(source, language=language, namespace=namespace, data_types=data_types, passes=passes)
+    gg = ppl_graph_generator.GraphGenerator(ppl_graph_factory.GraphFactory(data_dir=data_dir))
+    if data is not None:
+        for key in data:
+            gg.define_data(key, data[key])
     gg.visit(ast)
-    return gg.generate_model(base_class=base_class, imports=imports)
+    model = gg.generate_model(base_class=base_class, imports=imports, query=query, collapse_iid=collapse_iid)
+    if output_dir is not None:
+        module_file, _ = ppl_model_io.write_model(model, output_dir, module_name)
+        model = ppl_model_io.load_model(module_file)
+    return model
 
 
 def compile_model_from_file(filename: str, *,
                             language: Optional[str]=None,
                             imports=None,
                             base_class: Optional[str]=None,
-                            namespace: Optional[dict]=None):
+                            namespace: Optional[dict]=None,
+                            query: Optional[list]=None,
+                            data_dir: Optional[str]=None,
+                            data: Optional[dict]=None,
+                            collapse_iid: bool=False,
+                            output_dir: Optional[str]=None,
+                            module_name: str='model',
+                            passes=None):
     with open(filename) as f:
         lines = ''.join(f.readlines())
         return compile_model(lines, language=language, imports=imports, base_class=base_class,
-                             namespace=namespace)
+                             namespace=namespace, query=query, data_dir=data_dir, data=data,
+                             collapse_iid=collapse_iid, output_dir=output_dir, module_name=module_name,
+                             passes=passes)
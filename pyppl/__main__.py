@@ -0,0 +1,55 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+# Usage: python -m pyppl compile [-o OUTPUT_DIR] [-j WORKERS] PATH [PATH ...]
+#
+import argparse
+import sys
+from .ppl_batch_compiler import compile_models
+
+
+def _print_result(result):
+    if result.success:
+        print("ok    {:8.3f}s  {}".format(result.time, result.filename))
+    else:
+        print("FAIL  {:8.3f}s  {}: {}".format(result.time, result.filename, result.error))
+    sys.stdout.flush()
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m pyppl')
+    commands = arg_parser.add_subparsers(dest='command')
+    cmd = commands.add_parser('compile', help='compile model files into standalone modules')
+    cmd.add_argument('paths', nargs='+', metavar='PATH', help='model files or directories containing model files')
+    cmd.add_argument('-o', '--output-dir', default='compiled_models', help='directory to write the modules to')
+    cmd.add_argument('-j', '--workers', type=int, default=None, help='number of worker processes')
+    cmd.add_argument('--data-dir', default=None, help='directory to spill large data arrays to')
+    cmd.add_argument('--collapse-iid', action='store_true', help='collapse iid observations')
+    cmd.add_argument('--passes', default=None, help='comma-separated list of transformation passes to run')
+    cmd.add_argument('-v', '--verbose', action='store_true', help='print the full traceback of failed files')
+    args = arg_parser.parse_args(args)
+
+    if args.command == 'compile':
+        passes = [name.strip() for name in args.passes.split(',')] if args.passes is not None else None
+        results = compile_models(args.paths, workers=args.workers, output_dir=args.output_dir,
+                                 callback=_print_result, data_dir=args.data_dir, collapse_iid=args.collapse_iid,
+                                 passes=passes)
+        failed = [r for r in results if not r.success]
+        total_time = sum([r.time for r in results])
+        print("{} compiled, {} failed ({:.3f}s in total)".format(len(results) - len(failed), len(failed), total_time))
+        if args.verbose:
+            for r in failed:
+                if r.traceback is not None:
+                    print()
+                    print(r.filename)
+                    print(r.traceback)
+        return 1 if len(failed) > 0 else 0
+
+    arg_parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -130,6 +130,13 @@ class TransformVisitor(ScopedVisitor):
         else:
             return node.clone(source=source, expr=expr)
 
+    def visit_nary(self, node: AstNary):
+        items = self.do_visit_items(node.items)
+        if items is node.items:
+            return node
+        else:
+            return _cl(makeNary(node.op, items), node)
+
     def visit_observe(self, node: AstObserve):
         dist = self.visit(node.dist)
         value = self.visit(node.value)
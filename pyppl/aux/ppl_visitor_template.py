@@ -55,6 +55,9 @@ class MyVisitor(Visitor):
     def visit_list_for(self, node: AstListFor):
         return self.visit_node(node)
 
+    def visit_nary(self, node: AstNary):
+        return self.visit_node(node)
+
     def visit_observe(self, node: AstObserve):
         return self.visit_node(node)
 
@@ -0,0 +1,440 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+import ast
+import re
+from typing import Optional
+try:
+    import torch as _torch
+    from torch.distributions import transform_to as _transform_to
+except ModuleNotFoundError:
+    _torch = None
+    _transform_to = None
+
+
+#
+# Support for batched (vectorized) code: instead of one value per vertex, the state holds a tensor with a leading
+# batch dimension for each vertex. The code of the distributions and conditions is rewritten (see `vectorize_code`)
+# so that all constructs which would force a tensor into a single Python `bool` use element-wise tensor operations
+# instead: conditional expressions become `where`, `and`/`or`/`not` become logical operations (masks), and indexing
+# with a batched index becomes a gather. The functions below are then called from the generated code.
+#
+# Where a vertex is only evaluated under some conditions, its log-probability is computed for the entire batch, and
+# then masked out. The rows where the conditions do not hold may well have values outside the support of the
+# distribution, though, which would lead to NaNs in the gradients, even if the term itself is masked out. Hence, the
+# parameters and values of such rows are replaced by safe values (see `mask_param` and `mask_value`) before computing
+# the log-probability.
+#
+# The rewriting operates on the Python code of the nodes, rather than on the AST of the original program, since the
+# graph does not keep the latter. It requires `ast.unparse` (Python 3.9+); with older versions, `vectorize_code`
+# leaves the code unchanged, and the generated methods fall back to drawing the samples one by one.
+#
+
+class _Vectorizer(ast.NodeTransformer):
+
+    def __init__(self, module_name: str, size_name: str):
+        self.module_name = module_name
+        self.size_name = size_name
+
+    def _call(self, func_name: str, args: list):
+        func = ast.Attribute(value=ast.Name(id=self.module_name, ctx=ast.Load()), attr=func_name, ctx=ast.Load())
+        return ast.Call(func=func, args=args, keywords=[])
+
+    def visit_IfExp(self, node: ast.IfExp):
+        self.generic_visit(node)
+        return self._call('where', [node.test, node.body, node.orelse])
+
+    def visit_BoolOp(self, node: ast.BoolOp):
+        self.generic_visit(node)
+        return self._call('logical_and' if isinstance(node.op, ast.And) else 'logical_or', node.values)
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return self._call('logical_not', [node.operand])
+        return node
+
+    def visit_Compare(self, node: ast.Compare):
+        self.generic_visit(node)
+        if len(node.ops) > 1:
+            left = node.left
+            items = []
+            for op, right in zip(node.ops, node.comparators):
+                items.append(ast.Compare(left=left, ops=[op], comparators=[right]))
+                left = right
+            return self._call('logical_and', items)
+        return node
+
+    def visit_Subscript(self, node: ast.Subscript):
+        self.generic_visit(node)
+        index = node.slice
+        if isinstance(index, ast.Index):     # Python 3.8
+            index = index.value
+        if isinstance(index, (ast.Constant, ast.Slice)) or isinstance(node.ctx, ast.Store):
+            return node
+        return self._call('index', [node.value, index, ast.Name(id=self.size_name, ctx=ast.Load())])
+
+
+def vectorize_code(code: str, module_name: str='_batch', size_name: str='n', is_distribution: bool=False,
+                   mask: Optional[str]=None) -> str:
+    """
+    Rewrites the given Python expression to work on batched tensors (see above). The functions are referred to
+    through `module_name`, and `size_name` is the name of the variable holding the batch size.
+
+    If the code creates a distribution, all the arguments are additionally passed through `param`, since, e.g., a
+    conditional expression with integer values results in an integer tensor, which most distributions do not accept
+    (while they do accept a plain Python integer). If a `mask` is given, the keyword arguments are passed through
+    `mask_param` instead, replacing the rows where the mask is false by safe values.
+    """
+    if not hasattr(ast, 'unparse'):
+        return code
+    try:
+        tree = ast.parse(code, mode='eval')
+    except SyntaxError:
+        return code
+    vectorizer = _Vectorizer(module_name, size_name)
+    tree = vectorizer.visit(tree)
+    if is_distribution and isinstance(tree.body, ast.Call):
+        call = tree.body
+        call.args = [vectorizer._call('param', [arg]) for arg in call.args]
+        for keyword in call.keywords:
+            if mask is not None and keyword.arg is not None:
+                keyword.value = vectorizer._call('mask_param', [ast.parse(mask, mode='eval').body, keyword.value,
+                                                                call.func, ast.Constant(value=keyword.arg)])
+            else:
+                keyword.value = vectorizer._call('param', [keyword.value])
+    return ast.unparse(ast.fix_missing_locations(tree))
+
+
+#
+# The factors of a block of conditionally independent vertices (see `gen_cond_log_prob`) are often copies of each
+# other, created by a loop in the original program, which only differ in the vertices they refer to and in some
+# numeric values (such as the observed values). We split the code of each factor into a template, where these
+# references and numbers are replaced by slots, and the values of the slots. All factors with the same template are
+# then evaluated at once, with the slots that differ between the factors stacked into batches.
+#
+
+def _is_number(node) -> bool:
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        node = node.operand
+    return isinstance(node, ast.Constant) and type(node.value) in (int, float)
+
+def _is_number_literal(node) -> bool:
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return len(node.elts) > 0 and all([_is_number_literal(item) for item in node.elts])
+    return _is_number(node)
+
+
+class _SlotExtractor(ast.NodeTransformer):
+
+    def __init__(self, state_object: str):
+        self.state_object = state_object
+        self.slots = []
+
+    def _slot(self, node):
+        self.slots.append(ast.unparse(node))
+        return ast.Name(id='_slot{}'.format(len(self.slots) - 1), ctx=ast.Load())
+
+    def visit_Subscript(self, node: ast.Subscript):
+        if isinstance(node.value, ast.Name) and node.value.id == self.state_object and isinstance(node.ctx, ast.Load):
+            return self._slot(node)
+        return self.generic_visit(node)
+
+    def visit_Constant(self, node: ast.Constant):
+        return self._slot(node) if _is_number(node) else node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        return self._slot(node) if _is_number(node) else self.generic_visit(node)
+
+    def visit_List(self, node: ast.List):
+        return self._slot(node) if _is_number_literal(node) else self.generic_visit(node)
+
+    def visit_Tuple(self, node: ast.Tuple):
+        return self._slot(node) if _is_number_literal(node) else self.generic_visit(node)
+
+
+class _SlotFiller(ast.NodeTransformer):
+
+    def __init__(self, slots: dict):
+        self.slots = slots
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in self.slots:
+            return ast.parse(self.slots[node.id], mode='eval').body
+        return node
+
+
+def get_template(codes: list, state_object: str) -> Optional[tuple]:
+    """
+    Replaces the references to the state and the numeric literals in the given expressions by slots `_slot0`,
+    `_slot1`, etc. (see above), and returns the tuple of the resulting templates together with the list of the codes
+    of the slots. Returns `None` if the code cannot be parsed (or if `ast.unparse` is not available).
+    """
+    if not hasattr(ast, 'unparse'):
+        return None
+    extractor = _SlotExtractor(state_object)
+    templates = []
+    for code in codes:
+        try:
+            tree = ast.parse(code, mode='eval')
+        except SyntaxError:
+            return None
+        templates.append(ast.unparse(extractor.visit(tree)))
+    return tuple(templates), extractor.slots
+
+
+def fill_template(template: str, slots: dict) -> str:
+    """
+    Replaces the slots in the template (see `get_template`) by the code given for each slot name.
+    """
+    tree = _SlotFiller(slots).visit(ast.parse(template, mode='eval'))
+    return ast.unparse(ast.fix_missing_locations(tree))
+
+
+def find_state_references(code: str, state_object: str) -> set:
+    """
+    Returns the set of names `x` for which the code contains `state['x']`.
+    """
+    pattern = re.escape(state_object) + r"\['([^'\]]+)'\]"
+    return set(re.findall(pattern, code))
+
+
+def _is_tensor(value):
+    return isinstance(value, _torch.Tensor)
+
+
+def param(value):
+    if _is_tensor(value) and not (value.is_floating_point() or value.is_complex()):
+        return value.to(_torch.get_default_dtype())
+    return value
+
+def _expand_mask(mask, dim: int):
+    return mask.bool().reshape(tuple(mask.shape) + (1,) * (dim - mask.dim()))
+
+def _safe_value(constraint, like):
+    try:
+        return _transform_to(constraint)(like).detach()
+    except NotImplementedError:
+        return None
+
+def mask_param(mask, value, distribution, name: str):
+    """
+    Replaces the batched parameter `name` of the distribution (class) by a value that satisfies the parameter's
+    constraint, wherever the mask is false.
+    """
+    value = param(value)
+    if not (_is_tensor(mask) and _is_tensor(value)) or mask.dim() == 0 or value.dim() < mask.dim():
+        return value
+    constraints = getattr(distribution, 'arg_constraints', None)
+    if type(constraints) is not dict or name not in constraints:
+        return value
+    safe = _safe_value(constraints[name], _torch.zeros_like(value))
+    if safe is None:
+        return value
+    try:
+        return _torch.where(_expand_mask(mask, value.dim()), value, safe.to(value.dtype))
+    except RuntimeError:
+        return value
+
+def mask_value(mask, value, distribution):
+    """
+    Replaces the value, wherever the mask is false, by a value inside the support of the distribution, so that its
+    log-probability (and the gradient thereof) is finite.
+    """
+    if not _is_tensor(mask) or mask.dim() == 0:
+        return value
+    like = _torch.zeros(distribution.batch_shape + distribution.event_shape)
+    safe = _safe_value(distribution.support, like)
+    if safe is None:
+        # Discrete supports: the lower bound (or zero) is a valid value
+        safe = like + getattr(distribution.support, 'lower_bound', 0)
+    value = _torch.as_tensor(value) if _is_tensor(value) else _torch.as_tensor(value, dtype=safe.dtype)
+    dim = max(value.dim(), safe.dim())
+    if dim < mask.dim():
+        return value
+    try:
+        return _torch.where(_expand_mask(mask, dim), value, safe.to(value.dtype))
+    except RuntimeError:
+        return value
+
+def where(cond, a, b):
+    if _is_tensor(cond):
+        return _torch.where(cond.bool(), _torch.as_tensor(a), _torch.as_tensor(b))
+    return a if cond else b
+
+def logical_and(*values):
+    if any([_is_tensor(v) for v in values]):
+        result = _torch.as_tensor(values[0]).bool()
+        for v in values[1:]:
+            result = result & _torch.as_tensor(v).bool()
+        return result
+    return all(values)
+
+def logical_or(*values):
+    if any([_is_tensor(v) for v in values]):
+        result = _torch.as_tensor(values[0]).bool()
+        for v in values[1:]:
+            result = result | _torch.as_tensor(v).bool()
+        return result
+    return any(values)
+
+def logical_not(value):
+    if _is_tensor(value):
+        return ~value.bool()
+    return not value
+
+def index(value, idx, n: int):
+    if not _is_tensor(idx):
+        return value[idx]
+    value = _torch.as_tensor(value)
+    idx = idx.long()
+    if idx.dim() == 1 and value.dim() >= 2 and value.shape[0] == n:
+        # Both, the value and the index are batched: pick one element per row
+        return value[_torch.arange(n), idx]
+    return value[idx]
+
+
+def has_batch_shapes(model, state: dict, names: list, n: int) -> bool:
+    """
+    Checks that each of the given entries in the batched state has the shape `(n, ...)`, where `...` is the shape of
+    the respective value in a single (non-batched) sample. This is to detect cases where the batch dimension was not
+    broadcast correctly (e.g., when combining a batch of scalars with a vector). If no single sample can be drawn,
+    we only check the batch dimension.
+    """
+    shapes = getattr(model, '_batch_shapes', None)
+    if shapes is None:
+        try:
+            sample = model.gen_prior_samples()
+            shapes = { name: tuple(_torch.as_tensor(sample[name]).shape) for name in names }
+        except Exception:
+            shapes = {}
+        model._batch_shapes = shapes
+    for name in names:
+        value = state[name]
+        if not _is_tensor(value) or value.dim() == 0 or value.shape[0] != n:
+            return False
+        if name in shapes and tuple(value.shape) != (n,) + shapes[name]:
+            return False
+    return True
+
+
+def stack_states(states: list, names: list) -> dict:
+    """
+    Combines a list of individual states into a batched state, where the entries in `names` are stacked along a new
+    first dimension, and all other entries are taken from the first state.
+    """
+    result = dict(states[0]) if len(states) > 0 else {}
+    for name in names:
+        result[name] = _torch.stack([_torch.as_tensor(state[name]) for state in states])
+    return result
+
+
+def stack_rows(values: list):
+    """
+    Stacks the values of a slot (see `get_template`) along a new first dimension, one row per factor.
+    """
+    if not any([_is_tensor(v) for v in values]):
+        return _torch.tensor(values)
+    values = [_torch.as_tensor(v) for v in values]
+    dtype = values[0].dtype
+    for v in values[1:]:
+        dtype = _torch.promote_types(dtype, v.dtype)
+    return _torch.stack([v.to(dtype) for v in values])
+
+
+def zeros(n: int):
+    return _torch.zeros(n, dtype=_torch.get_default_dtype())
+
+
+def add_rows(totals, indices: list, log_prob, n: Optional[int]):
+    """
+    Adds the log-probabilities of `n` factors, one per row, to the totals at the given indices and returns the new
+    totals. If `n` is `None`, the same log-probability (summed over all its elements) is added to all the indices.
+    Raises a `ValueError` if the log-probabilities do not have one row per factor, i. e. if the factors could not be
+    vectorized after all.
+    """
+    log_prob = _torch.as_tensor(log_prob, dtype=totals.dtype) if not _is_tensor(log_prob) else log_prob.to(totals.dtype)
+    if n is None:
+        log_prob = log_prob.sum().expand(len(indices))
+    elif log_prob.dim() == 0:
+        log_prob = log_prob.expand(n)
+    elif tuple(log_prob.shape) != (n,):
+        raise ValueError("expected {} rows of log-probabilities, got shape {}".format(n, tuple(log_prob.shape)))
+    return totals.index_add(0, _torch.tensor(indices), log_prob)
+
+
+def get_batch_size(state: dict, names: list) -> int:
+    for name in names:
+        value = state.get(name, None)
+        if _is_tensor(value) and value.dim() > 0:
+            return value.shape[0]
+    raise ValueError("cannot determine the batch size of the state")
+
+
+def sum_event(log_prob, n: Optional[int]):
+    """
+    Sums the log-probabilities over all but the batch dimension (or over all dimensions if `n` is `None`, i. e. if
+    the log-probability is the same for the entire batch).
+    """
+    if not _is_tensor(log_prob) or log_prob.dim() == 0:
+        return log_prob
+    if n is None:
+        return log_prob.sum()
+    return log_prob.reshape(log_prob.shape[0], -1).sum(dim=1)
+
+
+def expand(log_prob, n: int):
+    log_prob = _torch.as_tensor(log_prob, dtype=_torch.get_default_dtype()) if not _is_tensor(log_prob) else log_prob
+    if log_prob.dim() == 0:
+        return log_prob.expand(n)
+    return log_prob
+
+
+def log_prob_by_rows(model, state: dict, names: list):
+    """
+    Computes the log-probabilities of a batched state one by one, using `gen_log_prob`. This is the fallback for
+    models that cannot be vectorized.
+    """
+    n = get_batch_size(state, names)
+    result = []
+    for i in range(n):
+        row = dict(state)
+        for name in names:
+            row[name] = state[name][i]
+        log_prob = model.gen_log_prob(row)
+        if log_prob is None:
+            result.append(_torch.tensor(float('nan')))
+        else:
+            result.append(_torch.as_tensor(log_prob, dtype=_torch.get_default_dtype()).sum())
+    return _torch.stack(result)
+
+
+def discard_resampling(resample):
+    """
+    Called by `gen_smc_batch` when it abandons the vectorized pass and falls back to drawing the samples one by one.
+    Notifies the `resample`-callback (if it has a `discard`-method) that the resampling steps it has seen so far
+    belong to the aborted pass.
+    """
+    discard = getattr(resample, 'discard', None)
+    if discard is not None:
+        discard()
+
+
+def weighted_samples_by_rows(model, n: int, names: list):
+    """
+    Draws `n` samples one by one, using `gen_prior_samples`, and weights each by the likelihood of the observations.
+    This is the fallback for `gen_smc_batch` in models that cannot be vectorized (there is no resampling).
+    """
+    states = [model.gen_prior_samples() for _ in range(n)]
+    terms = model.get_observe_terms()
+    log_weights = []
+    for state in states:
+        log_weight = _torch.tensor(0.0, dtype=_torch.get_default_dtype())
+        for term in terms:
+            log_weight = log_weight + _torch.as_tensor(term(state), dtype=log_weight.dtype).sum()
+        log_weights.append(log_weight)
+    if len(log_weights) == 0:
+        return stack_states(states, names), _torch.zeros(0)
+    return stack_states(states, names), _torch.stack(log_weights)
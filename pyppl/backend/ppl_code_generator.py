@@ -249,6 +249,16 @@ class CodeGenerator(ScopedVisitor):
         slices = [self.visit(index) if index is not None else ':' for index in node.indices]
         return "{}[{}]".format(base, ','.join(slices))
 
+    def visit_nary(self, node: AstNary):
+        # A balanced tree keeps the nesting of the generated expression (and thus of Python's parser) logarithmic
+        items = [self.visit(item) for item in node.items]
+        while len(items) > 1:
+            pairs = ["({} {} {})".format(items[i], node.op, items[i+1]) for i in range(0, len(items)-1, 2)]
+            if len(items) % 2 == 1:
+                pairs.append(items[-1])
+            items = pairs
+        return items[0]
+
     def visit_observe(self, node: AstObserve):
         dist = self.visit(node.dist)
         return "observe({}, {})".format(dist, self.visit(node.value))
@@ -313,7 +323,7 @@ class CodeGenerator(ScopedVisitor):
         return repr(node.value)
 
     def visit_value_vector(self, node: AstValueVector):
-        return repr(node.items)
+        return repr(node.to_list())
 
     def visit_vector(self, node: AstVector):
         return "[{}]".format(', '.join([self.visit(item) for item in node.items]))
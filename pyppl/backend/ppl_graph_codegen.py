@@ -10,6 +10,8 @@ import datetime
 import importlib
 from ..graphs import *
 from ..ppl_ast import *
+from .. import ppl_graph_analysis
+from . import ppl_batch_ops, ppl_sufficient_stats
 
 
 class GraphCodeGenerator(object):
@@ -34,8 +36,9 @@ class GraphCodeGenerator(object):
       When any state-object is given, the generated code reads, say, `state['x']` instead of purely `x`.
 
     Hacking:
-      The `generate_model_code`-method uses three fixed methods to generate the code for `__init__`, `__repr__` as
-      well as the doc-string: `_generate_doc_string`, `_generate_init_method`, `_generate_repr_method`. After that,
+      The `generate_model_code`-method uses four fixed methods to generate the code for `__init__`, `__repr__`,
+      `__reduce__` (for pickling) as well as the doc-string: `_generate_doc_string`, `_generate_init_method`,
+      `_generate_repr_method`, `_generate_reduce_method`. After that,
       it scans the object instance of `GraphCodeGenerator` for public methods, and assumes that each method returns
       the code for the respective method.
 
@@ -59,12 +62,14 @@ class GraphCodeGenerator(object):
       Of course, you do not need to actually change this class, but you can derive a new class from it, if you wish.
     """
 
-    def __init__(self, nodes: list, state_object: Optional[str]=None, imports: Optional[str]=None):
+    def __init__(self, nodes: list, state_object: Optional[str]=None, imports: Optional[str]=None,
+                 collapse_iid: bool=False):
         self.nodes = nodes
         self.state_object = state_object
         self.imports = imports
         self.bit_vector_name = None
         self.logpdf_suffix = None
+        self.iid_groups = ppl_sufficient_stats.find_iid_groups(nodes) if collapse_iid else []
 
     def _complete_imports(self, imports: str):
         if imports != '':
@@ -132,6 +137,8 @@ class GraphCodeGenerator(object):
         #     pass
 
         imports = self._complete_imports(imports) + imports
+        if len(self.iid_groups) > 0:
+            imports += "\nfrom {} import ppl_sufficient_stats as _suff_stats\n".format(__package__)
 
         result = ["# {}".format(datetime.datetime.now()),
                   imports,
@@ -150,6 +157,10 @@ class GraphCodeGenerator(object):
         if repr_method is not None:
             result.append('\t' + repr_method.replace('\n', '\n\t'))
 
+        reduce_method = self._generate_reduce_method()
+        if reduce_method is not None:
+            result.append('\t' + reduce_method.replace('\n', '\n\t'))
+
         methods = [x for x in dir(self) if not x.startswith('_') and x != 'generate_model_code']
         for method_name in methods:
             method = getattr(self, method_name)
@@ -170,11 +181,13 @@ class GraphCodeGenerator(object):
 
     def _generate_init_method(self):
         return "def __init__(self, vertices: set, arcs: set, data: set, conditionals: set):\n" \
+               "\tfrom {} import graphs as _graphs\n" \
                "\tsuper().__init__()\n" \
                "\tself.vertices = vertices\n" \
                "\tself.arcs = arcs\n" \
                "\tself.data = data\n" \
-               "\tself.conditionals = conditionals\n"
+               "\tself.conditionals = conditionals\n" \
+               "\tself.data_values = _graphs.DataValues(data)\n".format(_root_package)
 
     def _generate_repr_method(self):
         s = "def __repr__(self):\n" \
@@ -187,6 +200,11 @@ class GraphCodeGenerator(object):
             "\treturn graph\n"
         return s
 
+    def _generate_reduce_method(self):
+        return "def __reduce__(self):\n" \
+               "\tfrom {} import ppl_model_io\n" \
+               "\treturn ppl_model_io.reduce_model(self)\n".format(_root_package)
+
     def get_vertices(self):
         return "return self.vertices"
 
@@ -220,7 +238,8 @@ class GraphCodeGenerator(object):
     def is_torch_imported(self):
         return "import sys \nprint('torch' in sys.modules) \nprint(torch.__version__) \nprint(type(torch.tensor)) \nimport inspect \nprint(inspect.getfile(torch))"
 
-    def _gen_code(self, buffer: list, code_for_vertex, *, want_data_node: bool=True, flags=None):
+    def _gen_code(self, buffer: list, code_for_vertex, *, want_data_node: bool=True, flags=None,
+                  skip_nodes: Optional[set]=None, replace_nodes: Optional[dict]=None):
         distribution = None
         state = self.state_object
         if self.bit_vector_name is not None:
@@ -232,6 +251,11 @@ class GraphCodeGenerator(object):
             name = node.name
             if state is not None:
                 name = "{}['{}']".format(state, name)
+            if skip_nodes is not None and node in skip_nodes:
+                continue
+            if replace_nodes is not None and node in replace_nodes:
+                buffer.append(replace_nodes[node])
+                continue
             if isinstance(node, Vertex):
                 if flags is not None:
                     code = "dst_ = {}".format(node.get_code(**flags))
@@ -252,12 +276,14 @@ class GraphCodeGenerator(object):
                 buffer.append(code)
                 buffer.append("{} |= {} if _c else 0".format(bit_vector, node.bit_index))
 
-            elif want_data_node or not isinstance(node, DataNode):
+            elif want_data_node or not isinstance(node, DataNode) or node.is_binary:
                 code = "{} = {}".format(name, node.get_code())
                 buffer.append(code)
 
     def gen_log_prob(self):
         def code_for_vertex(name: str, node: Vertex):
+            if node.is_observed:
+                name = node.observation
             cond_code = node.get_cond_code(state_object=self.state_object)
             if cond_code is not None:
                 result = cond_code + "\tlog_prob = log_prob + dst_.log_prob({})".format(name)
@@ -267,12 +293,33 @@ class GraphCodeGenerator(object):
                 result = result + self.logpdf_suffix
             return result
 
+        def code_for_iid_group(group: list):
+            node = group[0]
+            cond_code = node.get_cond_code(state_object=self.state_object)
+            code = "log_prob = log_prob + {}".format(ppl_sufficient_stats.get_log_prob_code(group, '_suff_stats'))
+            return code if cond_code is None else cond_code + "\t" + code
+
+        replace_nodes = { group[0]: code_for_iid_group(group) for group in self.iid_groups }
+        skip_nodes = set([v for group in self.iid_groups for v in group[1:]])
+
+        # The data is loaded before the `try`, so that an unbound placeholder is reported (rather than being taken
+        # for an ill-defined density), and written into a copy of the state, leaving the caller's state unchanged
+        state = self.state_object
+        data_code = ["{0} = dict({0})".format(state)] if state is not None else []
+        for node in self.nodes:
+            if isinstance(node, DataNode) and node.is_binary:
+                name = "{}['{}']".format(state, node.name) if state is not None else node.name
+                data_code.append("{} = {}".format(name, node.get_code()))
+                skip_nodes.add(node)
+
         logpdf_code = ["log_prob = 0"]
-        self._gen_code(logpdf_code, code_for_vertex=code_for_vertex, want_data_node=False)
+        self._gen_code(logpdf_code, code_for_vertex=code_for_vertex, want_data_node=False,
+                       skip_nodes=skip_nodes, replace_nodes=replace_nodes)
         logpdf_code.append("return log_prob")
         logpdf_code.insert(0, "try:")
         # return 'state', '\n'.join(logpdf_code)
-        code = ['\n\t'.join(logpdf_code), "\nexcept(ValueError, RuntimeError) as e:\n\tprint('****Warning: Target density is ill-defined****')"]
+        code = [''.join([line + '\n' for line in data_code]), '\n\t'.join(logpdf_code),
+                "\nexcept(ValueError, RuntimeError) as e:\n\tprint('****Warning: Target density is ill-defined****')"]
         return 'state', ''.join(code)
 
 
@@ -312,6 +359,186 @@ class GraphCodeGenerator(object):
             sample_code.append("return " + state)
         return '\n'.join(sample_code)
 
+    def _gen_sample_batch_code(self, code_for_observed=None):
+        """
+        Generates the code to draw a batch of `n` samples at once (see `gen_prior_samples_batch`). For each observed
+        vertex, `code_for_observed(name, node, is_batched, assigned)` can return additional code, where `assigned`
+        lists the batched values computed so far.
+        """
+        state = self.state_object
+        names = [node.name for node in self.nodes if isinstance(node, Vertex) and node.is_sampled]
+
+        # A value is batched if it is sampled, or if its code refers to another batched value
+        batched = set(names)
+        assigned = []
+        sample_code = [state + " = {}"]
+        distribution = None
+        for node in self.nodes:
+            name = "{}['{}']".format(state, node.name)
+            code = node.get_code()
+            is_batched = len(ppl_batch_ops.find_state_references(code, state) & batched) > 0
+            if is_batched:
+                code = ppl_batch_ops.vectorize_code(code, is_distribution=isinstance(node, Vertex))
+            if isinstance(node, Vertex):
+                code = "dst_ = {}".format(code)
+                if code != distribution:
+                    sample_code.append(code)
+                    distribution = code
+                sample_size = node.sample_size if node.sample_size is not None and node.sample_size > 1 else None
+                if node.has_observation:
+                    sample_code.append("{} = {}".format(name, node.observation))
+                    if node.is_observed and code_for_observed is not None:
+                        sample_code.append(code_for_observed(name, node, is_batched, list(assigned)))
+                        # The observation might resample the particles, so the next distribution cannot be reused
+                        distribution = None
+                    continue
+                elif is_batched and sample_size is not None:
+                    sample_code.append("{} = dst_.sample(({},)).movedim(0, 1)".format(name, sample_size))
+                elif is_batched:
+                    sample_code.append("{} = dst_.sample()".format(name))
+                elif sample_size is not None:
+                    sample_code.append("{} = dst_.sample((n, {}))".format(name, sample_size))
+                else:
+                    sample_code.append("{} = dst_.sample((n,))".format(name))
+                assigned.append(node.name)
+            else:
+                if is_batched:
+                    batched.add(node.name)
+                    assigned.append(node.name)
+                sample_code.append("{} = {}".format(name, code))
+        return sample_code
+
+    def gen_prior_samples_batch(self):
+        state = self.state_object
+        names = [node.name for node in self.nodes if isinstance(node, Vertex) and node.is_sampled]
+        fallback = "return _batch.stack_states([self.gen_prior_samples() for _ in range(n)], {})".format(repr(names))
+        if state is None:
+            return 'n', "from {} import ppl_batch_ops as _batch\n".format(__package__) + fallback
+
+        sample_code = self._gen_sample_batch_code()
+        code = "from {} import ppl_batch_ops as _batch\n" \
+               "names = {}\n" \
+               "try:\n" \
+               "\t{}\n" \
+               "\tif _batch.has_batch_shapes(self, {}, names, n):\n" \
+               "\t\treturn {}\n" \
+               "except (ValueError, RuntimeError, TypeError, IndexError):\n" \
+               "\tpass\n" \
+               "_batch.discard_resampling(resample)\n" \
+               "{}".format(__package__, repr(names), '\n'.join(sample_code).replace('\n', '\n\t'), state, state, fallback)
+        return 'n', code
+
+    def gen_smc_batch(self):
+        state = self.state_object
+        names = [node.name for node in self.nodes if isinstance(node, Vertex) and node.is_sampled]
+        fallback = "return _batch.weighted_samples_by_rows(self, n, {})".format(repr(names))
+        if state is None:
+            return 'n, resample=None', "from {} import ppl_batch_ops as _batch\n".format(__package__) + fallback
+
+        def code_for_observed(name: str, node: Vertex, is_batched: bool, assigned: list):
+            term = "_batch.sum_event(dst_.log_prob({}), {})".format(name, 'n' if is_batched else 'None')
+            if node.has_conditions:
+                mask = ["{}['{}']".format(state, c.name) if t else "_batch.logical_not({}['{}'])".format(state, c.name)
+                        for c, t in sorted(node.conditions, key=lambda x: x[0].name)]
+                mask = mask[0] if len(mask) == 1 else "_batch.logical_and({})".format(', '.join(mask))
+                term = "_batch.where({}, {}, 0.0)".format(mask, term)
+            return "log_weight = log_weight + {}\n" \
+                   "if resample is not None:\n" \
+                   "\t{}, log_weight = resample({}, _batch.expand(log_weight, n), {})".format(
+                term, state, state, repr(assigned))
+
+        sample_code = ["log_weight = 0"] + self._gen_sample_batch_code(code_for_observed)
+        code = "from {} import ppl_batch_ops as _batch\n" \
+               "names = {}\n" \
+               "try:\n" \
+               "\t{}\n" \
+               "\tif _batch.has_batch_shapes(self, {}, names, n):\n" \
+               "\t\treturn {}, _batch.expand(log_weight, n)\n" \
+               "except (ValueError, RuntimeError, TypeError, IndexError):\n" \
+               "\tpass\n" \
+               "_batch.discard_resampling(resample)\n" \
+               "{}".format(__package__, repr(names), '\n'.join(sample_code).replace('\n', '\n\t'), state, state, fallback)
+        return 'n, resample=None', code
+
+    def gen_log_prob_batch(self):
+        state = self.state_object
+        names = [node.name for node in self.nodes if isinstance(node, Vertex) and node.is_sampled]
+        if state is None:
+            return 'state', "raise RuntimeError('batched log-probabilities require a state-object')"
+
+        replace_nodes = { group[0]: group for group in self.iid_groups }
+        skip_nodes = set([v for group in self.iid_groups for v in group[1:]])
+        batched = set(names)
+
+        def is_batched(code):
+            return code is not None and len(ppl_batch_ops.find_state_references(code, state) & batched) > 0
+
+        # The conditions and data are written into a copy of the state, leaving the caller's state unchanged
+        logpdf_code = ["{0} = dict({0})".format(state),
+                       "n = _batch.get_batch_size({}, names)".format(state), "log_prob = 0"]
+        distribution = None
+        for node in self.nodes:
+            name = "{}['{}']".format(state, node.name)
+            if node in skip_nodes:
+                continue
+            if isinstance(node, Vertex):
+                if node.has_conditions:
+                    mask = ["{}['{}']".format(state, c.name) if t else "_batch.logical_not({}['{}'])".format(state, c.name)
+                            for c, t in sorted(node.conditions, key=lambda x: x[0].name)]
+                    mask = mask[0] if len(mask) == 1 else "_batch.logical_and({})".format(', '.join(mask))
+                    mask_batched = any([c.name in batched for c, _ in node.conditions])
+                else:
+                    mask = None
+                    mask_batched = False
+                if node in replace_nodes:
+                    term = ppl_sufficient_stats.get_log_prob_code(replace_nodes[node], '_suff_stats')
+                    term_batched = is_batched(term)
+                    if term_batched:
+                        term = ppl_batch_ops.vectorize_code(term)
+                else:
+                    code = node.get_code()
+                    term_batched = is_batched(code)
+                    if term_batched:
+                        # Rows where the conditions do not hold get safe parameters (see `ppl_batch_ops`)
+                        code = ppl_batch_ops.vectorize_code(code, is_distribution=True, mask=mask)
+                    code = "dst_ = {}".format(code)
+                    if code != distribution:
+                        logpdf_code.append(code)
+                        distribution = code
+                    value = node.observation if node.is_observed else name
+                    if node.is_observed:
+                        term_batched = term_batched or is_batched(node.observation)
+                    else:
+                        term_batched = True
+                    if mask_batched:
+                        value = "_batch.mask_value({}, {}, dst_)".format(mask, value)
+                        term_batched = True
+                    term = "dst_.log_prob({})".format(value)
+                term = "_batch.sum_event({}, {})".format(term, 'n' if term_batched else 'None')
+                if mask is not None:
+                    term = "_batch.where({}, {}, 0.0)".format(mask, term)
+                logpdf_code.append("log_prob = log_prob + {}".format(term))
+
+            elif isinstance(node, ConditionNode):
+                code = node.get_code()
+                if is_batched(code):
+                    code = ppl_batch_ops.vectorize_code(code)
+                    batched.add(node.name)
+                logpdf_code.append("{} = {}".format(name, code))
+
+            elif isinstance(node, DataNode) and node.is_binary:
+                logpdf_code.append("{} = {}".format(name, node.get_code()))
+
+        logpdf_code.append("return _batch.expand(log_prob, n)")
+        code = "from {} import ppl_batch_ops as _batch\n" \
+               "names = {}\n" \
+               "try:\n" \
+               "\t{}\n" \
+               "except (ValueError, RuntimeError, TypeError, IndexError):\n" \
+               "\treturn _batch.log_prob_by_rows(self, {}, names)".format(
+            __package__, repr(names), '\n'.join(logpdf_code).replace('\n', '\n\t'), state)
+        return 'state', code
+
     def gen_cond_bit_vector(self):
         code = "result = 0\n" \
                "for cond in self.conditionals:\n" \
@@ -319,3 +546,224 @@ class GraphCodeGenerator(object):
                "return result"
         return 'state', code
 
+    def get_block_schedule(self):
+        code = "if getattr(self, '_block_schedule', None) is None:\n" \
+               "\tfrom {} import ppl_graph_analysis\n" \
+               "\tself._block_schedule = ppl_graph_analysis.compute_block_schedule(self.vertices)\n" \
+               "\tself._markov_blankets = ppl_graph_analysis.compute_markov_blankets(self.vertices)\n" \
+               "return self._block_schedule".format(_root_package)
+        return code
+
+    def gen_log_prob_factors(self):
+        state = self.state_object
+        code = ["factors = {}"]
+        for node in self.nodes:
+            name = node.name
+            if state is not None:
+                name = "{}['{}']".format(state, name)
+            if isinstance(node, Vertex):
+                code.append("if names is None or '{}' in names:".format(node.name))
+                code.append("\tdst_ = {}".format(node.get_code()))
+                value = node.observation if node.is_observed else name
+                cond_code = node.get_cond_code(state_object=state)
+                if cond_code is not None:
+                    code.append("\t" + cond_code + "\tfactors['{}'] = dst_.log_prob({})".format(node.name, value))
+                else:
+                    code.append("\tfactors['{}'] = dst_.log_prob({})".format(node.name, value))
+            elif not isinstance(node, DataNode) or node.is_binary:
+                code.append("{} = {}".format(name, node.get_code()))
+        code.append("return factors")
+        return 'state, names=None', '\n'.join(code)
+
+    def bind_data(self):
+        code = "if data is not None:\n" \
+               "\tkwargs.update(data)\n" \
+               "nodes = { d.original_name: d for d in self.data if d.is_placeholder }\n" \
+               "for key in kwargs:\n" \
+               "\tif key not in nodes:\n" \
+               "\t\traise RuntimeError(\"unknown data: '{}'\".format(key))\n" \
+               "\tself.data_values[nodes[key].name] = nodes[key].bind_value(kwargs[key])\n" \
+               "return self"
+        return 'data=None, **kwargs', code
+
+    def _gen_block_code(self, block: list, blankets: dict, nodes: dict):
+        """
+        Returns the code to evaluate the factors in the Markov blankets of the block, where the factors with the same
+        template (see `ppl_batch_ops.get_template`) are evaluated together as one batched expression, and added to
+        the `totals` of the respective vertices. Returns `None` if there is nothing to batch.
+        """
+        state = self.state_object
+        groups = {}
+        for i, v in enumerate(block):
+            for f in blankets[v]:
+                node = nodes[f]
+                value = node.observation if node.is_observed else "{}['{}']".format(state, node.name)
+                codes = [node.get_code(), value]
+                if node.has_conditions:
+                    mask = ["{}['{}']".format(state, c.name) if t else "not {}['{}']".format(state, c.name)
+                            for c, t in sorted(node.conditions, key=lambda x: x[0].name)]
+                    codes.append(' and '.join(mask))
+                template = ppl_batch_ops.get_template(codes, state)
+                if template is None:
+                    return None
+                key, slots = template
+                groups.setdefault(key, []).append((i, node, slots))
+
+        code = []
+        is_batched = False
+        for key, members in groups.items():
+            batched = [k for k in range(len(members[0][2])) if len(set([m[2][k] for m in members])) > 1]
+            if len(batched) == 0:
+                i, node, _ = members[0]
+                value = node.observation if node.is_observed else "{}['{}']".format(state, node.name)
+                code.append("dst_ = {}".format(node.get_code()))
+                add = "totals = _batch.add_rows(totals, {}, dst_.log_prob({}), None)".format(
+                    repr([m[0] for m in members]), value)
+                cond_code = node.get_cond_code(state_object=state)
+                code.append(cond_code + add if cond_code is not None else add)
+                continue
+            is_batched = True
+            slots = {}
+            code.append("m = {}".format(len(members)))
+            for k, slot in enumerate(members[0][2]):
+                if k in batched:
+                    slots['_slot{}'.format(k)] = "_b['s{}']".format(k)
+                    code.append("_b['s{}'] = _batch.stack_rows([{}])".format(k, ', '.join([m[2][k] for m in members])))
+                else:
+                    slots['_slot{}'.format(k)] = slot
+            codes = [ppl_batch_ops.fill_template(t, slots) for t in key]
+            mask = ppl_batch_ops.vectorize_code(codes[2], size_name='m') if len(codes) > 2 else None
+            code.append("dst_ = {}".format(ppl_batch_ops.vectorize_code(codes[0], size_name='m', is_distribution=True,
+                                                                         mask=mask)))
+            value = ppl_batch_ops.vectorize_code(codes[1], size_name='m')
+            if mask is not None:
+                value = "_batch.mask_value({}, {}, dst_)".format(mask, value)
+            term = "_batch.sum_event(dst_.log_prob({}), m)".format(value)
+            if mask is not None:
+                term = "_batch.where({}, {}, 0.0)".format(mask, term)
+            code.append("totals = _batch.add_rows(totals, {}, {}, m)".format(repr([m[0] for m in members]), term))
+        return code if is_batched else None
+
+    def gen_cond_log_prob(self):
+        """
+        For each block of the schedule, the factors that are copies of each other (typically from a loop) are
+        evaluated together as a single batched expression (see `_gen_block_code`). If this fails for a given state,
+        or if the block is not part of the schedule, the factors are evaluated one by one.
+        """
+        state = self.state_object
+        code = ["from {} import ppl_batch_ops as _batch".format(__package__),
+                "if type(block) is int:",
+                "	block = self.get_block_schedule()[block]",
+                "block = list(block)"]
+        if state is not None:
+            vertices = [node for node in self.nodes if isinstance(node, Vertex)]
+            blankets = ppl_graph_analysis.compute_markov_blankets(vertices)
+            nodes = { v.name: v for v in vertices }
+            blocks = []
+            for block in ppl_graph_analysis.compute_block_schedule(vertices):
+                block_code = self._gen_block_code(block, blankets, nodes)
+                if block_code is not None:
+                    blocks.append((block, block_code))
+            if len(blocks) > 0:
+                # The conditions and data are written into a copy of the state, leaving the caller's state unchanged
+                code += ["if block in {}:".format(repr([block for block, _ in blocks])),
+                         "	try:",
+                         "		{0} = dict({0})".format(state)]
+                for node in self.nodes:
+                    if not isinstance(node, Vertex) and (not isinstance(node, DataNode) or node.is_binary):
+                        code.append("		{}['{}'] = {}".format(state, node.name, node.get_code()))
+                code += ["		totals = _batch.zeros(len(block))",
+                         "		_b = {}"]
+                for i, (block, block_code) in enumerate(blocks):
+                    code.append("		{} block == {}:".format('if' if i == 0 else 'elif', repr(block)))
+                    code += ["			" + line.replace('\n', '\n\t\t\t') for line in block_code]
+                code += ["		return dict(zip(block, totals))",
+                         "	except (ValueError, RuntimeError, TypeError, IndexError):",
+                         "		pass"]
+        code += ["blankets = self._markov_blankets",
+                 "factors = self.gen_log_prob_factors(state, set([f for v in block for f in blankets[v]]))",
+                 "return { v: sum([_batch.sum_event(factors[f], None) for f in blankets[v] if f in factors]) "
+                 "for v in block }"]
+        return 'state, block', '\n'.join(code)
+
+    def gen_obs_vars(self):
+        names = [node.name for node in self.nodes if isinstance(node, Vertex) and node.is_observed]
+        return "return {}".format(repr(names))
+
+    def _get_observe_groups(self) -> list:
+        return ppl_graph_analysis.compute_observe_groups([node for node in self.nodes if isinstance(node, Vertex)])
+
+    def get_observe_groups(self):
+        groups = tuple([tuple(group) for group in self._get_observe_groups()])
+        code = "if getattr(self, '_observe_groups', None) is None:\n" \
+               "\tself._observe_groups = [list(group) for group in {}]\n" \
+               "return self._observe_groups".format(repr(groups))
+        return code
+
+    def get_observe_terms(self):
+        state = self.state_object
+        terms = []
+        for node in self.nodes:
+            if isinstance(node, Vertex) and node.is_observed:
+                term = "{}.log_prob({})".format(node.get_code(), node.observation)
+                if node.has_conditions:
+                    conds = []
+                    for cond, truth_value in node.conditions:
+                        name = "{}['{}']".format(state, cond.name) if state is not None else cond.name
+                        conds.append(name if truth_value else 'not ' + name)
+                    term = "({} if {} else 0)".format(term, ' and '.join(conds))
+                terms.append("\tlambda {}: {},".format(state if state is not None else 'state', term))
+        code = "if getattr(self, '_observe_terms', None) is None:\n" \
+               "\tself._observe_terms = [\n" \
+               "{}\n" \
+               "\t]\n" \
+               "return self._observe_terms".format('\n'.join(['\t' + t for t in terms]))
+        return code
+
+    def gen_log_prob_minibatch(self):
+        def code_for_vertex(name: str, node: Vertex):
+            cond_code = node.get_cond_code(state_object=self.state_object)
+            if cond_code is not None:
+                return cond_code + "\tlog_prob = log_prob + dst_.log_prob({})".format(name)
+            else:
+                return "log_prob = log_prob + dst_.log_prob({})".format(name)
+
+        observed = set([node for node in self.nodes if isinstance(node, Vertex) and node.is_observed])
+        code = ["log_prob = 0"]
+        self._gen_code(code, code_for_vertex=code_for_vertex, want_data_node=False, skip_nodes=observed)
+        state = self.state_object if self.state_object is not None else 'state'
+        # The tuples of numbers are constants of the compiled method, and thus not rebuilt on each call
+        groups = self._get_observe_groups()
+        group_index = [0] * len(observed)
+        for g, group in enumerate(groups):
+            for i in group:
+                group_index[i] = g
+        code.append("group_index = {}\n"
+                    "group_sizes = {}".format(repr(tuple(group_index)), repr(tuple([len(group) for group in groups]))))
+        code.append("terms = self.get_observe_terms()\n"
+                    "counts = [0] * len(group_sizes)\n"
+                    "for i in batch_indices:\n"
+                    "\tcounts[group_index[i]] += 1\n"
+                    "for g in range(len(group_sizes)):\n"
+                    "\tif counts[g] == 0:\n"
+                    "\t\traise RuntimeError(\"the batch contains no observation of group {} "
+                    "(see get_observe_groups)\".format(g))\n"
+                    "for i in batch_indices:\n"
+                    "\tg = group_index[i]\n"
+                    "\tlog_prob = log_prob + terms[i](%s) * (group_sizes[g] / counts[g])" % state)
+        code.append("return log_prob")
+        return 'state, batch_indices', '\n'.join(code)
+
+    def sample_minibatch(self):
+        code = "from {} import ppl_graph_analysis\n" \
+               "return ppl_graph_analysis.sample_minibatch(self.get_observe_groups(), size, rng)".format(_root_package)
+        return 'rng, size', code
+
+    def slice(self):
+        code = "from {} import ppl_graph_analysis\n" \
+               "return ppl_graph_analysis.slice_model(self, names)".format(_root_package)
+        return 'names', code
+
+
+_root_package = __name__.split('.')[0]
+
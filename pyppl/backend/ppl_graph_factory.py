@@ -11,26 +11,51 @@ from ..graphs import *
 from .ppl_code_generator import CodeGenerator
 from .ppl_graph_codegen import GraphCodeGenerator
 from .. import distributions
+import hashlib
+import os.path
 import warnings
+try:
+    import numpy as _np
+except ModuleNotFoundError:
+    _np = None
 
 
-class _ConditionCollector(Visitor):
+# The dtypes of the torch-functions creating a tensor from a literal list (`None` means: as inferred by NumPy, but
+# with floats in single precision as done by `torch.tensor`).
+_tensor_dtypes = {
+    'tensor':       None,
+    'Tensor':       'float32',
+    'FloatTensor':  'float32',
+    'DoubleTensor': 'float64',
+    'HalfTensor':   'float16',
+    'LongTensor':   'int64',
+    'IntTensor':    'int32',
+    'ShortTensor':  'int16',
+    'ByteTensor':   'uint8',
+}
+
+
+class _NodeCollector(Visitor):
 
     __visit_children_first__ = True
+    __visit_iteratively__ = True
 
     def __init__(self):
         super().__init__()
         self.cond_nodes = set()
+        self.data_nodes = set()
 
     def visit_symbol(self, node: AstSymbol):
         if isinstance(node.node, ConditionNode):
             self.cond_nodes.add(node.node)
+        elif isinstance(node.node, DataNode):
+            self.data_nodes.add(node.node)
         return self.visit_node(node)
 
 
 class GraphFactory(object):
 
-    def __init__(self, code_generator=None):
+    def __init__(self, code_generator=None, *, data_dir: Optional[str]=None, spill_threshold: int=65536):
         if code_generator is None:
             code_generator = CodeGenerator()
             code_generator.state_object = 'state'
@@ -39,10 +64,47 @@ class GraphFactory(object):
         self.code_generator = code_generator
         self.cond_nodes_map = {}
         self.data_nodes_cache = {}
+        self.data_dir = data_dir
+        self.spill_threshold = spill_threshold
 
     def _generate_code_for_node(self, node: AstNode):
         return self.code_generator.visit(node)
 
+    def _create_data_array(self, data: AstNode, as_tensor: bool=False):
+        if _np is None:
+            return None
+        dtype = None
+        if isinstance(data, AstCall) and data.arg_count == 1 and isinstance(data.args[0], AstValueVector):
+            name = data.function_name
+            if name.startswith('torch.') and name[6:] in _tensor_dtypes:
+                dtype = _tensor_dtypes[name[6:]]
+            else:
+                return None
+            values = data.args[0].items
+        elif isinstance(data, AstValueVector):
+            name = None
+            values = data.items
+        else:
+            return None
+        try:
+            result = _np.array(values, dtype=dtype)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        if result.dtype.kind not in 'biuf':
+            return None
+        if (name == 'torch.tensor' or as_tensor) and result.dtype.kind == 'f':
+            result = result.astype('float32')
+        return result
+
+    def _spill_data_array(self, array, digest: str):
+        if self.data_dir is not None and array.nbytes >= self.spill_threshold:
+            filename = os.path.join(self.data_dir, 'data_{}.npy'.format(digest[:20]))
+            if not os.path.exists(filename):
+                os.makedirs(self.data_dir, exist_ok=True)
+                _np.save(filename, array)
+            return filename
+        return None
+
     def generate_symbol(self, prefix: str):
         self._counter += 1
         return prefix + str(self._counter)
@@ -56,31 +118,66 @@ class GraphFactory(object):
         code = self._generate_code_for_node(test)
         if code in self.cond_nodes_map:
             return self.cond_nodes_map[code]
+        nc = _NodeCollector()
+        nc.visit(test)
+        data_nodes = nc.data_nodes if len(nc.data_nodes) > 0 else None
         if isinstance(test, AstCompare) and is_zero(test.right) and test.second_right is None:
-            result = ConditionNode(name, ancestors=parents, condition=code,
+            result = ConditionNode(name, ancestors=parents, condition=code, data_nodes=data_nodes,
                                    function=self._generate_code_for_node(test.left), op=test.op)
         elif isinstance(test, AstCall) and test.function_name.startswith('torch.') and is_number(test.right):
-            result = ConditionNode(name, ancestors=parents, condition=code,
+            result = ConditionNode(name, ancestors=parents, condition=code, data_nodes=data_nodes,
                                    function=self._generate_code_for_node(test.left), op=test.function_name,
                                    compare_value=test.right.value)
         else:
-            result = ConditionNode(name, ancestors=parents, condition=code)
+            result = ConditionNode(name, ancestors=parents, condition=code, data_nodes=data_nodes)
         self.nodes.append(result)
         self.cond_nodes_map[code] = result
         return result
 
-    def create_data_node(self, data: AstNode, parents: Optional[set]=None):
+    def create_data_node(self, data: AstNode, parents: Optional[set]=None, *, as_tensor: bool=False):
         if parents is None:
             parents = set()
-        code = self._generate_code_for_node(data)
+        array = self._create_data_array(data, as_tensor)
+        if array is not None:
+            array = _np.ascontiguousarray(array)
+            # Plain vectors become lists, unless they are only ever used as a whole tensor (`as_tensor`), in which case
+            # they are treated like a literal `torch.tensor([...])`
+            as_list = isinstance(data, AstValueVector) and not as_tensor
+            digest = hashlib.sha1(array.data).hexdigest()
+            code = (as_list, array.dtype.str, array.shape, digest)
+        else:
+            code = self._generate_code_for_node(data)
         if code in self.data_nodes_cache:
             return self.data_nodes_cache[code]
         name = self.generate_symbol('data_')
-        result = DataNode(name, ancestors=parents, data=code)
+        if array is not None:
+            filename = self._spill_data_array(array, digest)
+            if filename is not None:
+                result = DataNode(name, ancestors=parents, filename=filename, as_list=as_list)
+            else:
+                result = DataNode(name, ancestors=parents, array=array, as_list=as_list)
+        else:
+            result = DataNode(name, ancestors=parents, data=code)
         self.nodes.append(result)
         self.data_nodes_cache[code] = result
         return result
 
+    def create_placeholder_node(self, original_name: str, value):
+        if type(value) is int:
+            value = (value,)
+        if type(value) is tuple and all([type(item) is int for item in value]):
+            array = None
+            shape = value
+        elif _np is not None:
+            array = _np.asarray(value)
+            shape = array.shape
+        else:
+            raise RuntimeError("cannot create placeholder for data '{}' without numpy".format(original_name))
+        name = self.generate_symbol('data_')
+        result = DataNode(name, array=array, placeholder=True, shape=shape, original_name=original_name)
+        self.nodes.append(result)
+        return result
+
     def create_observe_node(self, dist: AstNode, value: AstNode, parents: set, conditions: set):
         arg_names = None
         if isinstance(dist, AstCall):
@@ -100,14 +197,17 @@ class GraphFactory(object):
         d_code = self._generate_code_for_node(dist)
         v_code = self._generate_code_for_node(value)
         obs_value = value.value if is_value(value) else None
-        cc = _ConditionCollector()
-        cc.visit(dist)
+        nc = _NodeCollector()
+        nc.visit(dist)
+        cond_nodes = set(nc.cond_nodes)
+        nc.visit(value)
         result = Vertex(name, ancestors=parents, distribution_code=d_code, distribution_name=_get_dist_name(dist),
                         distribution_args=args, distribution_func=func,
                         distribution_transform=trans, distribution_arg_names=arg_names,
                         observation=v_code,
                         observation_value=obs_value, conditions=conditions,
-                        condition_nodes=cc.cond_nodes if len(cc.cond_nodes) > 0 else None)
+                        condition_nodes=cond_nodes if len(cond_nodes) > 0 else None,
+                        data_nodes=nc.data_nodes if len(nc.data_nodes) > 0 else None)
         self.nodes.append(result)
         return result
 
@@ -128,6 +228,8 @@ class GraphFactory(object):
             trans = None
         name = self.generate_symbol('x')
         code = self._generate_code_for_node(dist)
+        nc = _NodeCollector()
+        nc.visit(dist)
 
          # stop the use of factor in sample statements
         _is_factor = _get_dist_name(dist)
@@ -142,6 +244,7 @@ class GraphFactory(object):
         result = Vertex(name, ancestors=parents, distribution_code=code, distribution_name=_get_dist_name(dist),
                         distribution_args=args, distribution_func=func, distribution_transform=trans,
                         distribution_arg_names=arg_names,
+                        data_nodes=nc.data_nodes if len(nc.data_nodes) > 0 else None,
                         sample_size=size, original_name=original_name)
         self.nodes.append(result)
         return result
@@ -9,6 +9,8 @@
 from ..ppl_ast import *
 from ..graphs import *
 from .ppl_graph_factory import GraphFactory
+from .ppl_graph_codegen import GraphCodeGenerator
+from .. import ppl_model_io
 
 
 class ConditionScope(object):
@@ -48,6 +50,16 @@ class GraphGenerator(ScopedVisitor):
         self.conditions = None  # type: ConditionScope
         self.imports = set()
 
+    def define_data(self, name: str, value):
+        """
+        Defines the name as a placeholder for data, bound at runtime. The value is either the initial data, or the
+        shape of the data as a tuple of integers.
+        """
+        node = self.factory.create_placeholder_node(name, value)
+        self.nodes.append(node)
+        self.global_scope.define(name, (AstSymbol(node.name, node=node), set()))
+        return node
+
     def enter_condition(self, condition):
         self.conditions = ConditionScope(self.conditions, condition)
 
@@ -78,10 +90,12 @@ class GraphGenerator(ScopedVisitor):
             parents = set.union(parents, parent)
         return result, parents
 
-    def _visit_items(self, items):
+    def _visit_items(self, items, visit=None):
+        if visit is None:
+            visit = self.visit
         result = []
         parents = set()
-        for _item in (self.visit(item) for item in items):
+        for _item in (visit(item) for item in items):
             if _item is not None:
                 item, parent = _item
                 result.append(item)
@@ -93,6 +107,22 @@ class GraphGenerator(ScopedVisitor):
     def visit_node(self, node: AstNode):
         raise RuntimeError("cannot compile '{}'".format(node))
 
+    def _visit_distribution(self, node: AstNode):
+        # Plain vectors passed as a whole to a distribution are only used as tensors, and are therefore stored as such
+        if isinstance(node, AstCall) and not node.function_name.startswith('torch.'):
+            function, f_parents = self.visit(node.function)
+            args, a_parents = self._visit_items(node.args, self._visit_tensor)
+            return AstCall(function, args, node.keywords), set.union(f_parents, a_parents)
+        return self.visit(node)
+
+    def _visit_tensor(self, node: AstNode):
+        if isinstance(node, AstValueVector) and len(node) > 3:
+            data_node = self.factory.create_data_node(node, as_tensor=True)
+            if data_node is not None:
+                self.nodes.append(data_node)
+                return AstSymbol(data_node.name, node=data_node), set()
+        return self.visit(node)
+
     def visit_attribute(self, node:AstAttribute):
         base, parents = self.visit(node.base)
         if base is node.base:
@@ -204,16 +234,20 @@ class GraphGenerator(ScopedVisitor):
         result = node.clone(indices=items)
         return result, parents
 
+    def visit_nary(self, node: AstNary):
+        items, parents = self._visit_items(node.items)
+        return AstNary(node.op, items), parents
+
     def visit_observe(self, node: AstObserve):
-        dist, d_parents = self.visit(node.dist)
-        value, v_parents = self.visit(node.value)
+        dist, d_parents = self._visit_distribution(node.dist)
+        value, v_parents = self._visit_tensor(node.value)
         parents = set.union(d_parents, v_parents)
         node = self.factory.create_observe_node(dist, value, parents, self.get_current_conditions())
         self.nodes.append(node)
         return AstSymbol(node.name, node=node), set()
 
     def visit_sample(self, node: AstSample):
-        dist, d_parents = self.visit(node.dist)
+        dist, d_parents = self._visit_distribution(node.dist)
         if node.size is not None:
             size, s_parents = self.visit(node.size)
             parents = set.union(d_parents, s_parents)
@@ -281,39 +315,65 @@ class GraphGenerator(ScopedVisitor):
         result = makeVector(items)
         return result, parents
 
+    def _get_imports(self, imports: Optional[str]=None) -> str:
+        result = ['import {}'.format(item) for item in self.imports]
+        if imports is not None:
+            result.append(imports)
+        return '\n'.join(result)
+
     def generate_code(self, imports: Optional[str]=None, *,
                       base_class: Optional[str]=None,
                       class_name: Optional[str]=None):
-        if len(self.imports) > 0:
-            _imports = '\n'.join(['import {}'.format(item) for item in self.imports])
-            if imports is not None:
-                _imports += '\n' + imports
-        elif imports is not None:
-            _imports = imports
-        else:
-            _imports = ''
+        _imports = self._get_imports(imports)
         return self.factory.generate_code(class_name=class_name, imports=_imports,
                                           base_class=base_class)
 
-    def generate_model(self, imports: Optional[str]=None, base_class: Optional[str]=None, class_name: str='Model'):
-        vertices = set()
-        arcs = set()
-        data = set()
-        conditionals = set()
-        for node in self.nodes:
-            if isinstance(node, Vertex):
-                vertices.add(node)
-                for a in node.ancestors:
-                    arcs.add((a, node))
-            elif isinstance(node, DataNode):
-                data.add(node)
-            elif isinstance(node, ConditionNode):
-                conditionals.add(node)
-
-        code = self.generate_code(imports=imports, base_class=base_class, class_name=class_name)
-        c_globals = {}
-        exec(code, c_globals)
-        Model = c_globals[class_name]
-        result = Model(vertices, arcs, data, conditionals)
-        result.code = code
-        return result
+    def generate_model(self, imports: Optional[str]=None, base_class: Optional[str]=None, class_name: str='Model',
+                       query: Optional[list]=None, collapse_iid: bool=False):
+        nodes = self.factory.nodes
+        if query is not None:
+            from ..ppl_graph_analysis import compute_slice
+            nodes = compute_slice(nodes, query)
+        _imports = self._get_imports(imports)
+        return create_model(nodes, imports=_imports, base_class=base_class, class_name=class_name,
+                            state_object=self.factory.code_generator.state_object, collapse_iid=collapse_iid)
+
+
+def create_model(nodes: list, *, imports: str='', base_class: Optional[str]=None, class_name: str='Model',
+                 state_object: Optional[str]='state', collapse_iid: bool=False):
+    """
+    Generates the code for the model-class from the given list of nodes (see `GraphCodeGenerator`), and returns an
+    instance of this class. The nodes must be given in compute order.
+    """
+    code_gen = GraphCodeGenerator(nodes, state_object, imports=imports, collapse_iid=collapse_iid)
+    code = code_gen.generate_model_code(class_name=class_name, base_class=base_class)
+    model_class = ppl_model_io.get_model_class(code, class_name)
+    code_options = { 'imports': imports, 'base_class': base_class, 'class_name': class_name,
+                     'state_object': state_object, 'collapse_iid': collapse_iid }
+    return instantiate_model(model_class, nodes, code, code_options)
+
+
+def instantiate_model(model_class, nodes: list, code: str, code_options: dict):
+    """
+    Creates an instance of the (generated) model-class for the given list of nodes, which must match the nodes the
+    code was generated from. The list is kept as `nodes`, which gives the compute order of the model.
+    """
+    vertices = set()
+    arcs = set()
+    data = set()
+    conditionals = set()
+    for node in nodes:
+        if isinstance(node, Vertex):
+            vertices.add(node)
+            for a in node.ancestors:
+                arcs.add((a, node))
+        elif isinstance(node, DataNode):
+            data.add(node)
+        elif isinstance(node, ConditionNode):
+            conditionals.add(node)
+
+    result = model_class(vertices, arcs, data, conditionals)
+    result.nodes = list(nodes)
+    result.code = code
+    result.code_options = code_options
+    return result
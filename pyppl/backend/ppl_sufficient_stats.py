@@ -0,0 +1,152 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+import math
+from ..graphs import *
+try:
+    import torch as _torch
+except ModuleNotFoundError:
+    _torch = None
+
+
+#
+# Observations of independent and identically distributed values are collapsed into a single term, based on the
+# sufficient statistics of the observed values. The statistics are computed at compile time, whereas the functions
+# `<distribution>_log_prob` below are called from the generated code to compute the log-probability of all
+# observations in one go.
+#
+
+def _mean_and_m2(values):
+    # Instead of the sum of the squares, we keep the sum of the squared deviations from the mean, which is
+    # numerically much more stable.
+    mean = math.fsum(values) / len(values)
+    return mean, math.fsum([(x - mean) ** 2 for x in values])
+
+def _normal_stats(values):
+    return _mean_and_m2(values)
+
+def _poisson_stats(values):
+    if all([x >= 0 and float(x).is_integer() for x in values]):
+        return math.fsum(values), math.fsum([math.lgamma(x + 1) for x in values])
+    return None
+
+def _bernoulli_stats(values):
+    if all([x in (0, 1) for x in values]):
+        return (math.fsum(values),)
+    return None
+
+def _exponential_stats(values):
+    if all([x >= 0 for x in values]):
+        return (math.fsum(values),)
+    return None
+
+def _gamma_stats(values):
+    if all([x > 0 for x in values]):
+        return math.fsum(values), math.fsum([math.log(x) for x in values])
+    return None
+
+def _beta_stats(values):
+    if all([0 < x < 1 for x in values]):
+        return math.fsum([math.log(x) for x in values]), math.fsum([math.log1p(-x) for x in values])
+    return None
+
+def _log_normal_stats(values):
+    if all([x > 0 for x in values]):
+        logs = [math.log(x) for x in values]
+        return (math.fsum(logs),) + _mean_and_m2(logs)
+    return None
+
+
+# For each supported distribution: the names of the parameters, the function to compute the statistics, and the
+# name of the function to compute the log-probability.
+_distributions = {
+    'Bernoulli':   (['probs'],          _bernoulli_stats,   'bernoulli_log_prob'),
+    'Beta':        (['alpha', 'beta'],  _beta_stats,        'beta_log_prob'),
+    'Exponential': (['rate'],           _exponential_stats, 'exponential_log_prob'),
+    'Gamma':       (['alpha', 'beta'],  _gamma_stats,       'gamma_log_prob'),
+    'LogNormal':   (['mu', 'sigma'],    _log_normal_stats,  'log_normal_log_prob'),
+    'Normal':      (['loc', 'scale'],   _normal_stats,      'normal_log_prob'),
+    'Poisson':     (['rate'],           _poisson_stats,     'poisson_log_prob'),
+}
+
+
+def _is_collapsible(vertex: Vertex):
+    if vertex.is_observed and vertex.distribution_name in _distributions and vertex.sample_size == 1:
+        value = vertex.observation_value
+        if type(value) in (bool, int, float) and vertex.distribution_arguments is not None:
+            params = _distributions[vertex.distribution_name][0]
+            return sorted(vertex.distribution_arguments.keys()) == sorted(params)
+    return False
+
+
+def find_iid_groups(nodes: list) -> list:
+    """
+    Finds all groups of (at least two) observed vertices with the same distribution code and conditions, and with
+    constant observed values, for which we can compute sufficient statistics. The result is a list of lists of
+    vertices, each in compute order.
+    """
+    groups = {}
+    for node in nodes:
+        if isinstance(node, Vertex) and _is_collapsible(node):
+            key = (node.get_code(), frozenset(node.conditions) if node.conditions is not None else frozenset())
+            if key in groups:
+                groups[key].append(node)
+            else:
+                groups[key] = [node]
+    result = []
+    for group in groups.values():
+        if len(group) > 1:
+            stats = _distributions[group[0].distribution_name][1]([v.observation_value for v in group])
+            if stats is not None:
+                result.append(group)
+    return result
+
+
+def get_log_prob_code(group: list, module_name: str) -> str:
+    """
+    Returns the code to compute the log-probability of all observations in the group at once.
+    """
+    vertex = group[0]
+    params, stats_func, func_name = _distributions[vertex.distribution_name]
+    stats = stats_func([v.observation_value for v in group])
+    args = [vertex.distribution_arguments[p] for p in params] + [repr(len(group))] + [repr(s) for s in stats]
+    return "{}.{}({})".format(module_name, func_name, ', '.join(args))
+
+
+def _as_tensor(value):
+    if isinstance(value, _torch.Tensor):
+        return value
+    return _torch.tensor(float(value))
+
+
+def bernoulli_log_prob(probs, n, s):
+    probs = _as_tensor(probs)
+    return _torch.xlogy(_torch.tensor(s), probs) + _torch.xlogy(_torch.tensor(n - s), 1 - probs)
+
+def beta_log_prob(alpha, beta, n, s_log, s_log1m):
+    alpha, beta = _as_tensor(alpha), _as_tensor(beta)
+    log_beta = _torch.lgamma(alpha) + _torch.lgamma(beta) - _torch.lgamma(alpha + beta)
+    return (alpha - 1) * s_log + (beta - 1) * s_log1m - n * log_beta
+
+def exponential_log_prob(rate, n, s):
+    rate = _as_tensor(rate)
+    return n * _torch.log(rate) - rate * s
+
+def gamma_log_prob(alpha, beta, n, s, s_log):
+    alpha, beta = _as_tensor(alpha), _as_tensor(beta)
+    return n * (alpha * _torch.log(beta) - _torch.lgamma(alpha)) + (alpha - 1) * s_log - beta * s
+
+def log_normal_log_prob(mu, sigma, n, s_log, mean, m2):
+    mu, sigma = _as_tensor(mu), _as_tensor(sigma)
+    return -s_log - n * (_torch.log(sigma) + 0.5 * math.log(2 * math.pi)) - \
+           (m2 + n * (mean - mu) ** 2) / (2 * sigma ** 2)
+
+def normal_log_prob(loc, scale, n, mean, m2):
+    loc, scale = _as_tensor(loc), _as_tensor(scale)
+    return -n * (_torch.log(scale) + 0.5 * math.log(2 * math.pi)) - (m2 + n * (mean - loc) ** 2) / (2 * scale ** 2)
+
+def poisson_log_prob(rate, n, s, s_lgamma):
+    rate = _as_tensor(rate)
+    return _torch.xlogy(_torch.tensor(s), rate) - n * rate - s_lgamma
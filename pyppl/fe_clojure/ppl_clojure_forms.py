@@ -24,6 +24,11 @@ class ClojureObject(object):
         :param visitor: An object with a `visit_XXX`-method.
         :return:        The result returned by the `visit_XXX`-method of the visitor.
         """
+        results = getattr(visitor, '_results', None)
+        if results is not None:
+            entry = results.get(id(self), None)
+            if entry is not None and entry[0] is self:
+                return entry[1]
         name = self.__class__.__name__.lower()
         method_names = ['visit_' + name + '_form', 'visit_node', 'generic_visit']
         methods = [getattr(visitor, name, None) for name in method_names]
@@ -66,6 +71,11 @@ class Form(ClojureObject):
         return "({})".format(' '.join([repr(item) for item in self.items]))
 
     def visit(self, visitor):
+        results = getattr(visitor, '_results', None)
+        if results is not None:
+            entry = results.get(id(self), None)
+            if entry is not None and entry[0] is self:
+                return entry[1]
         name = self.name
         if name is not None:
             if name in self._special_names:
@@ -217,6 +227,47 @@ class Visitor(object):
         else:
             raise TypeError("cannot walk/visit an object of type '{}'".format(type(ast)))
 
+    def visit_bottom_up(self, ast):
+        """
+        Returns the same as `visit`, but avoids deep recursion for deeply nested forms. All nodes are first visited
+        bottom-up, using an explicit stack, and the results are cached (together with the node itself, so that the
+        `id` cannot be reused by another node). When a `visit_XXX`-method then visits the children of its node, it
+        gets the cached results, instead of descending any further.
+
+        This requires that the result of visiting a node does not depend on the context of the node (which is true
+        for the parsers). The exception are forms with the wrong number of arguments, such as `(< 1)`, which are
+        only valid as part of their parent (think of `(-> x (< 1))`). If visiting a node raises a `TypeError`, we
+        therefore leave it, together with its parent, to be visited from the context of the grandparent (or the
+        final visit). Should the parent visit the node, it will then encounter the error again.
+        """
+        roots = [ast] if isinstance(ast, ClojureObject) else list(ast)
+        results = {}
+        unresolved = set()
+        stack = [(node, None, False) for node in reversed(roots)]
+        self._results = results
+        try:
+            while len(stack) > 0:
+                node, parent, children_done = stack.pop()
+                if not isinstance(node, ClojureObject):
+                    continue
+                if children_done:
+                    if id(node) in unresolved:
+                        continue
+                    try:
+                        results[id(node)] = (node, node.visit(self))
+                    except TypeError:
+                        if parent is not None:
+                            unresolved.add(id(parent))
+                else:
+                    stack.append((node, parent, True))
+                    for item in reversed(getattr(node, 'items', ())):
+                        # Leaves (symbols and values) do not need to be visited in advance
+                        if hasattr(item, 'items'):
+                            stack.append((item, node, False))
+            return self.visit(ast)
+        finally:
+            self._results = None
+
     def visit_node(self, node:ClojureObject):
         return node
 
@@ -18,7 +18,7 @@ class ClojureLexer(object):
     def __init__(self, text: str):
         self.text = text
         self.lexer = lexer.Lexer(text)
-        self.source = lexer.BufferedIterator(self.lexer)
+        self.source = lexer.BufferedIterator(self.lexer.tokens())
         self.lexer.catcodes['\n', ','] = CatCode.WHITESPACE
         self.lexer.catcodes['!', '$', '*', '+', '-', '.', '/', '<', '>', '=', '?'] = CatCode.ALPHA
         self.lexer.catcodes[';'] = CatCode.LINE_COMMENT
@@ -35,78 +35,84 @@ class ClojureLexer(object):
         return self
 
     def __next__(self):
+        # Forms are built with an explicit stack instead of recursion, so that the nesting depth is not limited by
+        # Python's recursion limit. The stack holds open brackets (as lists `[left, lineno, items]`) and prefixes
+        # such as `'` or `@` (as tuples `(value, lineno)`), which still wait for the form they apply to.
         source = self.source
-        if source.has_next:
-            token = source.next()
-            pos, token_type, value = token
+        stack = []
+        while source.has_next:
+            pos, token_type, value = source.next()
             lineno = self.lexer.get_line_from_pos(pos)
 
             if token_type == TokenType.LEFT_BRACKET:
-                left = value
-                result = []
-                while source.has_next and source.peek()[1] != TokenType.RIGHT_BRACKET:
-                    result.append(self.__next__())
-
-                if source.has_next:
-                    token = source.next()
-                    right = token[2] if token is not None else '<EOF>'
-                    if not token[1] == TokenType.RIGHT_BRACKET:
-                        raise SyntaxError("expected right parentheses or bracket instead of '{}' (line {})".format(
-                            right, self.lexer.get_line_from_pos(token[0])
-                        ))
-                    if left == '(' and right == ')':
-                        return clj.Form(result, lineno=lineno)
-
-                    elif left == '[' and right == ']':
-                        return clj.Vector(result, lineno=lineno)
-
-                    elif left == '{' and right == '}':
-                        if len(result) % 2 != 0:
-                            raise SyntaxError("map requires an even number of elements ({} given)".format(len(result)))
-                        return clj.Map(result, lineno=lineno)
-
-                    else:
-                        raise SyntaxError("mismatched parentheses: '{}' amd '{}' (line {})".format(
-                            left, right, lineno
-                        ))
+                stack.append([value, lineno, []])
+                continue
+
+            elif token_type == TokenType.RIGHT_BRACKET and len(stack) > 0 and type(stack[-1]) is list:
+                left, lineno, result = stack.pop()
+                form = self._make_compound(left, value, result, lineno)
 
             elif token_type == TokenType.NUMBER:
-                return clj.Value(value, lineno=lineno)
+                form = clj.Value(value, lineno=lineno)
 
             elif token_type == TokenType.STRING:
-                return clj.Value(eval(value), lineno=lineno)
+                form = clj.Value(eval(value), lineno=lineno)
 
             elif token_type == TokenType.VALUE:
-                return clj.Value(value, lineno=lineno)
+                form = clj.Value(value, lineno=lineno)
 
             elif token_type == TokenType.SYMBOL:
+                if value in ('#', '@', '\'', '#\''):
+                    stack.append((value, lineno))
+                    continue
+                form = clj.Symbol(value, lineno=lineno)
 
-                if value == '#':
-                    form = self.__next__()
-                    if not isinstance(form, clj.Form):
-                        raise SyntaxError("'#' requires a form to build a function (line {})".format(lineno))
+            else:
+                raise SyntaxError("invalid token: '{}' (line {})".format(token_type, lineno))
 
-                    params = clj.Vector(_ParameterExtractor().extract_parameters(form))
-                    return clj.Form(['fn', params, form])
+            # Hand the completed form to the enclosing bracket, applying all pending prefixes on the way
+            while len(stack) > 0 and type(stack[-1]) is tuple:
+                prefix, lineno = stack.pop()
+                form = self._apply_prefix(prefix, form, lineno)
+            if len(stack) == 0:
+                return form
+            stack[-1][2].append(form)
 
-                elif value == '@':
-                    form = self.__next__()
-                    return clj.Form([clj.Symbol('deref', lineno=lineno), form], lineno=lineno)
+        raise StopIteration
 
-                elif value == '\'':
-                    form = self.__next__()
-                    return clj.Form([clj.Symbol('quote', lineno=lineno), form], lineno=lineno)
+    def _make_compound(self, left, right, result, lineno):
+        if left == '(' and right == ')':
+            return clj.Form(result, lineno=lineno)
 
-                elif value == '#\'':
-                    form = self.__next__()
-                    return clj.Form([clj.Symbol('var', lineno=lineno), form], lineno=lineno)
+        elif left == '[' and right == ']':
+            return clj.Vector(result, lineno=lineno)
 
-                return clj.Symbol(value, lineno=lineno)
+        elif left == '{' and right == '}':
+            if len(result) % 2 != 0:
+                raise SyntaxError("map requires an even number of elements ({} given)".format(len(result)))
+            return clj.Map(result, lineno=lineno)
 
-            else:
-                raise SyntaxError("invalid token: '{}' (line {})".format(token_type, lineno))
+        else:
+            raise SyntaxError("mismatched parentheses: '{}' amd '{}' (line {})".format(
+                left, right, lineno
+            ))
 
-        raise StopIteration
+    def _apply_prefix(self, prefix, form, lineno):
+        if prefix == '#':
+            if not isinstance(form, clj.Form):
+                raise SyntaxError("'#' requires a form to build a function (line {})".format(lineno))
+
+            params = clj.Vector(_ParameterExtractor().extract_parameters(form))
+            return clj.Form(['fn', params, form])
+
+        elif prefix == '@':
+            return clj.Form([clj.Symbol('deref', lineno=lineno), form], lineno=lineno)
+
+        elif prefix == '\'':
+            return clj.Form([clj.Symbol('quote', lineno=lineno), form], lineno=lineno)
+
+        elif prefix == '#\'':
+            return clj.Form([clj.Symbol('var', lineno=lineno), form], lineno=lineno)
 
 #######################################################################################################################
 
@@ -427,6 +427,9 @@ class ClojureParser(clj.Visitor):
         return AstValue(node.value)
 
     def visit_vector_form(self, node:clj.Vector):
+        # Data vectors are read directly into a (compact) `AstValueVector`
+        if all([type(item) is clj.Value for item in node.items]):
+            return AstValueVector([item.value for item in node.items])
         items = [item.visit(self) for item in node.items]
         return makeVector(items)
 
@@ -435,5 +438,5 @@ class ClojureParser(clj.Visitor):
 
 def parse(source):
     clj_ast = list(ClojureLexer(source))
-    ppl_ast = ClojureParser().visit(clj_ast)
+    ppl_ast = ClojureParser().visit_bottom_up(clj_ast)
     return ppl_ast
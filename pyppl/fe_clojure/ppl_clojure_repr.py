@@ -10,6 +10,8 @@ from ..ppl_ast import *
 
 class ClojureRepr(Visitor):
 
+    __visit_iteratively__ = True
+
     def __init__(self):
         super().__init__()
         self.short_names = False  # used for debugging
@@ -118,6 +120,10 @@ class ClojureRepr(Visitor):
         body = self.visit_indent(node.expr)
         return "(for [{} {}]\n  {})".format(name, source, body)
 
+    def visit_nary(self, node:AstNary):
+        items = [self.visit(item) for item in node.items]
+        return "({} {})".format(node.op, ' '.join(items))
+
     def visit_observe(self, node:AstObserve):
         dist = self.visit(node.dist)
         value = self.visit(node.value)
@@ -17,23 +17,30 @@ from .ppl_clojure_parser import ClojureParser
 class FopplParser(ClojureParser):
 
     def visit_loop(self, count, initial_data, function, *args):
+        # `(loop n init f args...)` computes `v_0 = init` and `v_{i+1} = (f i v_i args...)`. Instead of nesting `n`
+        # calls inside each other, we create a flat body with a `for`-loop over the constant range, which is unrolled
+        # later on (just like a `for`-loop in Python): `v = init; for i in range(n): v = f(i, v, args...)`.
         if not clj.is_integer(count):
             raise SyntaxError("loop requires an integer value as first argument")
         count = count.value
         initial_data = initial_data.visit(self)
         function = function.visit(self)
         args = [arg.visit(self) for arg in args]
-        result = initial_data
-        i = 0
-        while i < count:
-            result = AstCall(function, [AstValue(i), result] + args)
-            i += 1
-        return result
+        if count <= 0:
+            return initial_data
+        result = generate_temp_var()
+        index = generate_temp_var()
+        return makeBody(
+            AstDef(result, initial_data),
+            makeFor(index, AstValueVector(list(range(count))),
+                    AstDef(result, AstCall(function, [AstSymbol(index), AstSymbol(result)] + args))),
+            AstSymbol(result)
+        )
 
 
 #######################################################################################################################
 
 def parse(source):
     clj_ast = list(ClojureLexer(source))
-    ppl_ast = FopplParser().visit(clj_ast)
+    ppl_ast = FopplParser().visit_bottom_up(clj_ast)
     return ppl_ast
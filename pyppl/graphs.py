@@ -102,11 +102,13 @@ class ConditionNode(GraphNode):
 
     def __init__(self, name: str, *, ancestors: Optional[set]=None,
                  condition: str,
+                 data_nodes: Optional[set]=None,
                  function: Optional[str]=None,
                  op: Optional[str]=None,
                  compare_value: Optional[float]=None):
         super().__init__(name, ancestors)
         self.condition = condition
+        self.data_nodes = data_nodes
         self.function = function
         self.op = op
         self.compare_value = compare_value
@@ -118,7 +120,7 @@ class ConditionNode(GraphNode):
 
     def __repr__(self):
         return self.create_repr("Condition", Condition=self.condition, Function=self.function, Op=self.op,
-                                CompareValue=self.compare_value)
+                                CompareValue=self.compare_value, DataNodes=self.data_nodes)
 
     def get_code(self):
         return self.condition
@@ -139,18 +141,117 @@ class DataNode(GraphNode):
     """
     Data nodes do not carry out any computation, but provide the data. They are used to keep larger data set out
     of the code, as large lists are replaced by symbols.
+
+    Numeric data is stored as a (typed) NumPy array in `data_array`, or, if the array has been spilled to disk, as
+    the name of a `.npy`-file in `data_filename`, which is then memory-mapped. In both cases, the generated code
+    refers to the data by name (as `self.data_values[name]`), and the conversion to a tensor happens exactly once
+    (see `get_value()`), without copying the data. Plain vectors (not wrapped in, e.g., `torch.tensor`) that are
+    passed as a whole to a distribution (or observed) are treated like tensor literals. All other plain vectors are
+    marked by `data_as_list`, and become a Python list instead (which copies the data), so that they keep the
+    semantics of a list (`+` concatenates, indexing returns numbers). Only if the data cannot be stored as an array, `data_code` holds the Python-code to
+    create the data.
     """
 
-    def __init__(self, name: str, *, ancestors: Optional[set]=None, data: str):
+    def __init__(self, name: str, *, ancestors: Optional[set]=None, data: Optional[str]=None,
+                 array=None, filename: Optional[str]=None, as_list: bool=False,
+                 placeholder: bool=False, shape: Optional[tuple]=None, original_name: Optional[str]=None):
         super().__init__(name, ancestors)
         self.data_code = data
+        self.data_array = array
+        self.data_filename = filename
+        self.data_as_list = as_list
+        self.data_shape = tuple(shape) if shape is not None else None
+        self.is_placeholder = placeholder
+        if original_name is not None:
+            self.original_name = original_name
+        self._value = None
+        assert data is not None or array is not None or filename is not None or placeholder
 
     def __repr__(self):
+        if self.is_placeholder:
+            return self.create_repr("Data", Placeholder=self.original_name, Shape=self.data_shape)
+        elif self.is_binary:
+            array = self.get_array()
+            return self.create_repr("Data", Data="array({}, shape={})".format(array.dtype, array.shape),
+                                    File=self.data_filename)
         return self.create_repr("Data", Data=self.data_code)
 
+    def get_array(self):
+        """
+        Returns the data as a NumPy-array, where spilled data is memory-mapped (copy-on-write).
+        """
+        if self.data_array is None and self.data_filename is not None:
+            import numpy as np
+            return np.load(self.data_filename, mmap_mode='c')
+        return self.data_array
+
+    def get_value(self):
+        """
+        Returns the data as a tensor (or NumPy-array if `torch` is not available). The tensor shares its memory with
+        the underlying array, and is created only once. Plain vectors are returned as a list (see `data_as_list`).
+        Placeholders have no value of their own (see `bind_data`), and raise an error instead.
+        """
+        if self._value is None and self.is_binary:
+            array = self.get_array()
+            if array is None:
+                raise RuntimeError("placeholder '{}' is not bound (see `bind_data`)".format(self.original_name))
+            if self.data_as_list:
+                self._value = array.tolist()
+                return self._value
+            try:
+                import torch
+                self._value = torch.from_numpy(array)
+            except ModuleNotFoundError:
+                self._value = array
+        return self._value
+
     def get_code(self):
+        if self.is_binary:
+            return "self.data_values['{}']".format(self.name)
         return self.data_code
 
+    def bind_value(self, value):
+        """
+        Checks that the given value has the shape of this (placeholder) node, and returns it as a tensor, sharing the
+        memory with the original value, where possible.
+        """
+        if not hasattr(value, 'shape'):
+            import numpy as np
+            value = np.asarray(value)
+        if self.data_shape is not None and tuple(value.shape) != self.data_shape:
+            raise ValueError("data '{}' must have shape {} instead of {}".format(
+                self.original_name, self.data_shape, tuple(value.shape)))
+        try:
+            import torch
+            return torch.as_tensor(value)
+        except ModuleNotFoundError:
+            return value
+
+    @property
+    def is_binary(self):
+        return self.data_array is not None or self.data_filename is not None or self.is_placeholder
+
+
+class DataValues(dict):
+    """
+    Maps the names of the (binary) data nodes of a model to their values (see `DataNode.get_value()`). Placeholders
+    are only added once a value is bound to them (see `bind_data`), and looking up an unbound placeholder raises an
+    error naming the placeholder.
+    """
+
+    def __init__(self, data):
+        super().__init__()
+        self.nodes = { d.name: d for d in data if d.is_binary }
+        for d in self.nodes.values():
+            if not d.is_placeholder:
+                self[d.name] = d.get_value()
+
+    def __missing__(self, key):
+        node = self.nodes.get(key, None)
+        if node is not None and node.is_placeholder:
+            node.get_value()
+        raise KeyError(key)
+
 
 class Vertex(GraphNode):
     """
@@ -185,6 +286,9 @@ class Vertex(GraphNode):
       The set of all conditions under which this vertex is evaluated. Each item in the set is actually a tuple of
       a `ConditionNode` and a boolean value, to which the condition should evaluate. Note that the conditions are
       not owned by a vertex, but might be shared across several vertices.
+    `data_nodes`:
+      The set of data nodes used by the distribution or the observation (if any). Like the conditions, data nodes are
+      not part of the ancestors, since they are constant.
     `dependent_conditions`:
       The set of all conditions that depend on this vertex. In other words, all conditions which contain this
       vertex in their `get_all_ancestors`-set.
@@ -196,6 +300,7 @@ class Vertex(GraphNode):
                  ancestors: Optional[set]=None,
                  condition_nodes: Optional[set]=None,
                  conditions: Optional[set]=None,
+                 data_nodes: Optional[set]=None,
                  distribution_args: Optional[list]=None,
                  distribution_arg_names: Optional[list]=None,
                  distribution_code: str,
@@ -210,6 +315,7 @@ class Vertex(GraphNode):
         super().__init__(name, ancestors)
         self.condition_nodes = condition_nodes
         self.conditions = conditions
+        self.data_nodes = data_nodes
         self.distribution_args = distribution_args
         self.distribution_arg_names = distribution_arg_names
         self.distribution_code = distribution_code
@@ -244,6 +350,7 @@ class Vertex(GraphNode):
             "Conditions":  self.conditions,
             "Cond-Ancs.":  self.condition_ancestors,
             "Cond-Nodes":  self.condition_nodes,
+            "Data-Nodes":  self.data_nodes,
             "Dist-Args":   self.distribution_arguments,
             "Dist-Code":   self.distribution_code,
             "Dist-Name":   self.distribution_name,
@@ -0,0 +1,242 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+import asyncio
+import os
+import pickle
+import random
+import tempfile
+from concurrent import futures
+from typing import Optional
+from .ppl_layout import VertexLayout
+try:
+    import numpy as _np
+except ModuleNotFoundError:
+    _np = None
+try:
+    import torch as _torch
+except ModuleNotFoundError:
+    _torch = None
+
+
+#
+# The `ModelExecutor` distributes the evaluation of `gen_log_prob` and the drawing of prior samples across a pool of
+# worker processes. Each worker receives the (pickled) model once, when it starts. A job is split into chunks, which
+# are then processed by the workers in any order.
+#
+# Random numbers: each chunk has its own seed, derived from the seed of the executor through NumPy's `SeedSequence`.
+# The results are therefore reproducible, and do not depend on the number of workers or on how the chunks are
+# scheduled.
+#
+# Shared memory: the input and output arrays live in memory-mapped `.npy`-files (in `/dev/shm`, if available). The
+# workers write their results directly into these arrays, so that only the small chunk descriptions are sent
+# through the pipes.
+#
+
+_worker_model = None
+_worker_layout = None
+
+
+def _init_worker(model_data: bytes, layout: VertexLayout):
+    global _worker_model, _worker_layout
+    _worker_model = pickle.loads(model_data)
+    _worker_layout = layout
+
+
+def _seed_all(seed: int):
+    random.seed(seed)
+    if _torch is not None:
+        _torch.manual_seed(seed)
+
+
+def _open_columns(filenames: dict, names: list, mode: str):
+    return { name: _np.load(filenames[name], mmap_mode=mode) for name in names }
+
+
+def _log_prob_chunk(input_files: dict, output_file: str, start: int, stop: int, seed: int):
+    _seed_all(seed)
+    layout = _worker_layout
+    columns = _open_columns(input_files, layout.names, 'r')
+    output = _np.load(output_file, mmap_mode='r+')
+    for i in range(start, stop):
+        value = _worker_model.gen_log_prob(layout.read_state(columns, i))
+        if value is None:
+            output[i] = _np.nan
+        elif _torch is not None:
+            # Vertices with event shapes produce a log-probability per element, which need to be summed up
+            output[i] = float(_torch.as_tensor(value).sum())
+        else:
+            output[i] = float(_np.sum(value))
+    output.flush()
+    return stop - start
+
+
+def _prior_samples_chunk(output_files: dict, start: int, stop: int, seed: int):
+    _seed_all(seed)
+    layout = _worker_layout
+    columns = _open_columns(output_files, layout.names, 'r+')
+    for i in range(start, stop):
+        layout.write_state(columns, i, _worker_model.gen_prior_samples())
+    for column in columns.values():
+        column.flush()
+    return stop - start
+
+
+class ExecutorJob(object):
+    """
+    A job submitted to the `ModelExecutor`. Call `result()` to wait for the result, or `await` the job inside a
+    coroutine.
+    """
+
+    def __init__(self, tasks: list, finish):
+        self._tasks = tasks
+        self._finish = finish
+        self._result = None
+        self._done = False
+
+    def _get_result(self):
+        if not self._done:
+            self._result = self._finish()
+            self._done = True
+        return self._result
+
+    def done(self) -> bool:
+        return all([task.done() for task in self._tasks])
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def result(self, timeout: Optional[float]=None):
+        futures.wait(self._tasks, timeout=timeout)
+        for task in self._tasks:
+            task.result(timeout=0)
+        return self._get_result()
+
+    def __await__(self):
+        yield from asyncio.gather(*[asyncio.wrap_future(task) for task in self._tasks]).__await__()
+        return self._get_result()
+
+
+class ModelExecutor(object):
+    """
+    Evaluates the log-probability of many states, or draws many samples from the prior, using a pool of worker
+    processes. States are passed and returned as columns, i. e. as a dictionary mapping the names of the sampled
+    vertices to arrays (see `VertexLayout`), although `log_prob` also accepts a list of states.
+
+    Usage:
+      ```
+      with ModelExecutor(model, workers=4, seed=42) as executor:
+          samples = executor.prior_samples(1000000)
+          log_probs = executor.log_prob(samples)
+      ```
+      Inside a coroutine, use `submit_log_prob` and `submit_prior_samples` instead, which return a job that can be
+      awaited (or use `gather` to wait for several jobs).
+    """
+
+    def __init__(self, model, *, workers: Optional[int]=None, seed: Optional[int]=None, chunk_size: int=1024,
+                 layout: Optional[VertexLayout]=None, shared_dir: Optional[str]=None):
+        self.model = model
+        self.layout = layout if layout is not None else VertexLayout.from_model(model)
+        self.chunk_size = max(1, chunk_size)
+        self.seed_sequence = _np.random.SeedSequence(seed)
+        if shared_dir is None and os.path.isdir('/dev/shm'):
+            shared_dir = '/dev/shm'
+        self._temp_dir = tempfile.TemporaryDirectory(prefix='pyppl_', dir=shared_dir)
+        self._file_counter = 0
+        self._pool = futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                 initargs=(pickle.dumps(model), self.layout))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Shuts down the worker processes and removes all temporary files.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._temp_dir.cleanup()
+
+    def _create_array(self, shape: tuple, dtype):
+        self._file_counter += 1
+        filename = os.path.join(self._temp_dir.name, 'array_{}.npy'.format(self._file_counter))
+        array = _np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+        return filename, array
+
+    def _open_result(self, filename: str):
+        # The mapping stays valid after the file is removed, so that the memory is freed as soon as the array is
+        # no longer used.
+        result = _np.load(filename, mmap_mode='r+')
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        return result
+
+    def _submit_chunks(self, func, n: int, *args):
+        if self._pool is None:
+            raise RuntimeError("the executor has already been closed")
+        starts = list(range(0, n, self.chunk_size))
+        seeds = self.seed_sequence.spawn(len(starts))
+        return [self._pool.submit(func, *args, start, min(start + self.chunk_size, n),
+                                  int(seed.generate_state(1, dtype=_np.uint64)[0]) >> 1)
+                for start, seed in zip(starts, seeds)]
+
+    def submit_log_prob(self, states) -> ExecutorJob:
+        """
+        Submits the evaluation of `gen_log_prob` for each of the given states (either a list of dictionaries, or a
+        dictionary of columns). The result of the job is a one-dimensional array of log-probabilities, with `nan`
+        for states where the density is ill-defined.
+        """
+        columns = self.layout.to_columns(states)
+        n = len(columns[self.layout.names[0]]) if len(self.layout) > 0 else len(states)
+        input_files = {}
+        for name in self.layout.names:
+            filename, array = self._create_array(columns[name].shape, columns[name].dtype)
+            array[...] = columns[name]
+            array.flush()
+            input_files[name] = filename
+        output_file, _ = self._create_array((n,), _np.float64)
+        tasks = self._submit_chunks(_log_prob_chunk, n, input_files, output_file)
+
+        def finish():
+            for filename in input_files.values():
+                os.remove(filename)
+            return self._open_result(output_file)
+
+        return ExecutorJob(tasks, finish)
+
+    def submit_prior_samples(self, n: int) -> ExecutorJob:
+        """
+        Submits drawing `n` samples from the prior. The result of the job is a dictionary of columns, mapping the
+        name of each sampled vertex to an array of `n` values.
+        """
+        output_files = {}
+        for name in self.layout.names:
+            output_files[name], _ = self._create_array((n,) + self.layout.shapes[name], self.layout.dtypes[name])
+        tasks = self._submit_chunks(_prior_samples_chunk, n, output_files)
+
+        def finish():
+            return { name: self._open_result(output_files[name]) for name in self.layout.names }
+
+        return ExecutorJob(tasks, finish)
+
+    def log_prob(self, states):
+        return self.submit_log_prob(states).result()
+
+    def prior_samples(self, n: int) -> dict:
+        return self.submit_prior_samples(n).result()
+
+    @staticmethod
+    async def gather(*jobs):
+        """
+        Waits for all the given jobs and returns the list of their results.
+        """
+        return list(await asyncio.gather(*jobs))
@@ -0,0 +1,169 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+import math
+import warnings
+from typing import Optional
+from .ppl_layout import VertexLayout
+from .ppl_traces import Trace
+try:
+    import torch as _torch
+except ModuleNotFoundError:
+    _torch = None
+
+
+class MultiChainHMC(object):
+    """
+    Runs several chains of Hamiltonian Monte Carlo at once. The continuous vertices of the model (see `gen_cont_vars`)
+    are packed into a single tensor of shape `(num_chains, D)`, and each leapfrog step evaluates the log-density and
+    its gradient for all chains in one call to `gen_log_prob_batch`. All other sampled vertices (discrete, or
+    continuous inside a conditional branch) are kept fixed at their initial values, which are drawn from the prior.
+
+    During warm-up, each chain adapts its own step size through dual averaging (Hoffman & Gelman, 2014) so that its
+    average acceptance probability approaches `target_accept`. The number of leapfrog steps per iteration is drawn
+    uniformly from `[1, num_steps]` (shared by all chains), which avoids periodic trajectories.
+
+    Usage:
+      ```
+      hmc = MultiChainHMC(model, num_chains=8, seed=42)
+      traces = hmc.run(1000, warmup=500)        # one `Trace` per chain
+      ```
+    Note that the values are not transformed to an unconstrained space: proposals outside the support of a vertex
+    have a log-density of `-inf` (or `nan`), and are always rejected. The same holds for proposals with a finite
+    log-density, but a non-finite gradient, which usually points to a problem in the model. These are counted in
+    `num_invalid_gradients`, and reported as a warning at the end of `run`.
+    """
+
+    def __init__(self, model, *, num_chains: int=4, step_size: float=0.1, num_steps: int=10,
+                 target_accept: float=0.8, seed: Optional[int]=None):
+        self.model = model
+        self.num_chains = num_chains
+        self.num_steps = max(1, num_steps)
+        self.target_accept = target_accept
+        self.generator = _torch.Generator()
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        else:
+            self.generator.seed()
+
+        with _torch.random.fork_rng():
+            _torch.manual_seed(int(_torch.randint(0, 2**62, (1,), generator=self.generator)))
+            state = model.gen_prior_samples_batch(num_chains)
+        cont_vars = set(model.gen_cont_vars())
+        self.layout = VertexLayout.from_model(model, { name: state[name][0] for name in state
+                                                       if _torch.is_tensor(state[name]) and state[name].dim() > 0 })
+        self.names = [name for name in self.layout.names if name in cont_vars]
+        self.sizes = [self.layout.get_size(name) for name in self.names]
+        self.fixed = { name: state[name] for name in self.layout.names if name not in cont_vars }
+        dtype = _torch.get_default_dtype()
+        if len(self.names) > 0:
+            self.position = _torch.cat([state[name].reshape(num_chains, -1).to(dtype) for name in self.names], dim=1)
+        else:
+            self.position = _torch.zeros((num_chains, 0), dtype=dtype)
+        self.step_size = _torch.full((num_chains,), float(step_size), dtype=dtype)
+        self.num_invalid_gradients = 0
+        self._log_prob, self._grad = self.log_prob_and_grad(self.position)
+        if self.num_invalid_gradients > 0:
+            raise RuntimeError("the gradient of the log-density is not finite at the initial state of {} chain(s)"
+                               .format(self.num_invalid_gradients))
+
+    @property
+    def dimension(self):
+        return self.position.shape[1]
+
+    def unflatten(self, position) -> dict:
+        """
+        Returns the batched state for the given positions (of shape `(num_chains, D)`), including the fixed values.
+        """
+        state = dict(self.fixed)
+        offset = 0
+        for name, size in zip(self.names, self.sizes):
+            shape = (self.num_chains,) + self.layout.shapes[name]
+            state[name] = position[:, offset:offset+size].reshape(shape)
+            offset += size
+        return state
+
+    def log_prob_and_grad(self, position):
+        position = position.detach().requires_grad_(True)
+        log_prob = self.model.gen_log_prob_batch(self.unflatten(position))
+        log_prob = _torch.where(_torch.isnan(log_prob), _torch.full_like(log_prob, -math.inf), log_prob)
+        if log_prob.requires_grad:
+            grad, = _torch.autograd.grad(log_prob.sum(), position, allow_unused=True)
+        else:
+            grad = None
+        if grad is None:
+            grad = _torch.zeros_like(position)
+        # Reject positions where the log-density is finite, but its gradient is not
+        invalid = _torch.isfinite(log_prob) & ~_torch.isfinite(grad).all(dim=1)
+        if invalid.any():
+            self.num_invalid_gradients += int(invalid.sum())
+            log_prob = _torch.where(invalid, _torch.full_like(log_prob, -math.inf), log_prob)
+        return log_prob.detach(), grad.detach()
+
+    def step(self):
+        """
+        Performs one HMC iteration for all chains and returns the acceptance probabilities.
+        """
+        eps = self.step_size.unsqueeze(1)
+        num_steps = int(_torch.randint(1, self.num_steps + 1, (1,), generator=self.generator))
+        momentum = _torch.randn(self.position.shape, generator=self.generator, dtype=self.position.dtype)
+        position, grad = self.position, self._grad
+        p = momentum + 0.5 * eps * grad
+        for i in range(num_steps):
+            position = position + eps * p
+            log_prob, grad = self.log_prob_and_grad(position)
+            if i < num_steps - 1:
+                p = p + eps * grad
+        p = p + 0.5 * eps * grad
+
+        current_h = -self._log_prob + 0.5 * (momentum ** 2).sum(dim=1)
+        proposed_h = -log_prob + 0.5 * (p ** 2).sum(dim=1)
+        log_accept = (current_h - proposed_h).clamp(max=0.0)
+        log_accept = _torch.where(_torch.isnan(log_accept), _torch.full_like(log_accept, -math.inf), log_accept)
+        uniform = _torch.rand(self.num_chains, generator=self.generator, dtype=log_accept.dtype)
+        accept = _torch.log(uniform) < log_accept
+        self.position = _torch.where(accept.unsqueeze(1), position, self.position)
+        self._log_prob = _torch.where(accept, log_prob, self._log_prob)
+        self._grad = _torch.where(accept.unsqueeze(1), grad, self._grad)
+        return log_accept.exp()
+
+    def warmup(self, num_iterations: int):
+        """
+        Runs the chains for the given number of iterations while adapting the step size of each chain.
+        """
+        gamma, t0, kappa = 0.05, 10.0, 0.75
+        mu = _torch.log(10 * self.step_size)
+        log_eps_bar = _torch.zeros_like(self.step_size)
+        h_bar = _torch.zeros_like(self.step_size)
+        for t in range(1, num_iterations + 1):
+            accept_prob = self.step()
+            h_bar = (1 - 1 / (t + t0)) * h_bar + (self.target_accept - accept_prob) / (t + t0)
+            log_eps = mu - math.sqrt(t) / gamma * h_bar
+            eta = t ** -kappa
+            log_eps_bar = eta * log_eps + (1 - eta) * log_eps_bar
+            self.step_size = log_eps.exp()
+        if num_iterations > 0:
+            self.step_size = log_eps_bar.exp()
+
+    def run(self, num_samples: int, warmup: int=0, thin: int=1) -> list:
+        """
+        Runs the warm-up, and then draws `num_samples` samples per chain. Returns a list with one `Trace` per chain.
+        The acceptance rates are available afterwards as `acceptance_rate`.
+        """
+        num_invalid = self.num_invalid_gradients
+        self.warmup(warmup)
+        traces = [Trace(self.layout, num_samples) for _ in range(self.num_chains)]
+        accepted = _torch.zeros(self.num_chains, dtype=self.position.dtype)
+        for _ in range(num_samples):
+            for _ in range(max(1, thin)):
+                accepted += self.step()
+            state = self.unflatten(self.position)
+            for c, trace in enumerate(traces):
+                trace.append({ name: state[name][c] for name in self.layout.names })
+        self.acceptance_rate = accepted / max(1, num_samples * max(1, thin))
+        if self.num_invalid_gradients > num_invalid:
+            warnings.warn("{} proposal(s) rejected because of a non-finite gradient of the log-density".format(
+                self.num_invalid_gradients - num_invalid), stacklevel=2)
+        return traces
@@ -0,0 +1,150 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+from ..graphs import Vertex
+try:
+    import numpy as _np
+except ModuleNotFoundError:
+    _np = None
+try:
+    import torch as _torch
+except ModuleNotFoundError:
+    _torch = None
+
+
+def _to_numpy(value):
+    if _torch is not None and isinstance(value, _torch.Tensor):
+        return value.detach().cpu().numpy()
+    return _np.asarray(value)
+
+
+class VertexLayout(object):
+    """
+    The layout of the sampled vertices of a model, used to store many states (samples) as columns, i. e. one array
+    per vertex with the samples along the first axis, instead of as individual dictionaries.
+
+    `names`:
+      The names of all sampled vertices, in compute order.
+    `shapes`:
+      A dictionary mapping each name to the shape of a single value of the vertex (`()` for scalars).
+    `dtypes`:
+      A dictionary mapping each name to the NumPy-dtype of the vertex's values.
+    `discrete`, `continuous`:
+      The names of the discrete and continuous vertices, respectively.
+    `original_names`:
+      A dictionary mapping each name to the name of the respective value in the original program (if known).
+
+    The shapes and dtypes cannot be inferred from the graph alone, so we take them from a sample state (by default,
+    drawn from the prior).
+    """
+
+    def __init__(self, names: list, shapes: dict, dtypes: dict, discrete=None, original_names: dict=None):
+        self.names = list(names)
+        self.shapes = { name: tuple(shapes[name]) for name in self.names }
+        self.dtypes = { name: _np.dtype(dtypes[name]) for name in self.names }
+        discrete = set(discrete) if discrete is not None else set()
+        self.discrete = [name for name in self.names if name in discrete]
+        self.continuous = [name for name in self.names if name not in discrete]
+        self.original_names = dict(original_names) if original_names is not None else {}
+
+    def __repr__(self):
+        items = ['{}: {}{}'.format(name, self.dtypes[name], list(self.shapes[name])) for name in self.names]
+        return "VertexLayout({})".format(', '.join(items))
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_model(cls, model, state: dict=None):
+        vertices = [v for v in model.nodes if isinstance(v, Vertex) and v.is_sampled]
+        if state is None:
+            state = model.gen_prior_samples()
+        names = [v.name for v in vertices]
+        values = { name: _to_numpy(state[name]) for name in names }
+        return cls(names,
+                   shapes={ name: values[name].shape for name in names },
+                   dtypes={ name: values[name].dtype for name in names },
+                   discrete=[v.name for v in vertices if v.is_discrete],
+                   original_names={ v.name: v.original_name for v in vertices })
+
+    def to_dict(self) -> dict:
+        """
+        Returns the layout as a dictionary that can be written as JSON (see `from_dict`).
+        """
+        return {
+            'names': self.names,
+            'shapes': { name: list(self.shapes[name]) for name in self.names },
+            'dtypes': { name: self.dtypes[name].str for name in self.names },
+            'discrete': self.discrete,
+            'original_names': self.original_names,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data['names'], data['shapes'], data['dtypes'], data.get('discrete', None),
+                   data.get('original_names', None))
+
+    def get_record_dtype(self):
+        """
+        Returns a structured NumPy-dtype with one field per vertex, so that a complete state fits into one record.
+        """
+        return _np.dtype([(name, self.dtypes[name], self.shapes[name]) for name in self.names])
+
+    def find_name(self, name: str) -> str:
+        """
+        Returns the (generated) name of the vertex with the given name, which is either the generated name itself, or
+        the name in the original program.
+        """
+        if name in self.shapes:
+            return name
+        found = [n for n in self.names if self.original_names.get(n, None) == name]
+        if len(found) == 1:
+            return found[0]
+        elif len(found) > 1:
+            raise RuntimeError("ambiguous vertex name: '{}'".format(name))
+        raise RuntimeError("unknown vertex: '{}'".format(name))
+
+    def get_size(self, name: str) -> int:
+        """
+        Returns the number of scalar entries of a single value of the vertex.
+        """
+        return int(_np.prod(self.shapes[name], dtype=_np.int64))
+
+    def allocate(self, n: int) -> dict:
+        """
+        Allocates (empty) columns for `n` states.
+        """
+        return { name: _np.empty((n,) + self.shapes[name], dtype=self.dtypes[name]) for name in self.names }
+
+    def to_columns(self, states) -> dict:
+        """
+        Converts a list of states (dictionaries) to columns. If `states` is already a dictionary of columns, the
+        columns are only converted to arrays of the right dtype (without copying, if possible).
+        """
+        if isinstance(states, dict):
+            return { name: _np.asarray(_to_numpy(states[name]), dtype=self.dtypes[name]) for name in self.names }
+        columns = self.allocate(len(states))
+        for i, state in enumerate(states):
+            self.write_state(columns, i, state)
+        return columns
+
+    def write_state(self, columns: dict, index: int, state: dict):
+        """
+        Writes the values of the state into the row `index` of the columns.
+        """
+        for name in self.names:
+            value = _to_numpy(state[name])
+            if value.shape != self.shapes[name]:
+                raise ValueError("vertex '{}' has shape {}, but {} was expected".format(
+                    name, value.shape, self.shapes[name]))
+            columns[name][index] = value
+
+    def read_state(self, columns: dict, index: int) -> dict:
+        """
+        Returns the row `index` of the columns as a state, i. e. a dictionary mapping names to tensors.
+        """
+        if _torch is not None:
+            return { name: _torch.as_tensor(columns[name][index]) for name in self.names }
+        return { name: columns[name][index] for name in self.names }
@@ -0,0 +1,179 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+import math
+from typing import Optional
+from .ppl_layout import VertexLayout
+from .ppl_traces import Trace
+try:
+    import torch as _torch
+except ModuleNotFoundError:
+    _torch = None
+
+
+def log_mean_exp(log_weights):
+    if len(log_weights) == 0:
+        return -math.inf
+    return float(_torch.logsumexp(log_weights, dim=0)) - math.log(len(log_weights))
+
+
+def get_effective_sample_size(log_weights) -> float:
+    """
+    Returns the effective sample size `(sum w)^2 / sum w^2` of the (unnormalised) log-weights.
+    """
+    if len(log_weights) == 0:
+        return 0.0
+    return float((2 * _torch.logsumexp(log_weights, dim=0) - _torch.logsumexp(2 * log_weights, dim=0)).exp())
+
+
+def systematic_resample(log_weights, n: Optional[int]=None):
+    """
+    Draws `n` (by default, as many as there are weights) ancestor indices with probabilities proportional to the
+    weights, using a single uniform offset for all `n` strata. Returns a `LongTensor` of indices.
+    """
+    m = len(log_weights)
+    n = m if n is None else n
+    weights = _torch.softmax(log_weights.to(_torch.float64), dim=0)
+    cumulative = _torch.cumsum(weights, dim=0)
+    cumulative[-1] = 1.0
+    positions = (_torch.rand((), dtype=_torch.float64) + _torch.arange(n, dtype=_torch.float64)) / n
+    return _torch.searchsorted(cumulative, positions).clamp(max=m-1)
+
+
+class WeightedSamples(object):
+    """
+    A set of particles, given as a batched state (see `gen_prior_samples_batch`) together with one log-weight per
+    particle. `log_evidence` is the estimate of the log marginal likelihood of the observations.
+    """
+
+    def __init__(self, model, state: dict, log_weights, log_evidence: float, num_resampled: int=0):
+        self.model = model
+        self.state = state
+        self.log_weights = log_weights
+        self.log_evidence = log_evidence
+        self.num_resampled = num_resampled
+
+    def __len__(self):
+        return len(self.log_weights)
+
+    def __repr__(self):
+        return "WeightedSamples({} particles, ESS {:.1f}, log evidence {:.4f})".format(
+            len(self), self.effective_sample_size, self.log_evidence)
+
+    @property
+    def effective_sample_size(self) -> float:
+        return get_effective_sample_size(self.log_weights)
+
+    def get_weights(self):
+        """
+        Returns the normalised weights.
+        """
+        return _torch.softmax(self.log_weights, dim=0)
+
+    def mean(self, name: str):
+        """
+        Returns the weighted mean of the vertex (given by its generated or original name).
+        """
+        value = self.state[self._find_name(name)]
+        weights = self.get_weights().to(_torch.get_default_dtype())
+        value = _torch.as_tensor(value).to(weights.dtype)
+        return (weights.reshape((-1,) + (1,) * (value.dim() - 1)) * value).sum(dim=0)
+
+    def _find_name(self, name: str) -> str:
+        if name in self.state:
+            return name
+        found = [v.name for v in self.model.vertices if v.is_sampled and v.original_name == name]
+        if len(found) == 1:
+            return found[0]
+        raise RuntimeError("unknown vertex: '{}'".format(name))
+
+    def to_trace(self, n: Optional[int]=None) -> Trace:
+        """
+        Resamples the particles (systematically) and returns the resulting unweighted samples as a `Trace`.
+        """
+        names = [v.name for v in self.model.vertices if v.is_sampled]
+        indices = systematic_resample(self.log_weights, n)
+        columns = { name: _torch.as_tensor(self.state[name])[indices] for name in names }
+        layout = VertexLayout.from_model(self.model, { name: columns[name][0] for name in names })
+        return Trace.from_states(layout, columns)
+
+
+class _Resampler(object):
+    """
+    The `resample`-callback passed to `gen_smc_batch`: resamples the particles (systematically) whenever the effective
+    sample size drops below `ess_threshold * n`, and keeps track of the evidence gathered up to each resampling step.
+    If the model abandons the vectorized pass in favour of drawing the particles one by one, it calls `discard`, and
+    the resampling steps of the aborted pass no longer count.
+    """
+
+    def __init__(self, ess_threshold: float):
+        self.ess_threshold = ess_threshold
+        self.log_evidence = 0.0
+        self.num_resampled = 0
+
+    def __call__(self, state: dict, log_weights, names: list):
+        n = len(log_weights)
+        log_weights = _torch.where(_torch.isnan(log_weights), _torch.full_like(log_weights, -math.inf), log_weights)
+        if get_effective_sample_size(log_weights) >= self.ess_threshold * n or not _torch.isfinite(log_weights).any():
+            return state, log_weights
+        self.log_evidence += log_mean_exp(log_weights)
+        self.num_resampled += 1
+        indices = systematic_resample(log_weights)
+        state = dict(state)
+        for name in names:
+            value = state[name]
+            if _torch.is_tensor(value) and value.dim() > 0 and value.shape[0] == n:
+                state[name] = value[indices]
+        return state, _torch.zeros_like(log_weights)
+
+    def discard(self):
+        self.log_evidence = 0.0
+        self.num_resampled = 0
+
+
+class BatchedSMC(object):
+    """
+    Likelihood weighting and sequential Monte Carlo with the prior as proposal. All `n` particles are drawn at once
+    through the batched code of the model (`gen_smc_batch`): the vertices are sampled in topological order, and each
+    observed vertex adds its log-likelihood to the weights of the particles. In `run`, the particles are resampled
+    (systematically) after an observation, whenever the effective sample size drops below `ess_threshold * n`.
+
+    Usage:
+      ```
+      smc = BatchedSMC(model, seed=42)
+      particles = smc.run(100000)
+      print(particles.log_evidence, particles.mean('slope'))
+      ```
+    If the model cannot be vectorized, the particles are drawn one by one, and there is no resampling.
+    """
+
+    def __init__(self, model, *, ess_threshold: float=0.5, seed: Optional[int]=None):
+        self.model = model
+        self.ess_threshold = ess_threshold
+        self.seed = seed
+
+    def _sample(self, n: int, resampler: Optional[_Resampler]):
+        with _torch.random.fork_rng():
+            if self.seed is not None:
+                _torch.manual_seed(self.seed)
+            state, log_weights = self.model.gen_smc_batch(n, resampler)
+        log_weights = log_weights.detach()
+        log_weights = _torch.where(_torch.isnan(log_weights), _torch.full_like(log_weights, -math.inf), log_weights)
+        if resampler is not None:
+            log_evidence = resampler.log_evidence + log_mean_exp(log_weights)
+            return WeightedSamples(self.model, state, log_weights, log_evidence, resampler.num_resampled)
+        return WeightedSamples(self.model, state, log_weights, log_mean_exp(log_weights))
+
+    def likelihood_weighting(self, n: int) -> WeightedSamples:
+        """
+        Draws `n` particles from the prior and weights them by the likelihood of all observations.
+        """
+        return self._sample(n, None)
+
+    def run(self, n: int) -> WeightedSamples:
+        """
+        Runs sequential Monte Carlo with `n` particles, resampling at observations as needed.
+        """
+        return self._sample(n, _Resampler(self.ess_threshold))
@@ -0,0 +1,267 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+import json
+import os
+import queue
+import threading
+from typing import Optional
+from .ppl_layout import VertexLayout, _to_numpy
+from .ppl_traces import Trace
+try:
+    import numpy as _np
+except ModuleNotFoundError:
+    _np = None
+
+
+#
+# A trace on disk is a directory with a manifest (`manifest.json`) and a sequence of chunks (`chunk_000000.npy`,
+# ...). Each chunk is a one-dimensional array of records, with one field per vertex (see
+# `VertexLayout.get_record_dtype`). The manifest contains the layout and the list of all complete chunks.
+#
+# Chunks are first written to a temporary file, which is then renamed, and the manifest is only updated afterwards
+# (again through a temporary file). Hence, after a crash, the manifest lists exactly those chunks that were
+# written completely, and a writer can resume from there. Readers never see partially written chunks.
+#
+
+_MANIFEST = 'manifest.json'
+
+
+def _chunk_filename(index: int) -> str:
+    return 'chunk_{:06d}.npy'.format(index)
+
+
+def _write_atomic(filename: str, write):
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+
+def read_manifest(directory: str) -> dict:
+    with open(os.path.join(directory, _MANIFEST)) as f:
+        return json.load(f)
+
+
+class TraceWriter(object):
+    """
+    Writes a trace to disk in chunks of `chunk_size` states, so that long chains do not need to be kept in memory.
+    The actual writing happens on a background thread, so that the sampler is not blocked on I/O (at most
+    `max_pending` chunks are buffered in memory; if the disk is slower than the sampler, `append` eventually waits).
+
+    Usage:
+      ```
+      with TraceWriter('./chain_1', VertexLayout.from_model(model)) as writer:
+          for i in range(1000000):
+              state = ...
+              writer.append(state)
+      trace = TraceReader('./chain_1').to_trace()
+      ```
+    With `resume=True`, an existing trace in the directory is continued (the layout must match). States that were
+    not yet written as part of a complete chunk (e.g., due to a crash) are lost, and `len(writer)` tells how many
+    states were recovered.
+    """
+
+    def __init__(self, directory: str, layout: VertexLayout, *, chunk_size: int=4096, resume: bool=False,
+                 max_pending: int=4):
+        self.directory = directory
+        self.layout = layout
+        self.dtype = layout.get_record_dtype()
+        os.makedirs(directory, exist_ok=True)
+        manifest_filename = os.path.join(directory, _MANIFEST)
+        if resume and os.path.exists(manifest_filename):
+            manifest = read_manifest(directory)
+            if VertexLayout.from_dict(manifest['layout']).get_record_dtype() != self.dtype:
+                raise RuntimeError("cannot resume trace in '{}': the layout does not match".format(directory))
+            self.chunk_size = manifest['chunk_size']
+            self.chunks = manifest['chunks']
+        elif os.path.exists(manifest_filename):
+            raise RuntimeError("there is already a trace in '{}' (use 'resume=True' to continue it)".format(directory))
+        else:
+            self.chunk_size = max(1, chunk_size)
+            self.chunks = []
+        self._written = sum(self.chunks)
+        self._buffer = _np.empty(self.chunk_size, dtype=self.dtype)
+        self._buffer_length = 0
+        self._error = None
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._thread = threading.Thread(target=self._run, name='pyppl-trace-writer', daemon=True)
+        self._thread.start()
+        if len(self.chunks) == 0:
+            self._write_manifest(self.chunks, closed=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._written + self._buffer_length
+
+    def _write_manifest(self, chunks: list, closed: bool):
+        manifest = {
+            'layout': self.layout.to_dict(),
+            'chunk_size': self.chunk_size,
+            'chunks': chunks,
+            'closed': closed,
+        }
+        _write_atomic(os.path.join(self.directory, _MANIFEST),
+                      lambda f: f.write(json.dumps(manifest).encode('utf-8')))
+
+    def _run(self):
+        chunks = list(self.chunks)
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                data, closed = item
+                if data is not None:
+                    filename = os.path.join(self.directory, _chunk_filename(len(chunks)))
+                    _write_atomic(filename, lambda f: _np.save(f, data))
+                    chunks.append(len(data))
+                self._write_manifest(list(chunks), closed)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("writing the trace to '{}' failed: {}".format(self.directory, error)) from error
+
+    def _submit(self, closed: bool=False):
+        self._check_error()
+        if self._buffer_length > 0:
+            data = self._buffer[:self._buffer_length].copy()
+            self._written += self._buffer_length
+            self._buffer_length = 0
+        else:
+            data = None
+        self._queue.put((data, closed))
+
+    def append(self, state: dict):
+        """
+        Appends a single state (a dictionary mapping the names of the vertices to their values).
+        """
+        record = self._buffer[self._buffer_length]
+        for name in self.layout.names:
+            record[name] = _to_numpy(state[name])
+        self._buffer_length += 1
+        if self._buffer_length == self.chunk_size:
+            self._submit()
+
+    def extend(self, states):
+        """
+        Appends a number of states, given either as a list of states, or as columns (see `Trace.extend`).
+        """
+        if isinstance(states, dict):
+            columns = { name: _to_numpy(states[name]) for name in self.layout.names }
+            n = len(columns[self.layout.names[0]]) if len(self.layout) > 0 else 0
+            i = 0
+            while i < n:
+                k = min(n - i, self.chunk_size - self._buffer_length)
+                for name in self.layout.names:
+                    self._buffer[name][self._buffer_length:self._buffer_length+k] = columns[name][i:i+k]
+                self._buffer_length += k
+                i += k
+                if self._buffer_length == self.chunk_size:
+                    self._submit()
+        else:
+            for state in states:
+                self.append(state)
+
+    def flush(self):
+        """
+        Writes all states appended so far (possibly as a chunk smaller than `chunk_size`), and waits until they are
+        on disk.
+        """
+        self._submit()
+        self._queue.join()
+        self._check_error()
+
+    def close(self):
+        if self._thread is not None:
+            self._submit(closed=True)
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._check_error()
+
+
+class TraceReader(object):
+    """
+    Reads a trace written by `TraceWriter`, possibly while the writer is still running (use `refresh` to pick up
+    new chunks). The chunks are memory-mapped, so that only the parts actually used are loaded into memory.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._chunks = []
+        self.refresh()
+
+    def __len__(self):
+        return sum([len(chunk) for chunk in self._chunks])
+
+    def __repr__(self):
+        return "TraceReader({}: {} states in {} chunks)".format(self.directory, len(self), len(self._chunks))
+
+    def refresh(self):
+        """
+        Re-reads the manifest and maps all chunks that were added in the meantime.
+        """
+        manifest = read_manifest(self.directory)
+        self.layout = VertexLayout.from_dict(manifest['layout'])
+        self.closed = manifest.get('closed', False)
+        for i in range(len(self._chunks), len(manifest['chunks'])):
+            self._chunks.append(_np.load(os.path.join(self.directory, _chunk_filename(i)), mmap_mode='r'))
+        return self
+
+    def get_chunks(self) -> list:
+        """
+        Returns the list of all chunks, each a (memory-mapped) array of records.
+        """
+        return list(self._chunks)
+
+    def get_column(self, name: str, start: int=0, stop: Optional[int]=None):
+        """
+        Returns the values of the vertex in the states `start` to `stop` as an array.
+        """
+        name = self.layout.find_name(name)
+        n = len(self)
+        stop = n if stop is None else min(stop, n)
+        parts = []
+        offset = 0
+        for chunk in self._chunks:
+            lo, hi = max(start - offset, 0), min(stop - offset, len(chunk))
+            if lo < hi:
+                parts.append(chunk[name][lo:hi])
+            offset += len(chunk)
+        if len(parts) == 0:
+            return _np.empty((0,) + self.layout.shapes[name], dtype=self.layout.dtypes[name])
+        return _np.concatenate(parts)
+
+    def __getitem__(self, item):
+        if type(item) is str:
+            return self.get_column(item)
+        index = int(item)
+        if index < 0:
+            index += len(self)
+        for chunk in self._chunks:
+            if 0 <= index < len(chunk):
+                return self.layout.read_state({ name: chunk[name] for name in self.layout.names }, index)
+            index -= len(chunk)
+        raise IndexError("trace index out of range")
+
+    def to_trace(self, start: int=0, stop: Optional[int]=None) -> Trace:
+        """
+        Loads the states `start` to `stop` into an in-memory `Trace`.
+        """
+        columns = { name: self.get_column(name, start, stop) for name in self.layout.names }
+        return Trace.from_states(self.layout, columns)
@@ -0,0 +1,211 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+from typing import Optional
+from .ppl_layout import VertexLayout, _to_numpy
+try:
+    import numpy as _np
+except ModuleNotFoundError:
+    _np = None
+
+
+class Trace(object):
+    """
+    Stores a sequence of states (e.g., the samples of a Markov chain) as columns: one preallocated array per sampled
+    vertex, with the samples along the first axis (see `VertexLayout`). When the arrays are full, their capacity is
+    increased by a constant factor, so that appending a state takes amortized constant time.
+
+    States are converted from and to dictionaries only when they are appended or accessed individually:
+      ```
+      trace = Trace.from_model(model)
+      for i in range(10000):
+          state = ...
+          trace.append(state)
+      trace[-1]                 # the last state as a dictionary
+      trace['slope']            # all values of `slope` as an array
+      trace.summary()
+      ```
+    Vertices can be accessed by their generated names, as well as by their names in the original program.
+    """
+
+    growth_factor = 1.5
+
+    def __init__(self, layout: VertexLayout, capacity: int=1024):
+        self.layout = layout
+        self._columns = layout.allocate(max(capacity, 1))
+        self._length = 0
+
+    @classmethod
+    def from_model(cls, model, capacity: int=1024, state: Optional[dict]=None):
+        return cls(VertexLayout.from_model(model, state), capacity)
+
+    @classmethod
+    def from_states(cls, layout: VertexLayout, states):
+        """
+        Creates a trace from a list of states, or from a dictionary of columns.
+        """
+        columns = layout.to_columns(states)
+        n = len(columns[layout.names[0]]) if len(layout) > 0 else 0
+        result = cls(layout, n)
+        result.extend(columns)
+        return result
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return "Trace({} states, {} vertices)".format(self._length, len(self.layout))
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self.layout.read_state(self._columns, i)
+
+    def __getitem__(self, item):
+        if type(item) is str:
+            return self.get_column(item)
+        elif type(item) is slice:
+            return Trace.from_states(self.layout, { name: self.get_column(name)[item] for name in self.layout.names })
+        else:
+            index = int(item)
+            if index < 0:
+                index += self._length
+            if not 0 <= index < self._length:
+                raise IndexError("trace index out of range")
+            return self.layout.read_state(self._columns, index)
+
+    @property
+    def capacity(self):
+        return len(self._columns[self.layout.names[0]]) if len(self.layout) > 0 else 0
+
+    def reserve(self, capacity: int):
+        """
+        Makes sure the trace can hold at least `capacity` states without reallocating its arrays.
+        """
+        if capacity > self.capacity:
+            capacity = max(capacity, int(self.capacity * self.growth_factor) + 1)
+            columns = self.layout.allocate(capacity)
+            for name in self.layout.names:
+                columns[name][:self._length] = self._columns[name][:self._length]
+            self._columns = columns
+
+    def append(self, state: dict):
+        """
+        Appends a single state (a dictionary mapping the names of the vertices to their values).
+        """
+        self.reserve(self._length + 1)
+        self.layout.write_state(self._columns, self._length, state)
+        self._length += 1
+
+    def extend(self, states):
+        """
+        Appends a number of states, given either as a list of states, or as columns (a dictionary mapping each name
+        to an array with the states along the first axis, such as returned by `gen_prior_samples_batch`).
+        """
+        if isinstance(states, dict):
+            columns = { name: _to_numpy(states[name]) for name in self.layout.names }
+            n = len(columns[self.layout.names[0]]) if len(self.layout) > 0 else 0
+            self.reserve(self._length + n)
+            for name in self.layout.names:
+                self._columns[name][self._length:self._length+n] = columns[name]
+            self._length += n
+        else:
+            for state in states:
+                self.append(state)
+
+    def clear(self):
+        self._length = 0
+
+    def get_column(self, name: str):
+        """
+        Returns all values of the vertex as an array (a view, without copying).
+        """
+        return self._columns[self.layout.find_name(name)][:self._length]
+
+    def get_columns(self, names=None) -> dict:
+        if names is None:
+            names = self.layout.names
+        return { name: self.get_column(name) for name in names }
+
+    def get_matrix(self, names=None):
+        """
+        Returns the values of the given vertices (by default, all continuous vertices) as a two-dimensional array,
+        with one row per state. The values of each vertex are flattened.
+        """
+        if names is None:
+            names = self.layout.continuous
+        names = [self.layout.find_name(name) for name in names]
+        if len(names) == 0:
+            return _np.empty((self._length, 0))
+        return _np.concatenate([self.get_column(name).reshape(self._length, -1).astype(_np.float64)
+                                for name in names], axis=1)
+
+    def to_states(self) -> list:
+        return list(iter(self))
+
+    def _apply(self, func, names):
+        if names is None:
+            names = self.layout.names
+        result = {}
+        for name in names:
+            name = self.layout.find_name(name)
+            result[name] = func(self.get_column(name).astype(_np.float64))
+        return result
+
+    def mean(self, names=None) -> dict:
+        return self._apply(lambda x: x.mean(axis=0), names)
+
+    def var(self, names=None) -> dict:
+        return self._apply(lambda x: x.var(axis=0, ddof=1) if len(x) > 1 else _np.zeros(x.shape[1:]), names)
+
+    def std(self, names=None) -> dict:
+        return { key: _np.sqrt(value) for key, value in self.var(names).items() }
+
+    def quantile(self, q, names=None) -> dict:
+        return self._apply(lambda x: _np.quantile(x, q, axis=0), names)
+
+    def effective_sample_size(self, names=None) -> dict:
+        """
+        Estimates the effective sample size of each vertex (and each entry, for vector-valued vertices), based on the
+        autocorrelation of the chain, which is computed through FFT. The sum of the autocorrelations is truncated at
+        the first negative pair of consecutive autocorrelations (Geyer's initial positive sequence).
+        """
+        def ess(x):
+            n = len(x)
+            if n < 4:
+                return _np.full(x.shape[1:], float(n))
+            x = x.reshape(n, -1)
+            x = x - x.mean(axis=0)
+            size = 1 << (2 * n - 1).bit_length()
+            f = _np.fft.rfft(x, n=size, axis=0)
+            acov = _np.fft.irfft(f * _np.conjugate(f), n=size, axis=0)[:n] / n
+            with _np.errstate(invalid='ignore', divide='ignore'):
+                rho = acov / acov[0]
+            m = n // 2
+            pairs = rho[0:2*m:2] + rho[1:2*m:2]
+            positive = _np.cumprod(pairs > 0, axis=0).astype(bool)
+            tau = -1 + 2 * _np.sum(_np.where(positive, pairs, 0.0), axis=0)
+            return _np.where(_np.isfinite(tau) & (tau > 0), n / _np.maximum(tau, 1e-12), float(n))
+        result = {}
+        for key, value in self._apply(lambda x: x, names).items():
+            result[key] = ess(value).reshape(value.shape[1:])
+        return result
+
+    def summary(self, names=None, quantiles=(0.05, 0.5, 0.95)) -> dict:
+        """
+        Returns a dictionary mapping each vertex to a dictionary with its mean, standard deviation, quantiles and
+        effective sample size.
+        """
+        mean = self.mean(names)
+        std = self.std(names)
+        q = self.quantile(list(quantiles), names)
+        ess = self.effective_sample_size(names)
+        result = {}
+        for name in mean:
+            item = { 'mean': mean[name], 'std': std[name] }
+            for i, p in enumerate(quantiles):
+                item['{:g}%'.format(100 * p)] = q[name][i]
+            item['ess'] = ess[name]
+            result[name] = item
+        return result
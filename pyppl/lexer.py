@@ -6,7 +6,9 @@
 # 20. Feb 2018, Tobias Kohn
 # 22. Feb 2018, Tobias Kohn
 #
+import bisect
 import enum
+import re
 
 #######################################################################################################################
 
@@ -108,6 +110,7 @@ class CharacterStream(object):
         self.source = source # type:str
         self._pos = 0        # type:int
         self.default_char = '\u0000'  # type:str
+        self._newlines = None
 
     def __getitem__(self, item):
         if 0 <= item < len(self.source):
@@ -151,8 +154,18 @@ class CharacterStream(object):
     def eof(self):
         return self._pos >= len(self.source)
 
+    def _get_newlines(self):
+        # The positions of all newline characters, computed only once so that looking up a line takes O(log n)
+        if self._newlines is None:
+            self._newlines = [m.start() for m in re.finditer('\n', self.source)]
+        return self._newlines
+
     def get_line_from_pos(self, pos):
-        return self.source.count('\n', 0, pos)
+        return bisect.bisect_left(self._get_newlines(), pos)
+
+    def get_column_from_pos(self, pos):
+        line = self.get_line_from_pos(pos)
+        return pos - (self._newlines[line-1] + 1 if line > 0 else 0)
 
     def next(self):
         i = self._pos
@@ -502,6 +515,208 @@ class Lexer(object):
     def get_line_from_pos(self, pos):
         return self.source.get_line_from_pos(pos)
 
+    def tokens(self):
+        """
+        Returns an iterator over the same tokens as the lexer itself, but reads the common tokens (names, numbers,
+        strings, brackets, symbols, whitespace and comments) through a single compiled regular expression instead of
+        character by character. The regular expression is built from the category codes, symbols, string prefixes
+        and comment delimiters at the time of the first token (see `_build_scanner`), so the lexer must be fully
+        configured before iteration starts. Any other tokens (escapes, or invalid characters) are passed on to the
+        regular `__next__`, so that the results are the same (only a character outside the range of the category
+        codes might raise its error at a later point).
+
+        Note that overriding any of the `read_XXX`-methods has no effect on the tokens recognised by the regular
+        expression.
+        """
+        scanner = _get_scanner(self)
+        match = scanner.pattern.match
+        source = self.source
+        text = source.source
+        n = len(text)
+        pos = source.current_pos
+        try:
+            while pos < n:
+                m = match(text, pos)
+                kind = m.lastgroup
+                if kind is None:
+                    # Either there is only whitespace left, or the regular expression does not cover the next token
+                    pos = m.end()
+                    if pos >= n:
+                        break
+                    source._pos = pos
+                    token = next(self, None)
+                    if token is None:
+                        break
+                    pos = source._pos
+                    yield token
+                    continue
+
+                start = m.start(kind)
+                pos = m.end()
+                if kind == 'number':
+                    value = m.group(kind)
+                    yield start, TokenType.NUMBER, int(value) if value.isdigit() else _convert_number(value)
+                elif kind == 'name':
+                    value = m.group(kind)
+                    if pos < n and text[pos] in scanner.string_delimiters and value in self.string_prefix:
+                        pos = scanner.string.match(text, pos).end()
+                        yield start, TokenType.STRING, text[start:pos]
+                    elif value in self.constants:
+                        yield start, TokenType.VALUE, self.constants[value]
+                    elif value in self.keywords:
+                        yield start, TokenType.KEYWORD, value
+                    else:
+                        yield start, TokenType.SYMBOL, value
+                elif kind == 'left':
+                    yield start, TokenType.LEFT_BRACKET, text[start]
+                elif kind == 'right':
+                    yield start, TokenType.RIGHT_BRACKET, text[start]
+                elif kind == 'signed_number':
+                    value = _convert_number(text[start+1:pos])
+                    yield start, TokenType.NUMBER, -value if text[start] == '-' else value
+                elif kind == 'symbol' or kind == 'prefix':
+                    yield start, TokenType.SYMBOL, m.group(kind)
+                elif kind == 'string' or kind == 'prefixed_string':
+                    yield start, TokenType.STRING, m.group(kind)
+                elif kind == 'newline':
+                    yield start, TokenType.NEWLINE, text[start]
+        finally:
+            source._pos = min(pos, n)
+
+#######################################################################################################################
+
+class _Scanner(object):
+
+    def __init__(self, pattern, string, string_delimiters):
+        self.pattern = pattern
+        self.string = string
+        self.string_delimiters = string_delimiters
+
+
+_scanners = {}
+
+
+def _get_scanner(lexer: Lexer) -> _Scanner:
+    key = (tuple(lexer.catcodes.catcodes), frozenset(lexer.ext_symbols), frozenset(lexer.string_prefix),
+           lexer.line_comment, lexer.block_comment_start, lexer.block_comment_end)
+    result = _scanners.get(key, None)
+    if result is None:
+        result = _build_scanner(lexer)
+        _scanners[key] = result
+    return result
+
+
+def _char_class(chars) -> str:
+    chars = sorted(set(chars))
+    if len(chars) == 0:
+        return '(?!)'
+    return '[' + ''.join([re.escape(c) for c in chars]) + ']'
+
+
+def _build_scanner(lexer: Lexer) -> _Scanner:
+    """
+    Builds the master regular expression for `Lexer.tokens()`. We first determine for each character which branch in
+    `Lexer.__next__` it would take as the first character of a token, and then create one alternative per branch,
+    in the same order as `__next__` tests them. Characters outside the ASCII range, as well as escapes and invalid
+    characters, are not matched at all and thus handled by `__next__` itself.
+    """
+    catcodes = lexer.catcodes.catcodes
+    chars = [chr(i) for i in range(len(catcodes))]
+    by_catcode = {}
+    for c, cc in zip(chars, catcodes):
+        by_catcode.setdefault(cc, []).append(c)
+
+    def of(*ccs):
+        return [c for cc in ccs for c in by_catcode.get(cc, [])]
+
+    skipped = set(of(CatCode.IGNORE, CatCode.INVALID, CatCode.LINE_COMMENT, CatCode.WHITESPACE))
+    branches = {}
+    for c, cc in zip(chars, catcodes):
+        if c in skipped:
+            continue
+        if cc == CatCode.STRING_DELIMITER:
+            branch = 'string'
+        elif cc in (CatCode.SYMBOL, CatCode.DELIMITER):
+            branch = 'symbol'
+        elif cc == CatCode.LEFT_BRACKET:
+            branch = 'left'
+        elif cc == CatCode.RIGHT_BRACKET:
+            branch = 'right'
+        elif '0' <= c <= '9':
+            branch = 'number'
+        elif cc == CatCode.ALPHA:
+            branch = 'name'
+        elif cc == CatCode.NEWLINE:
+            branch = 'newline'
+        elif cc == CatCode.PREFIX:
+            branch = 'prefix'
+        else:
+            continue
+        branches.setdefault(branch, []).append(c)
+
+    # Strings: `Lexer.read_string()` stops at the closing delimiter or a null-character, and skips escaped characters
+    delimiters = of(CatCode.STRING_DELIMITER)
+    string = '|'.join(['{0}(?:[^\\\\{0}\\x00]|\\\\[\\s\\S]|\\\\\\Z)*{0}?'.format(re.escape(d)) for d in delimiters])
+    string = '(?:{})'.format(string) if string != '' else '(?!)'
+
+    # Numbers: see `Lexer.read_number()`
+    number_end = _char_class(of(CatCode.WHITESPACE, CatCode.RIGHT_BRACKET, CatCode.NEWLINE, CatCode.DELIMITER))
+    number = '(?:0[xX][0-9A-Fa-f]*|0[oO][0-7]*|0[bB][01]*|[0-9]+(?:\\.[0-9]+)?(?:\\.(?={}))?(?:[eE][+-]?[0-9]+)?)'.format(number_end)
+
+    # Symbols: see `Lexer.read_symbol()`, longer symbols must come first
+    symbol_chars = set(of(CatCode.SYMBOL))
+    symbol_start = set(branches.get('symbol', []))
+    symbols = [sym for sym in lexer.ext_symbols if 2 <= len(sym) <= 3 and sym[0] in symbol_start and
+               all([c in symbol_chars for c in sym[1:]])]
+    symbols = [re.escape(sym) for sym in sorted(symbols, key=lambda x: -len(x))]
+
+    alpha_numeric = _char_class(of(CatCode.ALPHA, CatCode.NUMERIC))
+    skip = []
+    if lexer.line_comment is not None:
+        skip.append(re.escape(lexer.line_comment) + '[^\\n]*')
+    if lexer.block_comment_start is not None:
+        end = '(?={}|\\Z)'.format(re.escape(lexer.block_comment_end)) if lexer.block_comment_end is not None else '\\Z'
+        skip.append(re.escape(lexer.block_comment_start) + '[\\s\\S]*?' + end)
+    if len(of(CatCode.IGNORE)) > 0:
+        skip.append(_char_class(of(CatCode.IGNORE)))
+    if len(of(CatCode.LINE_COMMENT)) > 0:
+        skip.append(_char_class(of(CatCode.LINE_COMMENT)) + '[^\\n]*')
+    whitespace = _char_class(of(CatCode.WHITESPACE)) + '*'
+    if len(skip) > 0:
+        skip = '{0}(?:(?:{1}){0})*'.format(whitespace, '|'.join(skip))
+    else:
+        skip = whitespace
+
+    signs = [c for c in '+-' if c not in skipped]
+    prefixes = [c for c in lexer.string_prefix if len(c) == 1 and c not in skipped]
+    alternatives = [
+        ('signed_number', '{}(?=[0-9]){}'.format(_char_class(signs), number)),
+        ('prefixed_string', '{}(?={}){}'.format(_char_class(prefixes), _char_class(delimiters), string)),
+        ('string', '(?={}){}'.format(_char_class(branches.get('string', [])), string)),
+        ('symbol', '|'.join(symbols + [_char_class(branches.get('symbol', []))])),
+        ('left', _char_class(branches.get('left', []))),
+        ('right', _char_class(branches.get('right', []))),
+        ('number', '(?={}){}'.format(_char_class(branches.get('number', [])), number)),
+        ('name', '{}{}*'.format(_char_class(branches.get('name', [])), alpha_numeric)),
+        ('newline', _char_class(branches.get('newline', []))),
+        ('prefix', '(?P<prefix_char>{})(?P=prefix_char)*{}*'.format(_char_class(branches.get('prefix', [])),
+                                                                    alpha_numeric)),
+    ]
+    # Whitespace and comments before the token are skipped as part of the same match
+    pattern = '|'.join(['(?P<{}>{})'.format(name, regex) for name, regex in alternatives])
+    pattern = '{}(?:{})?'.format(skip, pattern)
+    return _Scanner(re.compile(pattern), re.compile(string), set(delimiters))
+
+
+def _convert_number(text: str):
+    if len(text) > 1 and text[0] == '0' and text[1] in 'xXoObB':
+        return int(text[2:], { 'x': 16, 'o': 8, 'b': 2 }[text[1].lower()])
+    elif text.isdigit():
+        return int(text)
+    else:
+        return float(text)
+
+
 #######################################################################################################################
 
 class BufferedIterator(object):
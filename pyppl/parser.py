@@ -8,8 +8,7 @@
 #
 from typing import Optional
 
-from .transforms import (ppl_new_simplifier, ppl_raw_simplifier, ppl_functions_inliner,
-                         ppl_symbol_simplifier, ppl_static_assignments)
+from .transforms import ppl_pass_manager
 from . import ppl_ast
 from .fe_clojure import ppl_foppl_parser
 from .fe_python import ppl_python_parser
@@ -32,7 +31,13 @@ def _detect_language(s:str):
     return None
 
 
-def parse(source:str, *, simplify:bool=True, language:Optional[str]=None, namespace:Optional[dict]=None):
+def parse(source:str, *, simplify:bool=True, language:Optional[str]=None, namespace:Optional[dict]=None,
+          data_types:Optional[dict]=None, passes=None):
+    """
+    Parses the source and transforms the resulting AST through the given `passes` (see `ppl_pass_manager`), which is
+    either a `PassManager`, or a list of passes. By default, all passes in `DEFAULT_PASSES` are used, or only
+    those in `RAW_PASSES` if `simplify` is `False`.
+    """
     result = None
     if type(source) is str and str != '':
         lang = _detect_language(source) if language is None else language.lower()
@@ -48,24 +53,19 @@ def parse(source:str, *, simplify:bool=True, language:Optional[str]=None, namesp
     if type(result) is list:
         result = ppl_ast.makeBody(result)
 
-    if result is not None:
-        if namespace is None:
-            namespace = {}
-        raw_sim = ppl_raw_simplifier.RawSimplifier(namespace)
-        result = raw_sim.visit(result)
-        if simplify:
-            result = ppl_functions_inliner.FunctionInliner().visit(result)
-            result = raw_sim.visit(result)
+    if isinstance(passes, ppl_pass_manager.PassManager):
+        manager = passes
+    elif passes is not None:
+        manager = ppl_pass_manager.PassManager(passes)
+    else:
+        manager = ppl_pass_manager.PassManager(ppl_pass_manager.DEFAULT_PASSES if simplify else
+                                               ppl_pass_manager.RAW_PASSES)
+    return manager.run(result, namespace=namespace, data_types=data_types)
 
-    if simplify and result is not None:
-        result = ppl_static_assignments.StaticAssignments().visit(result)
-        result = ppl_new_simplifier.Simplifier().visit(result)
 
-    result = ppl_symbol_simplifier.SymbolSimplifier().visit(result)
-    return result
-
-
-def parse_from_file(filename: str, *, simplify:bool=True, language:Optional[str]=None, namespace:Optional[dict]=None):
+def parse_from_file(filename: str, *, simplify:bool=True, language:Optional[str]=None, namespace:Optional[dict]=None,
+                    data_types:Optional[dict]=None, passes=None):
     with open(filename) as f:
         source = ''.join(f.readlines())
-    return parse(source, simplify=simplify, language=language, namespace=namespace)
+    return parse(source, simplify=simplify, language=language, namespace=namespace, data_types=data_types,
+                 passes=passes)
@@ -7,9 +7,18 @@
 # 28. Mar 2018, Tobias Kohn
 #
 from typing import Optional
+import array as _array
 import enum
 from ast import copy_location as _cl
 import inspect as _inspect
+import os as _os
+import threading as _threading
+import contextvars as _contextvars
+import sys as _sys
+
+# The names of the visit-methods only depend on the class of a node (see `AstNode.get_visitor_names`)
+_visitor_names_cache = {}
+_envelop_names_cache = {}
 
 class AstNode(object):
     """
@@ -18,6 +27,9 @@ class AstNode(object):
     """
 
     _attributes = { 'col_offset', 'lineno' }
+    # Results of analyses, which are cached on the node itself (see `invalidate`)
+    _cached_attributes = ('_info', '_type')
+    _info = None
     original_name = None
     tag = None
 
@@ -36,6 +48,16 @@ class AstNode(object):
                     setattr(self, field, source[field])
         else:
             raise RuntimeError("cannot set fields from source '{}'".format(repr(source)))
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Removes all cached analysis results (such as the `NodeInfo`) from this node. The transformations treat nodes
+        as immutable and create new nodes (through `clone`) instead of changing existing ones. Any code that changes
+        a node in place must call `invalidate` on it, as well as on all nodes containing it.
+        """
+        for name in self._cached_attributes:
+            self.__dict__.pop(name, None)
 
     def get_children(self):
         """
@@ -95,18 +117,21 @@ class AstNode(object):
 
         :return:   A list of strings with possible method names.
         """
-        name = self.__class__.__name__
-        if name.startswith("Ast"):
-            name = name[3:]
-        elif name.endswith("Node"):
-            name = name[:-4]
-        if name.islower():
-            result = ['visit_' + name]
-        else:
-            name2 = ''.join([n if n.islower() else "_" + n.lower() for n in name])
-            while name2.startswith('_'): name2 = name2[1:]
-            result = ['visit_' + name, 'visit_' + name.lower(), 'visit_' + name2]
-        return result
+        result = _visitor_names_cache.get(self.__class__, None)
+        if result is None:
+            name = self.__class__.__name__
+            if name.startswith("Ast"):
+                name = name[3:]
+            elif name.endswith("Node"):
+                name = name[:-4]
+            if name.islower():
+                result = ['visit_' + name]
+            else:
+                name2 = ''.join([n if n.islower() else "_" + n.lower() for n in name])
+                while name2.startswith('_'): name2 = name2[1:]
+                result = ['visit_' + name, 'visit_' + name.lower(), 'visit_' + name2]
+            _visitor_names_cache[self.__class__] = result
+        return list(result)
 
     def __get_envelop_method_names(self):
         """
@@ -115,13 +140,17 @@ class AstNode(object):
 
         :return:  A list with exactly two strings.
         """
-        name = self.__class__.__name__
-        if name.startswith("Ast"):
-            name = name[3:]
-        elif name.endswith("Node"):
-            name = name[:-4]
-        name = name.lower()
-        return ['enter_' + name, 'leave_' + name]
+        result = _envelop_names_cache.get(self.__class__, None)
+        if result is None:
+            name = self.__class__.__name__
+            if name.startswith("Ast"):
+                name = name[3:]
+            elif name.endswith("Node"):
+                name = name[:-4]
+            name = name.lower()
+            result = ['enter_' + name, 'leave_' + name]
+            _envelop_names_cache[self.__class__] = result
+        return result
 
     def visit(self, visitor):
         """
@@ -259,7 +288,7 @@ class AstNode(object):
             result = self.__class__(**args)
         else:
             result = self.__class__()
-        fields = set(self.__dict__).difference(set(result.__dict__))
+        fields = set(self.__dict__).difference(set(result.__dict__)).difference(self._cached_attributes)
         for field in fields:
             setattr(result, field, getattr(self, field))
         for key in kwargs:
@@ -267,12 +296,173 @@ class AstNode(object):
         return result
 
 
+#
+# Visiting deeply nested ASTs
+#
+# The `visit_XXX`-methods of a visitor call `visit` on the children of the node, so that visiting an AST is naturally
+# recursive. With long chains of nested `let`s, or with sums of thousands of terms, this exceeds Python's recursion
+# limit. Instead of raising that limit (which risks a crash of the interpreter itself), visitors can opt into the
+# following scheme by setting `__visit_iteratively__ = True`: each thread counts how deeply the `visit`-calls are
+# nested, and once the count reaches `MAX_VISIT_DEPTH`, the visit of the subtree continues on the next stack segment,
+# while the current thread waits for the result. A stack segment is a helper thread with its own, fresh stack. Each
+# thread has (at most) one segment above it, which is started when first needed, and then reused for all visits that
+# cross into it, so that a wide node at the boundary does not start a thread per child. The segments thus form an
+# explicit stack, with each segment of bounded depth. The segments are stopped as soon as the outermost visit on the
+# thread at the bottom returns, so that no helper threads are left running between visits (in particular, none are
+# around when the process forks). A child process created during a visit starts over with a fresh state.
+#
+# The `visit_XXX`-methods themselves remain unchanged, are called in exactly the same order, and see the same state
+# of the visitor (scopes, etc.) as with plain recursion. The segment runs the visit in a copy of the caller's context
+# (so that, e.g., the `decimal`-context carries over), and with the caller's gradient mode if torch is loaded.
+# Exceptions raised inside a segment are passed on to the segment below. If the thread waiting for a segment is
+# interrupted (e. g., by a `KeyboardInterrupt`), it still waits for the segment to finish the visit before passing on
+# the exception, so that the visitor is never used by two threads at once, and no stale result is left behind.
+#
+
+MAX_VISIT_DEPTH = 100
+
+# Leaves (symbols and values) need only a few frames, and are therefore visited on the current segment, as long as the
+# depth stays below this limit. This saves passing each item of a long vector to the next segment in turn.
+_MAX_LEAF_DEPTH = MAX_VISIT_DEPTH + 20
+
+class _VisitState(_threading.local):
+    depth = 0
+    segment = None      # the stack segment above the current thread (see `_StackSegment`)
+    is_segment = False  # whether the current thread is itself a stack segment
+
+_visit_state = _VisitState()
+
+def _reset_visit_state():
+    global _visit_state
+    _visit_state = _VisitState()
+
+if hasattr(_os, 'register_at_fork'):
+    _os.register_at_fork(after_in_child=_reset_visit_state)
+
+
+class _SegmentChannel(object):
+    """
+    Passes the visits from a thread to the stack segment above it, and the results back. The state of the handoff is
+    kept entirely in the fields (guarded by `condition`), and both sides only ever wait for these fields to change.
+    The state thus remains consistent no matter where a thread is interrupted.
+    """
+
+    def __init__(self):
+        self.condition = _threading.Condition(_threading.Lock())
+        self.task = None
+        self.result = None
+        self.busy = False       # set while a task has been submitted, but its result has not been taken
+        self.stopped = False
+
+    def serve(self):
+        _visit_state.is_segment = True
+        condition = self.condition
+        while True:
+            with condition:
+                while self.task is None and not self.stopped:
+                    condition.wait()
+                task = self.task
+                self.task = None
+            if task is None:
+                break
+            context, grad_enabled, function, args = task
+            try:
+                if grad_enabled is not None:
+                    torch = _sys.modules['torch']
+                    with torch.set_grad_enabled(grad_enabled):
+                        result = (True, context.run(function, *args))
+                else:
+                    result = (True, context.run(function, *args))
+            except BaseException as e:
+                result = (False, e)
+            with condition:
+                self.result = result
+                condition.notify()
+        _stop_segments()
+
+    def submit(self, task):
+        with self.condition:
+            self.task = task
+            self.busy = True
+            self.condition.notify()
+
+    def wait_for_result(self):
+        with self.condition:
+            while self.result is None:
+                self.condition.wait()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+
+class _StackSegment(object):
+
+    def __init__(self):
+        self.channel = _SegmentChannel()
+        self.thread = _threading.Thread(target=self.channel.serve, name='visitor-segment', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.channel.stop()
+        self.thread.join()
+
+    def run(self, function, *args):
+        torch = _sys.modules.get('torch', None)
+        grad_enabled = torch.is_grad_enabled() if torch is not None else None
+        task = (_contextvars.copy_context(), grad_enabled, function, args)
+        channel = self.channel
+        try:
+            channel.submit(task)
+            channel.wait_for_result()
+        except BaseException:
+            # Let the segment finish the visit before passing on the interruption (its result is discarded)
+            while channel.busy:
+                try:
+                    channel.wait_for_result()
+                    channel.result = None
+                    channel.busy = False
+                except BaseException:
+                    pass
+            raise
+        success, value = channel.result
+        channel.result = None
+        channel.busy = False
+        if success:
+            return value
+        raise value
+
+
+def _run_on_next_segment(function, *args):
+    segment = _visit_state.segment
+    if segment is None:
+        segment = _visit_state.segment = _StackSegment()
+    return segment.run(function, *args)
+
+
+def _stop_segments():
+    """
+    Stops the segment above the current thread, which in turn stops the segments above itself.
+    """
+    state = _visit_state
+    segment = state.segment
+    if segment is not None:
+        state.segment = None
+        segment.close()
+
+
 class Visitor(object):
     """
     There is no strict need to derive a visitor or walker from this base class. It does, however, provide a
     default implementation for `visit` as well as `visit_node`.
+
+    Set `__visit_iteratively__` to `True` in a subclass to visit arbitrarily deep ASTs without exceeding the recursion
+    limit (see above).
     """
 
+    __visit_iteratively__ = False
+
     def set_current_line_number(self, lineno:int):
         if hasattr(self, 'current_lineno'):
             self.current_lineno = lineno
@@ -280,10 +470,22 @@ class Visitor(object):
     def visit(self, ast):
         if ast is None:
             return None
-        elif type(ast) in (bool, complex, float, int, str):
-            return None
         elif isinstance(ast, AstNode):
+            if self.__visit_iteratively__:
+                state = _visit_state
+                depth = state.depth
+                if depth >= MAX_VISIT_DEPTH and (depth >= _MAX_LEAF_DEPTH or not isinstance(ast, AstLeaf)):
+                    return _run_on_next_segment(self.visit, ast)
+                state.depth = depth + 1
+                try:
+                    return ast.visit(self)
+                finally:
+                    state.depth = depth
+                    if depth == 0 and state.segment is not None and not state.is_segment:
+                        _stop_segments()
             return ast.visit(self)
+        elif type(ast) in (bool, complex, float, int, str):
+            return None
         elif type(ast) is dict:
             return { key: self.visit(ast[key]) for key in ast }
         elif type(ast) is list:
@@ -301,6 +503,14 @@ class Visitor(object):
 #######################################################################################################################
 
 class Scope(object):
+    """
+    A scope with the bindings of names to values. Names not bound in this scope are resolved in the enclosing scope
+    (`prev`), unless they are protected.
+
+    All scopes of a chain share a table, which maps each name to the stack of scopes binding (or protecting) the
+    name, with the innermost scope last. Resolving a name therefore does not depend on how deeply the scopes are
+    nested. Scopes must be left in the reverse order of their creation (through `release`), as `ScopedVisitor` does.
+    """
 
     def __init__(self, prev, name:Optional[str]=None, lineno:Optional[int]=None):
         self.prev = prev
@@ -308,27 +518,63 @@ class Scope(object):
         self.lineno = lineno
         self.bindings = {}
         self.protected_names = set()
+        self.level = prev.level + 1 if prev is not None else 0
+        self._table = prev._table if prev is not None else {}
         assert prev is None or isinstance(prev, Scope)
         assert name is None or type(name) is str
         assert lineno is None or type(lineno) is int
 
+    def _register(self, name:str):
+        if name in self.bindings or name in self.protected_names:
+            return
+        stack = self._table.get(name, None)
+        if stack is None:
+            self._table[name] = [self]
+        elif stack[-1].level < self.level:
+            stack.append(self)
+        else:
+            # An outer scope (such as the global scope) gets a new binding, while inner scopes are active
+            i = len(stack)
+            while i > 0 and stack[i-1].level > self.level:
+                i -= 1
+            stack.insert(i, self)
+
     def define(self, name:str, value):
         assert type(name) is str and str != '' and str != '_'
+        self._register(name)
         self.bindings[name] = value
 
     def define_protected(self, name:str):
         assert type(name) is str and str != '' and str != '_'
+        self._register(name)
         self.protected_names.add(name)
 
+    def release(self):
+        """
+        Removes the bindings of this scope from the shared table, when leaving the scope.
+        """
+        for name in set.union(set(self.bindings), self.protected_names):
+            stack = self._table[name]
+            if stack[-1] is self:
+                stack.pop()
+            else:
+                stack.remove(self)
+            if len(stack) == 0:
+                del self._table[name]
+
     def resolve(self, name:str):
-        if name in self.protected_names:
-            return None
-        elif name in self.bindings:
-            return self.bindings[name]
-        elif self.prev is not None:
-            return self.prev.resolve(name)
-        else:
-            return None
+        stack = self._table.get(name, None)
+        if stack is not None:
+            i = len(stack) - 1
+            while i >= 0:
+                scope = stack[i]
+                # Skip scopes nested inside this one (when resolving a name through an outer scope)
+                if scope.level <= self.level:
+                    if name in scope.protected_names:
+                        return None
+                    return scope.bindings[name]
+                i -= 1
+        return None
 
     def resolve_locally(self, name:str):
         if name in self.protected_names:
@@ -337,12 +583,7 @@ class Scope(object):
             return self.bindings.get(name, None)
 
     def depth(self):
-        result = 1
-        p = self.prev
-        while p is not None:
-            result += 1
-            p = p.prev
-        return result
+        return self.level + 1
 
 
 class ScopeContext(object):
@@ -363,10 +604,12 @@ class ScopeContext(object):
 
 class ScopedVisitor(Visitor):
 
+    __visit_iteratively__ = True
+
     def __init__(self):
         self.scope = Scope(None)
         self.global_scope = self.scope
-        self.MAX_SCOPE_DEPTH = 100
+        self.MAX_SCOPE_DEPTH = 10000
 
     def enter_scope(self, name:Optional[str]=None):
         if self.scope.depth() >= self.MAX_SCOPE_DEPTH:
@@ -374,6 +617,7 @@ class ScopedVisitor(Visitor):
         self.scope = Scope(self.scope, name)
 
     def leave_scope(self):
+        self.scope.release()
         self.scope = self.scope.prev
         assert(self.scope is not None)
 
@@ -1082,6 +1326,64 @@ class AstNamespace(AstNode):
         return "namespace[{}]".format(self.name)
 
 
+class AstNary(AstOperator):
+    """
+    An associative operator (`+` or `*`) applied to any number of operands, i.e. `a + b + c + d`. Long chains of
+    additions or multiplications (as produced, e.g., by `reduce` or by unrolled loops accumulating a value) are
+    represented by a single flat node, instead of binary nodes nested thousands of levels deep. Use `makeNary` to
+    create such a node: it flattens nested chains and folds the constant operands.
+    """
+
+    __nary_ops = {
+        '+': ('add', lambda x, y: x + y),
+        '*': ('mul', lambda x, y: x * y),
+    }
+
+    def __init__(self, op:str, items:list):
+        self.op = op
+        self.items = items
+        assert op in self.__nary_ops
+        assert type(items) is list and len(items) >= 2
+        assert all([isinstance(item, AstNode) for item in items])
+
+    def __getitem__(self, item):
+        return self.items[item]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return "({})".format(" {} ".format(self.op).join([repr(item) for item in self.items]))
+
+    def get_visitor_names(self):
+        name = 'visit_nary_' + self.op_name
+        return [name] + super(AstNary, self).get_visitor_names()
+
+    @property
+    def op_function(self):
+        return self.__nary_ops[self.op][1]
+
+    @property
+    def op_name(self):
+        return self.__nary_ops[self.op][0]
+
+    def equals(self, node):
+        return self.op == node.op and len(self.items) == len(node.items) and \
+               all([a == b for a, b in zip(self.items, node.items)])
+
+    def to_binary(self):
+        """
+        Returns an equivalent tree of binary nodes, which is balanced, i.e. has a depth of only `log2(n)`.
+        """
+        items = self.items
+        while len(items) > 1:
+            pairs = [AstBinary(items[i], self.op, items[i+1]) for i in range(0, len(items)-1, 2)]
+            if len(items) % 2 == 1:
+                pairs.append(items[-1])
+            items = pairs
+        return items[0]
+
+
 class AstObserve(AstNode):
 
     def __init__(self, dist:AstNode, value:AstNode):
@@ -1270,18 +1572,57 @@ class AstValue(AstLeaf):
         return self.value == other.value
 
 
+def _compact_values(items:list):
+    """
+    Returns a typed array (`array.array`) holding the same values as the given list, provided that the list
+    consists entirely of floats, or entirely of integers (but not booleans). Otherwise, returns `None`.
+    """
+    if len(items) == 0:
+        return None
+    types = set(map(type, items))
+    if len(types) == 1:
+        t = types.pop()
+        try:
+            if t is float:
+                return _array.array('d', items)
+            elif t is int:
+                return _array.array('q', items)
+        except OverflowError:
+            pass
+    return None
+
+def _join_values(a, b):
+    """
+    Concatenates two sequences of values. If both are typed arrays of the same type, the result is again an array,
+    otherwise a list.
+    """
+    if type(a) is _array.array and type(b) is _array.array and a.typecode == b.typecode:
+        return a + b
+    return list(a) + list(b)
+
+
 class AstValueVector(AstLeaf):
+    """
+    A vector of constant values. Numeric vectors (only floats or only integers) are stored compactly as a typed
+    array (`array.array`) rather than as a list of individual Python objects. The `items` might therefore be either
+    a list or an array; in both cases, the items are plain Python values (use `to_list` to get a list).
+    """
 
     def __init__(self, items:list):
+        if type(items) is list:
+            compact = _compact_values(items)
+            if compact is not None:
+                items = compact
         self.items = items
 
-        def is_value_vector(v):
-            if type(v) in (list, tuple):
-                return all([is_value_vector(w) for w in v])
-            else:
-                return type(v) in [bool, complex, float, int, str]
+        if type(items) is not _array.array:
+            def is_value_vector(v):
+                if type(v) in (list, tuple):
+                    return all([is_value_vector(w) for w in v])
+                else:
+                    return type(v) in [bool, complex, float, int, str]
 
-        assert type(items) is list and is_value_vector(items)
+            assert type(items) is list and is_value_vector(items)
 
     def __getitem__(self, item):
         return AstValue(self.items[item])
@@ -1293,13 +1634,19 @@ class AstValueVector(AstLeaf):
         return (AstValue(item) for item in self.items)
 
     def __repr__(self):
-        return repr(self.items)
+        return repr(self.to_list())
+
+    def concat(self, other):
+        """
+        Returns a new vector with the items of `other` (an `AstValueVector`) appended.
+        """
+        return AstValueVector(_join_values(self.items, other.items))
 
     def conj(self, element):
         if type(element) in [bool, complex, float, int, str]:
-            return AstValueVector(self.items + [element])
+            return AstValueVector(_join_values(self.items, [element]))
         elif isinstance(element, AstValue):
-            return AstValueVector(self.items + [element.value])
+            return AstValueVector(_join_values(self.items, [element.value]))
         elif isinstance(element, AstNode):
             return AstVector([AstValue(item) for item in self.items] + [element])
         else:
@@ -1307,9 +1654,9 @@ class AstValueVector(AstLeaf):
 
     def cons(self, element):
         if type(element) in [bool, complex, float, int, str]:
-            return AstValueVector([element] + self.items)
+            return AstValueVector(_join_values([element], self.items))
         elif isinstance(element, AstValue):
-            return AstValueVector([element.value] + self.items)
+            return AstValueVector(_join_values([element.value], self.items))
         elif isinstance(element, AstNode):
             return AstVector([AstValue(element)] + [AstValue(item) for item in self.items])
         else:
@@ -1318,9 +1665,23 @@ class AstValueVector(AstLeaf):
     def equals(self, other):
         return all([i == j for i, j in zip(self.items, other.items)])
 
+    def repeat(self, count:int):
+        """
+        Returns a new vector with the items repeated `count` times (as in `[1, 2] * 3` in Python).
+        """
+        return AstValueVector(self.items * count)
+
+    def to_list(self):
+        items = self.items
+        return items.tolist() if type(items) is _array.array else items
+
     def to_vector(self):
         return AstVector([AstValue(item) for item in self.items])
 
+    @property
+    def is_compact(self):
+        return type(self.items) is _array.array
+
     @property
     def is_empty(self):
         return len(self.items) == 0
@@ -1331,7 +1692,7 @@ class AstValueVector(AstLeaf):
 
     @property
     def value(self):
-        return self.items
+        return self.to_list()
 
 
 class AstVector(AstNode):
@@ -1445,6 +1806,11 @@ def makeBody(*items):
             if node.second_right is not None:
                 items.insert(i + 1, node.second_right)
 
+        elif isinstance(node, AstNary):
+            del items[i]
+            for itm in reversed(node.items):
+                items.insert(i, itm)
+
         elif isinstance(node, AstSlice):
             parts = [x for x in (node.stop, node.start, node.base) if x is not None]
             del items[i]
@@ -1563,7 +1929,10 @@ def makeLet(targets:list, sources:list, body:AstNode, original_target:Optional[s
         return AstLet(targets[0], sources[0], body, original_target=original_target)
 
     else:
-        return makeLet(targets[:-1], sources[:-1], AstLet(targets[-1], sources[-1], body))
+        # Same as `makeLet(targets[:-1], sources[:-1], AstLet(targets[-1], sources[-1], body))`, without recursion
+        for target, source in zip(reversed(targets[1:]), reversed(sources[1:])):
+            body = AstLet(target, source, body)
+        return makeLet(targets[:1], sources[:1], body)
 
 
 def makeListFor(target, source, expr, test=None):
@@ -1577,6 +1946,102 @@ def makeListFor(target, source, expr, test=None):
     return AstListFor(target, source, expr, test)
 
 
+def _fold_values(op:str, left:AstNode, right:AstNode):
+    """
+    Returns the constant result of `left op right` if both operands are constant values, or `None` otherwise.
+    """
+    if isinstance(left, AstValueVector) and isinstance(right, AstValueVector):
+        return left.concat(right) if op == '+' else None
+    elif isinstance(left, AstValueVector) and is_integer(right) and op == '*':
+        return left.repeat(right.value)
+    elif is_integer(left) and isinstance(right, AstValueVector) and op == '*':
+        return right.repeat(left.value)
+    elif isinstance(left, AstValue) and isinstance(right, AstValue) and \
+            left.value is not None and right.value is not None:
+        try:
+            result = left.value + right.value if op == '+' else left.value * right.value
+        except TypeError:
+            return None
+        return AstValue(result)
+    return None
+
+def flatten_operands(op:str, items:list):
+    """
+    Returns the list of operands of the sum (or product) of the given items, where nested sums (binary or n-ary) are
+    replaced by their respective operands, i.e. `[a + (b + c), d]` becomes `[a, b, c, d]`.
+
+    The items of an `AstNary` are taken as they are, since `makeNary` only ever builds flat n-ary nodes. This keeps
+    the cost of extending a long sum by a few more terms low.
+    """
+    result = []
+    for item in items:
+        if isinstance(item, AstNary) and item.op == op:
+            result.extend(item.items)
+        elif isinstance(item, AstBinary) and item.op == op:
+            stack = [item]
+            while len(stack) > 0:
+                node = stack.pop()
+                if isinstance(node, AstNary) and node.op == op:
+                    stack.extend(reversed(node.items))
+                elif isinstance(node, AstBinary) and node.op == op:
+                    stack.append(node.right)
+                    stack.append(node.left)
+                else:
+                    result.append(node)
+        else:
+            result.append(item)
+    return result
+
+def makeNary(op:str, items:list):
+    """
+    Combines the items into a sum or product (depending on `op`, which must be `+` or `*`). Nested sums (or products,
+    respectively) are flattened, and constant numbers are folded into a single constant, placed where the first
+    number occurred. Zeros are removed from sums, ones from products, and a product with a zero factor is zero.
+    If there are other constants among the items (strings or vectors), however, the order of the items is kept,
+    and only neighbouring constants are combined.
+
+    The result is an `AstNary` for three or more remaining items, an `AstBinary` for two, or the item itself.
+    """
+    assert op in ('+', '*')
+    flat = flatten_operands(op, items)
+    constants = [i for i, item in enumerate(flat) if isinstance(item, (AstValue, AstValueVector))]
+    if len(constants) == 0:
+        result = flat
+
+    elif all([is_number(flat[i]) for i in constants]):
+        index = constants[0]
+        constant = flat[index].value
+        for i in constants[1:]:
+            constant = constant + flat[i].value if op == '+' else constant * flat[i].value
+        if op == '*' and constant == 0:
+            return AstValue(constant)
+        result = flat
+        for i in reversed(constants[1:]):
+            del result[i]
+        if len(result) == 1 or constant != (0 if op == '+' else 1):
+            if len(constants) > 1:
+                result[index] = AstValue(constant)
+        else:
+            del result[index]
+
+    else:
+        result = []
+        for item in flat:
+            folded = _fold_values(op, result[-1], item) if len(result) > 0 else None
+            if folded is not None:
+                result[-1] = folded
+            else:
+                result.append(item)
+
+    if len(result) == 0:
+        return AstValue(0 if op == '+' else 1)
+    elif len(result) == 1:
+        return result[0]
+    elif len(result) == 2:
+        return AstBinary(result[0], op, result[1])
+    else:
+        return AstNary(op, result)
+
 def makeSubscript(base, index, default=None):
     if type(index) is int:
         index = AstValue(index)
@@ -1599,7 +2064,9 @@ def makeSubscript(base, index, default=None):
 
 
 def makeVector(items):
-    if all([isinstance(item, AstValue) for item in items]):
+    if type(items) is _array.array:
+        return AstValueVector(items)
+    elif all([isinstance(item, AstValue) for item in items]):
         return AstValueVector([item.value for item in items])
     elif all([type(item) in [bool, complex, float, int, str] for item in items]):
         return AstValueVector(items)
@@ -10,6 +10,43 @@ from typing import Optional
 from .ppl_ast import *
 
 
+# The sets of variable names in a `NodeInfo` are immutable `frozenset`s. Most of them are empty or small, and the same
+# sets recur throughout an AST, so that we keep only one instance of each set (`_intern`). Since the infos are never
+# changed once created, they can be cached on the nodes and shared between parent and child nodes.
+
+_MAX_INTERNED_SETS = 0x10000
+_interned_sets = {}
+_empty_set = frozenset()
+
+def _intern(names) -> frozenset:
+    if len(names) == 0:
+        return _empty_set
+    if type(names) is not frozenset:
+        names = frozenset(names)
+    result = _interned_sets.get(names, None)
+    if result is None:
+        if len(_interned_sets) >= _MAX_INTERNED_SETS:
+            _interned_sets.clear()
+        _interned_sets[names] = result = names
+    return result
+
+def _union(sets:list) -> frozenset:
+    sets = [item for item in sets if len(item) > 0]
+    if len(sets) == 0:
+        return _empty_set
+    elif len(sets) == 1:
+        return _intern(sets[0])
+    else:
+        return _intern(_empty_set.union(*sets))
+
+def _names(names, arg_name:str) -> frozenset:
+    if names is None:
+        return _empty_set
+    if type(names) not in (set, frozenset) or not all([type(item) is str for item in names]):
+        raise TypeError("NodeInfo(): wrong type of '{}': '{}'".format(arg_name, names))
+    return _intern(names)
+
+
 class NodeInfo(object):
 
     def __init__(self, *, base=None,
@@ -24,13 +61,6 @@ class NodeInfo(object):
                  has_side_effects:bool=False,
                  return_count:int=0):
 
-        if changed_vars is None:
-            changed_vars = set()
-        if cond_vars is None:
-            cond_vars = set()
-        if free_vars is None:
-            free_vars = set()
-
         if base is None:
             bases = []
         elif isinstance(base, NodeInfo):
@@ -40,10 +70,37 @@ class NodeInfo(object):
         else:
             raise TypeError("NodeInfo(): wrong type of 'base': '{}'".format(type(base)))
 
-        self.changed_var_count = { k: 1 for k in changed_vars }   # type:dict
-        self.changed_vars = changed_vars            # type:set
-        self.cond_vars = cond_vars                  # type:set
-        self.free_vars = free_vars                  # type:set
+        changed_vars = _names(changed_vars, 'changed_vars')
+        cond_vars = _names(cond_vars, 'cond_vars')
+        free_vars = _names(free_vars, 'free_vars')
+        assert type(has_break) is bool
+        assert type(has_cond) is bool
+        assert type(has_observe) is bool
+        assert type(has_return) is bool
+        assert type(has_sample) is bool
+        assert type(has_side_effects) is bool
+        assert type(return_count) is int
+
+        changed_sets = [changed_vars]
+        cond_sets = [cond_vars]
+        free_sets = [free_vars]
+        counts = [{ k: 1 for k in changed_vars }] if len(changed_vars) > 0 else []
+        for item in bases:
+            if len(item.changed_vars) > 0:
+                changed_sets.append(item.changed_vars)
+                counts.append(item.changed_var_count)
+            cond_sets.append(item.cond_vars)
+            free_sets.append(item.free_vars)
+            has_cond = has_cond or item.has_cond
+            has_observe = has_observe or item.has_observe
+            has_return = has_return or item.has_return
+            has_sample = has_sample or item.has_sample
+            has_side_effects = has_side_effects or item.has_side_effects
+            return_count += item.return_count
+
+        self.changed_vars = _union(changed_sets)    # type:frozenset
+        self.cond_vars = _union(cond_sets)          # type:frozenset
+        self.free_vars = _union(free_sets)          # type:frozenset
         self.has_break = has_break                  # type:bool
         self.has_cond = has_cond                    # type:bool
         self.has_observe = has_observe              # type:bool
@@ -51,37 +108,22 @@ class NodeInfo(object):
         self.has_sample = has_sample                # type:bool
         self.has_side_effects = has_side_effects    # type:bool
         self.return_count = return_count            # type:int
-        for item in bases:
-            self.changed_vars = set.union(self.changed_vars, item.changed_vars)
-            self.cond_vars = set.union(self.cond_vars, item.cond_vars)
-            self.free_vars = set.union(self.free_vars, item.free_vars)
-            self.has_cond = self.has_cond or item.has_cond
-            self.has_observe = self.has_observe or item.has_observe
-            self.has_return = self.has_return or item.has_return
-            self.has_sample = self.has_sample or item.has_sample
-            self.has_side_effects = self.has_side_effects or item.has_side_effects
-            self.return_count += item.return_count
-            for key in item.changed_var_count:
-                if key not in self.changed_var_count:
-                    self.changed_var_count[key] = 0
-                self.changed_var_count[key] += item.changed_var_count[key]
+
+        # The counts are shared with the base if possible, and must therefore not be modified
+        if len(counts) == 0:
+            self.changed_var_count = {}             # type:dict
+        elif len(counts) == 1:
+            self.changed_var_count = counts[0]
+        else:
+            self.changed_var_count = dict(counts[0])
+            for item in counts[1:]:
+                for key in item:
+                    self.changed_var_count[key] = self.changed_var_count.get(key, 0) + item[key]
 
         self.has_changed_vars = len(self.changed_vars) > 0
         self.has_free_vars = len(self.free_vars) > 0
         self.can_embed = not (self.has_observe or self.has_sample or self.has_side_effects or self.has_changed_vars)
-        self.mutable_vars = set([key for key in self.changed_var_count if self.changed_var_count[key] > 1])
-
-        assert type(self.changed_vars) is set and all([type(item) is str for item in self.changed_vars])
-        assert type(self.free_vars) is set and all([type(item) is str for item in self.free_vars])
-        assert type(self.changed_var_count) is dict
-        assert type(self.cond_vars) is set and all([type(item) is str for item in self.cond_vars]), cond_vars
-        assert type(self.has_break) is bool
-        assert type(self.has_cond) is bool
-        assert type(self.has_observe) is bool
-        assert type(self.has_return) is bool
-        assert type(self.has_sample) is bool
-        assert type(self.has_side_effects) is bool
-        assert type(self.return_count) is int
+        self.mutable_vars = _intern([key for key in self.changed_var_count if self.changed_var_count[key] > 1])
 
 
     def clone(self, binding_vars:Optional[set]=None, **kwargs):
@@ -89,12 +131,12 @@ class NodeInfo(object):
         for key in kwargs:
             setattr(result, key, kwargs[key])
         if binding_vars is not None:
-            result.changed_vars = set.difference(result.changed_vars, binding_vars)
-            result.cond_vars = set.difference(result.cond_vars, binding_vars)
-            result.free_vars = set.difference(result.free_vars, binding_vars)
-            for n in binding_vars:
-                if n in result.changed_var_count:
-                    del result.changed_var_count[n]
+            result.changed_vars = _intern(result.changed_vars.difference(binding_vars))
+            result.cond_vars = _intern(result.cond_vars.difference(binding_vars))
+            result.free_vars = _intern(result.free_vars.difference(binding_vars))
+            if any([n in result.changed_var_count for n in binding_vars]):
+                result.changed_var_count = { key: result.changed_var_count[key] for key in result.changed_var_count
+                                             if key not in binding_vars }
         return result
 
 
@@ -103,6 +145,8 @@ class NodeInfo(object):
             return self.clone(binding_vars={name})
 
         elif type(name) in (list, set, tuple) and all([type(item) is str for item in name]):
+            if len(name) == 0:
+                return self
             return self.clone(binding_vars=set(name))
 
         elif name is not None:
@@ -140,13 +184,28 @@ class NodeInfo(object):
 
     def is_independent(self, other):
         assert isinstance(other, NodeInfo)
-        a = set.intersection(self.free_vars, other.changed_vars)
-        b = set.intersection(self.changed_vars, other.free_vars)
-        c = set.intersection(self.changed_vars, other.changed_vars)
-        return len(a) == len(b) == len(c) == 0
+        return self.free_vars.isdisjoint(other.changed_vars) and \
+               self.changed_vars.isdisjoint(other.free_vars) and \
+               self.changed_vars.isdisjoint(other.changed_vars)
 
 
 class InfoAnnotator(Visitor):
+    """
+    Computes the `NodeInfo` of a node. The infos are cached on the nodes (see `AstNode.invalidate`), so that the info
+    of a subtree is computed only once, no matter how often it is requested, or how many trees share the subtree.
+    """
+
+    __visit_iteratively__ = True
+
+    def visit(self, ast):
+        if isinstance(ast, AstNode):
+            result = ast._info
+            if result is None:
+                result = super().visit(ast)
+                ast._info = result
+            return result
+        else:
+            return super().visit(ast)
 
     def visit_node(self, node:AstNode):
         return NodeInfo()
@@ -192,7 +251,7 @@ class InfoAnnotator(Visitor):
             base = [self.visit(node.if_node), self.visit(node.else_node)]
         else:
             base = [self.visit(node.if_node)]
-        cond_vars = set.union(*[item.changed_vars for item in base])
+        cond_vars = _union([item.changed_vars for item in base])
         return NodeInfo(base=base + [self.visit(node.test)], cond_vars=cond_vars, has_cond=True)
 
     def visit_import(self, _):
@@ -208,6 +267,9 @@ class InfoAnnotator(Visitor):
         expr = self.visit(node.expr).bind_var(node.target)
         return NodeInfo(base=[expr, source])
 
+    def visit_nary(self, node: AstNary):
+        return NodeInfo(base=[self.visit(item) for item in node.items])
+
     def visit_observe(self, node: AstObserve):
         return NodeInfo(base=[self.visit(node.dist), self.visit(node.value)], has_observe=True)
 
@@ -250,6 +312,7 @@ class InfoAnnotator(Visitor):
 class VarCountVisitor(Visitor):
 
     __visit_children_first__ = True
+    __visit_iteratively__ = True
 
     def __init__(self, name:str):
         super().__init__()
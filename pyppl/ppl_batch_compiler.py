@@ -0,0 +1,168 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+import os.path
+import re
+import time
+import traceback
+from concurrent import futures
+from typing import Optional
+
+
+#
+# Compiling a larger number of models is distributed across a pool of worker processes. Each worker compiles one
+# file at a time and either writes the result as a standalone artifact (see `ppl_model_io.write_model`), or sends the
+# generated code and graph metadata back to the main process. Errors are caught inside the worker and reported as
+# part of the result, so that a failing file does not abort the entire batch.
+#
+
+_extensions = {
+    '.py':  'py',
+    '.clj': 'clj',
+}
+
+
+class CompileResult(object):
+    """
+    The result of compiling a single file as part of a batch.
+
+    `filename`:
+      The name of the source file.
+    `name`:
+      The name of the artifact, i. e. the name of the module the model is written to.
+    `module_file`, `graph_file`:
+      The files of the artifact, if an output directory was given (`None` otherwise).
+    `code`, `metadata`:
+      The generated code and the graph metadata, if no output directory was given (`None` otherwise).
+    `time`:
+      The time (in seconds) it took to compile the model (and write the artifact).
+    `error`, `traceback`:
+      A description of the error and the full traceback, if the compilation failed (`None` otherwise).
+    """
+
+    def __init__(self, filename: str, name: str):
+        self.filename = filename
+        self.name = name
+        self.module_file = None
+        self.graph_file = None
+        self.code = None
+        self.metadata = None
+        self.time = 0.0
+        self.error = None
+        self.traceback = None
+
+    def __repr__(self):
+        if self.success:
+            return "CompileResult({}: ok, {:.3f}s)".format(self.filename, self.time)
+        else:
+            return "CompileResult({}: {}, {:.3f}s)".format(self.filename, self.error, self.time)
+
+    @property
+    def success(self):
+        return self.error is None
+
+
+def _get_artifact_name(filename: str) -> str:
+    name = os.path.splitext(os.path.basename(filename))[0]
+    name = re.sub(r'[^0-9A-Za-z_]', '_', name)
+    if name == '' or '0' <= name[0] <= '9':
+        name = '_' + name
+    return name
+
+
+def _get_artifact_names(filenames: list) -> list:
+    result = []
+    used = set()
+    for filename in filenames:
+        name = base_name = _get_artifact_name(filename)
+        i = 1
+        while name in used:
+            i += 1
+            name = '{}_{}'.format(base_name, i)
+        used.add(name)
+        result.append(name)
+    return result
+
+
+def expand_paths(paths) -> list:
+    """
+    Returns the list of all model files in the given paths, where each path is either a file or a directory. For
+    directories, we take all `.py`- and `.clj`-files directly inside it (in alphabetical order).
+    """
+    if type(paths) is str:
+        paths = [paths]
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                full_name = os.path.join(path, filename)
+                if os.path.isfile(full_name) and os.path.splitext(filename)[1] in _extensions:
+                    result.append(full_name)
+        else:
+            result.append(path)
+    return result
+
+
+def compile_file(filename: str, name: str, output_dir: Optional[str]=None, options: Optional[dict]=None):
+    """
+    Compiles a single file and returns a `CompileResult`. This function is executed inside the worker processes.
+    """
+    from . import compile_model_from_file, ppl_model_io
+    result = CompileResult(filename, name)
+    options = dict(options) if options is not None else {}
+    if options.get('language', None) is None:
+        options['language'] = _extensions.get(os.path.splitext(filename)[1], None)
+    start_time = time.perf_counter()
+    try:
+        model = compile_model_from_file(filename, **options)
+        if output_dir is not None:
+            result.module_file, result.graph_file = ppl_model_io.write_model(model, output_dir, name)
+        else:
+            result.code = model.code
+            result.metadata = ppl_model_io.get_model_metadata(model)
+    except Exception as e:
+        result.error = "{}: {}".format(e.__class__.__name__, e)
+        result.traceback = traceback.format_exc()
+    result.time = time.perf_counter() - start_time
+    return result
+
+
+def compile_models(paths, *, workers: Optional[int]=None, output_dir: Optional[str]=None, callback=None,
+                   **options) -> list:
+    """
+    Compiles all model files in the given paths (see `expand_paths`) using a pool of `workers` processes (by default,
+    the number of CPUs). The remaining keyword-arguments are passed on to `compile_model_from_file`.
+
+    If `callback` is given, it is called with each `CompileResult` as soon as the respective file is done. The
+    function returns the list of all results in the order of the files.
+    """
+    filenames = expand_paths(paths)
+    names = _get_artifact_names(filenames)
+    results = [None] * len(filenames)
+
+    def _done(index, result):
+        results[index] = result
+        if callback is not None:
+            callback(result)
+
+    if workers == 1 or len(filenames) <= 1:
+        for i, (filename, name) in enumerate(zip(filenames, names)):
+            _done(i, compile_file(filename, name, output_dir, options))
+
+    else:
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            tasks = { executor.submit(compile_file, filename, name, output_dir, options): i
+                      for i, (filename, name) in enumerate(zip(filenames, names)) }
+            for task in futures.as_completed(tasks):
+                i = tasks[task]
+                try:
+                    result = task.result()
+                except Exception as e:
+                    # The worker itself failed (e. g., the process died), or the result could not be transferred
+                    result = CompileResult(filenames[i], names[i])
+                    result.error = "{}: {}".format(e.__class__.__name__, e)
+                _done(i, result)
+
+    return results
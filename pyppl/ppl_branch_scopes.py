@@ -173,6 +173,8 @@ class NameLockContext(object):
 
 class BranchScopeVisitor(Visitor):
 
+    __visit_iteratively__ = True
+
     def __init__(self, symbols:list):
         self.branch = BranchScope(names=symbols)
         self.symbols = symbols
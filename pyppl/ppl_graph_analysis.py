@@ -0,0 +1,245 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+import io as _io
+import random as _random
+import tokenize as _tokenize
+from .graphs import *
+
+
+def _sort_key(node):
+    name = node.name if isinstance(node, GraphNode) else node
+    return len(name), name
+
+
+def get_parents(vertex: Vertex) -> set:
+    """
+    Returns the set of all vertices the given vertex directly depends on. In contrast to the `ancestors`-field, this
+    includes the vertices that are only linked through a condition, since the log-probability of the vertex changes
+    with these values as well.
+    """
+    return set.union(vertex.ancestors, vertex.condition_ancestors)
+
+
+def get_children(vertices) -> dict:
+    """
+    Returns a dictionary, mapping each vertex to the set of vertices that directly depend on it (see `get_parents`).
+    """
+    result = { v: set() for v in vertices }
+    for v in vertices:
+        for p in get_parents(v):
+            if p in result:
+                result[p].add(v)
+    return result
+
+
+def compute_moral_graph(vertices) -> dict:
+    """
+    Computes the moralized graph of the graphical model: each vertex is connected to its parents and children, and
+    all parents of a common child are 'married', i. e. connected to each other. The observed vertices take part in
+    the marrying of their parents, but are not part of the result, which maps each sampled vertex to the set of its
+    neighbours among the sampled vertices.
+    """
+    result = { v: set() for v in vertices if v.is_sampled }
+    for v in vertices:
+        parents = [p for p in get_parents(v) if p in result]
+        if v in result:
+            for p in parents:
+                result[v].add(p)
+                result[p].add(v)
+        for i, p in enumerate(parents):
+            for q in parents[i+1:]:
+                result[p].add(q)
+                result[q].add(p)
+    return result
+
+
+def compute_coloring(vertices) -> dict:
+    """
+    Colors the moralized graph (see `compute_moral_graph`) so that no two neighbouring vertices share the same
+    color. We use the greedy algorithm by Welsh and Powell, i. e. the vertices are colored in the order of
+    descending degree. The result maps each sampled vertex to its color (a number, starting at `0`).
+    """
+    graph = compute_moral_graph(vertices)
+    order = sorted(graph.keys(), key=lambda v: (-len(graph[v]), _sort_key(v)))
+    result = {}
+    for v in order:
+        used = { result[u] for u in graph[v] if u in result }
+        color = 0
+        while color in used:
+            color += 1
+        result[v] = color
+    return result
+
+
+def compute_block_schedule(vertices) -> list:
+    """
+    Returns a block schedule for Gibbs sampling as a list of lists of names. All vertices within the same block have
+    the same color (see `compute_coloring`) and are therefore conditionally independent, given the values of all
+    other vertices. Hence, all the vertices of one block can be resampled simultaneously.
+    """
+    coloring = compute_coloring(vertices)
+    if len(coloring) == 0:
+        return []
+    result = [[] for _ in range(max(coloring.values()) + 1)]
+    for v in sorted(coloring.keys(), key=_sort_key):
+        result[coloring[v]].append(v.name)
+    return result
+
+
+def compute_markov_blankets(vertices) -> dict:
+    """
+    Returns a dictionary, mapping the name of each sampled vertex to the list of the names of all vertices whose
+    log-probability terms ('factors') depend on the value of that vertex: the vertex itself and all its children.
+    The sum of these factors is, up to a constant, the conditional log-probability of the vertex, given all others.
+    """
+    children = get_children(vertices)
+    result = {}
+    for v in vertices:
+        if v.is_sampled:
+            result[v.name] = [v.name] + [c.name for c in sorted(children[v], key=_sort_key)]
+    return result
+
+
+def _mask_numbers(code: str) -> str:
+    """
+    Replaces all numeric literals in the code (including their signs) by `#`, while keeping the names and strings,
+    such as the references `state['x30001']` to other vertices, intact.
+    """
+    result = []
+    try:
+        for token in _tokenize.generate_tokens(_io.StringIO(code).readline):
+            if token.type == _tokenize.NUMBER:
+                if len(result) > 0 and result[-1] in ('-', '+') and \
+                        (len(result) == 1 or result[-2] in ('(', '[', ',', '=', '*', '/', '+', '-', '**')):
+                    result.pop()
+                result.append('#')
+            elif token.string != '':
+                result.append(token.string)
+    except (_tokenize.TokenError, SyntaxError):
+        return code
+    return ' '.join(result)
+
+
+def compute_observe_groups(vertices) -> list:
+    """
+    Groups the observed vertices by the 'shape' of their code, i. e. the code of the distribution and conditions,
+    where all numeric literals are ignored, but not the references to other vertices. Typically, each group then
+    corresponds to the observations inside a loop (a 'plate'). The vertices must be given in compute order, and the
+    result is a list of lists of indices, where each index refers to the position of the observed vertex in this
+    order.
+    """
+    observed = [v for v in vertices if v.is_observed]
+    groups = {}
+    result = []
+    for i, v in enumerate(observed):
+        conditions = sorted(['{}={}'.format(c.get_code(), t) for c, t in v.conditions]) if v.has_conditions else []
+        key = _mask_numbers(' ; '.join([v.get_code()] + conditions))
+        if key not in groups:
+            groups[key] = len(result)
+            result.append([])
+        result[groups[key]].append(i)
+    return result
+
+
+def sample_minibatch(groups: list, size: int, rng=None) -> list:
+    """
+    Draws a stratified minibatch of `size` indices from the given groups (see `compute_observe_groups`): each group
+    gets a fixed share of the batch, proportional to its size, but at least one index, and the indices of each group
+    are drawn uniformly without replacement. Scaling the terms of each group by the size of the group divided by its
+    share (as `gen_log_prob_minibatch` does) then gives an unbiased estimate of the sum over all terms.
+
+    `rng` is an instance of `random.Random` (by default, the global generator of the `random`-module is used).
+    """
+    if rng is None:
+        rng = _random
+    total = sum([len(group) for group in groups])
+    if not len(groups) <= size <= total:
+        raise ValueError("the size of the minibatch must be between {} and {}, not {}".format(len(groups), total, size))
+    targets = [size * len(group) / total for group in groups]
+    shares = [min(max(int(t), 1), len(group)) for t, group in zip(targets, groups)]
+    while sum(shares) < size:
+        g = max([g for g in range(len(groups)) if shares[g] < len(groups[g])], key=lambda g: targets[g] - shares[g])
+        shares[g] += 1
+    while sum(shares) > size:
+        g = min([g for g in range(len(groups)) if shares[g] > 1], key=lambda g: targets[g] - shares[g])
+        shares[g] -= 1
+    result = []
+    for group, share in zip(groups, shares):
+        result += rng.sample(group, share)
+    return sorted(result)
+
+
+def find_vertices(vertices, names) -> set:
+    """
+    Returns the set of vertices with the given names, where each name is either the generated name of a vertex (such
+    as `x30001`), or the name the respective value had in the original program.
+    """
+    if type(names) is str:
+        names = [names]
+    result = set()
+    for name in names:
+        found = [v for v in vertices if v.name == name or v.original_name == name]
+        if len(found) == 0:
+            raise RuntimeError("unknown vertex: '{}'".format(name))
+        result.update(found)
+    return result
+
+
+def compute_relevant_vertices(vertices, names) -> set:
+    """
+    Computes the set of vertices that are relevant for the posterior of the queried vertices. Starting with the
+    queried and the observed vertices, we take all their ancestors (barren vertices, i. e. sampled vertices without
+    any observed descendants, do not affect the posterior). Of these, we only keep the vertices that are connected
+    to one of the queried vertices.
+    """
+    query = find_vertices(vertices, names)
+    relevant = set()
+    stack = list(query) + [v for v in vertices if v.is_observed]
+    while len(stack) > 0:
+        v = stack.pop()
+        if v not in relevant:
+            relevant.add(v)
+            stack += list(get_parents(v))
+
+    neighbours = { v: set() for v in relevant }
+    for v in relevant:
+        for p in get_parents(v):
+            neighbours[v].add(p)
+            neighbours[p].add(v)
+    result = set()
+    stack = list(query)
+    while len(stack) > 0:
+        v = stack.pop()
+        if v not in result:
+            result.add(v)
+            stack += list(neighbours[v])
+    return result
+
+
+def compute_slice(nodes, names) -> list:
+    """
+    Returns the list of all nodes (vertices, conditions and data) needed to compute the posterior of the queried
+    vertices (see `compute_relevant_vertices`). The nodes must be given in compute order, which the result keeps.
+    """
+    vertices = [node for node in nodes if isinstance(node, Vertex)]
+    relevant = compute_relevant_vertices(vertices, names)
+    result = set(relevant)
+    for v in relevant:
+        if v.condition_nodes is not None:
+            result.update(v.condition_nodes)
+    for node in list(result):
+        if node.data_nodes is not None:
+            result.update(node.data_nodes)
+    return [node for node in nodes if node in result]
+
+
+def slice_model(model, names):
+    """
+    Creates a new (smaller) model that contains only the nodes needed to compute the posterior of the queried
+    vertices (see `compute_slice`).
+    """
+    from .backend.ppl_graph_generator import create_model
+    return create_model(compute_slice(model.nodes, names), **getattr(model, 'code_options', {}))
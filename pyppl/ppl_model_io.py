@@ -0,0 +1,299 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+import hashlib
+import importlib.util
+import json
+import os.path
+import shutil
+import sys
+from .graphs import *
+try:
+    import numpy as _np
+except ModuleNotFoundError:
+    _np = None
+
+
+#
+# The graph of a model is encoded as a list of plain dictionaries (one per node, in compute order), where all
+# references to other nodes (ancestors, conditions, data) are replaced by the indices of the respective nodes in the list.
+# Apart from data arrays (which are kept as NumPy-arrays), the encoding contains only values that can be written
+# as JSON. Fields with a value of `None` are omitted.
+#
+
+_FORMAT_VERSION = 1
+
+
+def _encode_node(node: GraphNode, index: dict) -> dict:
+    result = { 'name': node.name }
+    if len(node.ancestors) > 0:
+        result['ancestors'] = sorted([index[a] for a in node.ancestors])
+    if node.original_name != node.name:
+        result['original_name'] = node.original_name
+    if getattr(node, 'data_nodes', None) is not None:
+        result['data_nodes'] = sorted([index[d] for d in node.data_nodes])
+
+    if isinstance(node, Vertex):
+        result['kind'] = 'vertex'
+        if node.conditions is not None:
+            result['conditions'] = sorted([[index[c], t] for c, t in node.conditions])
+        if node.condition_nodes is not None:
+            result['condition_nodes'] = sorted([index[c] for c in node.condition_nodes])
+        for key in ('distribution_args', 'distribution_arg_names', 'distribution_code', 'distribution_func',
+                    'distribution_name', 'observation', 'observation_value', 'sample_size', 'line_number'):
+            result[key] = getattr(node, key)
+        if node.distribution_transform is not None:
+            result['distribution_transform'] = repr(node.distribution_transform)
+
+    elif isinstance(node, ConditionNode):
+        result['kind'] = 'condition'
+        for key in ('condition', 'function', 'op', 'compare_value', 'bit_index'):
+            result[key] = getattr(node, key)
+
+    elif isinstance(node, DataNode):
+        result['kind'] = 'data'
+        result['data'] = node.data_code
+        result['array'] = node.data_array
+        result['filename'] = node.data_filename
+        result['as_list'] = node.data_as_list or None
+        result['placeholder'] = node.is_placeholder
+        result['shape'] = list(node.data_shape) if node.data_shape is not None else None
+
+    else:
+        raise TypeError("cannot encode graph node '{}'".format(node.name))
+
+    return { key: result[key] for key in result if result[key] is not None }
+
+
+def _decode_node(item: dict, nodes: list) -> GraphNode:
+    kind = item['kind']
+    name = item['name']
+    ancestors = set([nodes[i] for i in item.get('ancestors', [])])
+    data_nodes = set([nodes[i] for i in item['data_nodes']]) if 'data_nodes' in item else None
+
+    if kind == 'vertex':
+        conditions = item.get('conditions', None)
+        if conditions is not None:
+            conditions = set([(nodes[i], t) for i, t in conditions])
+        condition_nodes = item.get('condition_nodes', None)
+        if condition_nodes is not None:
+            condition_nodes = set([nodes[i] for i in condition_nodes])
+        result = Vertex(name, ancestors=ancestors,
+                        conditions=conditions,
+                        condition_nodes=condition_nodes,
+                        data_nodes=data_nodes,
+                        distribution_args=item.get('distribution_args', None),
+                        distribution_arg_names=item.get('distribution_arg_names', None),
+                        distribution_code=item['distribution_code'],
+                        distribution_func=item.get('distribution_func', None),
+                        distribution_name=item['distribution_name'],
+                        distribution_transform=item.get('distribution_transform', None),
+                        observation=item.get('observation', None),
+                        observation_value=item.get('observation_value', None),
+                        original_name=item.get('original_name', None),
+                        sample_size=item.get('sample_size', 1),
+                        line_number=item.get('line_number', -1))
+
+    elif kind == 'condition':
+        result = ConditionNode(name, ancestors=ancestors,
+                               condition=item['condition'],
+                               data_nodes=data_nodes,
+                               function=item.get('function', None),
+                               op=item.get('op', None),
+                               compare_value=item.get('compare_value', None))
+        result.bit_index = item.get('bit_index', result.bit_index)
+        if 'original_name' in item:
+            result.original_name = item['original_name']
+
+    elif kind == 'data':
+        result = DataNode(name, ancestors=ancestors,
+                          data=item.get('data', None),
+                          array=item.get('array', None),
+                          filename=item.get('filename', None),
+                          as_list=item.get('as_list', False),
+                          placeholder=item.get('placeholder', False),
+                          shape=item.get('shape', None),
+                          original_name=item.get('original_name', None))
+
+    else:
+        raise TypeError("cannot decode graph node of kind '{}'".format(kind))
+
+    return result
+
+
+def encode_graph(nodes) -> list:
+    """
+    Encodes the given graph nodes (vertices, conditions and data), which must be in compute order, as a list of
+    dictionaries in the same order.
+    """
+    index = { node: i for i, node in enumerate(nodes) }
+    return [_encode_node(node, index) for node in nodes]
+
+
+def decode_graph(items: list) -> list:
+    """
+    Recreates the graph nodes from the encoding returned by `encode_graph`. The result is a list of all nodes in
+    compute order.
+    """
+    nodes = []
+    for item in items:
+        nodes.append(_decode_node(item, nodes))
+    return nodes
+
+
+def get_model_metadata(model) -> dict:
+    """
+    Returns the graph metadata of the model: the encoded graph as well as the options used to generate the code.
+    """
+    return {
+        'version': _FORMAT_VERSION,
+        'options': getattr(model, 'code_options', {}),
+        'graph': encode_graph(model.nodes),
+    }
+
+
+def write_model(model, directory: str, name: str='model') -> tuple:
+    """
+    Writes the model as a standalone artifact into the given directory: the generated code as the Python module
+    `<name>.py`, and the graph metadata as `<name>.json`. Data arrays are saved alongside as `.npy`-files.
+
+    Returns the names of the module file and the metadata file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    metadata = get_model_metadata(model)
+    for item in metadata['graph']:
+        if item['kind'] == 'data' and ('array' in item or 'filename' in item):
+            filename = '{}.{}.npy'.format(name, item['name'])
+            if 'array' in item:
+                _np.save(os.path.join(directory, filename), item.pop('array'))
+            else:
+                shutil.copyfile(item['filename'], os.path.join(directory, filename))
+            item['filename'] = filename
+
+    module_filename = os.path.join(directory, name + '.py')
+    with open(module_filename, 'w') as f:
+        f.write(model.code)
+    # The byte code is cached based on the modification time (in seconds) and the size of the source. Since the same
+    # model might be rewritten within a second, we make sure there is no stale `.pyc`-file left.
+    cached_filename = importlib.util.cache_from_source(module_filename)
+    if os.path.exists(cached_filename):
+        os.remove(cached_filename)
+    graph_filename = os.path.join(directory, name + '.json')
+    with open(graph_filename, 'w') as f:
+        json.dump(metadata, f, separators=(',', ':'))
+    return module_filename, graph_filename
+
+
+_loaded_modules = {}
+
+
+def _import_module(filename: str, name: str):
+    # The module is loaded through the regular import machinery, so that the compiled byte code is cached as a
+    # `.pyc`-file. If the name is not yet taken by another module, the module is also registered in `sys.modules`.
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    key = (filename, stat.st_mtime_ns, stat.st_size)
+    if key in _loaded_modules:
+        return _loaded_modules[key]
+    spec = importlib.util.spec_from_file_location(name, filename)
+    if spec is None:
+        raise RuntimeError("cannot import model module '{}'".format(filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if name not in sys.modules or getattr(sys.modules[name], '__file__', None) == filename:
+        sys.modules[name] = module
+    _loaded_modules[key] = module
+    return module
+
+
+def read_metadata(filename: str) -> dict:
+    """
+    Reads the graph metadata written by `write_model`. The names of the data files are resolved relative to the
+    directory of the metadata file.
+    """
+    with open(filename) as f:
+        metadata = json.load(f)
+    if metadata.get('version', None) != _FORMAT_VERSION:
+        raise RuntimeError("unsupported model metadata version in '{}'".format(filename))
+    directory = os.path.dirname(os.path.abspath(filename))
+    for item in metadata['graph']:
+        if item['kind'] == 'data' and 'filename' in item:
+            item['filename'] = os.path.join(directory, item['filename'])
+    return metadata
+
+
+def load_model(filename: str):
+    """
+    Loads a model written by `write_model`: the module is imported (rather than compiled from scratch), and the
+    model is rehydrated with all its vertices, arcs, conditions and data from the metadata. The `filename` is the
+    name of either the module file, or the metadata file, or the common name without extension.
+    """
+    from .backend.ppl_graph_generator import instantiate_model
+    base_name, ext = os.path.splitext(filename)
+    if ext not in ('.py', '.json'):
+        base_name = filename
+    metadata = read_metadata(base_name + '.json')
+    options = metadata['options']
+    module = _import_module(base_name + '.py', os.path.basename(base_name))
+    with open(base_name + '.py') as f:
+        code = f.read()
+    nodes = decode_graph(metadata['graph'])
+    result = instantiate_model(getattr(module, options.get('class_name', 'Model')), nodes, code, options)
+    result.module_file = os.path.abspath(base_name + '.py')
+    return result
+
+
+#
+# Pickling a model does not pickle the graph nodes directly (which are heavily cross-linked), but only the encoded
+# graph, together with either the name of the module file (for models loaded through `load_model`), or the generated
+# code. When unpickling, the model-class is taken from a cache, keyed by the hash of the code, so that the code is
+# executed only once per process.
+#
+
+_model_classes = {}
+
+
+def get_model_class(code: str, class_name: str='Model'):
+    """
+    Returns the model-class defined by the given code, executing the code only if the class is not yet cached.
+    """
+    key = (hashlib.sha1(code.encode('utf-8')).hexdigest(), class_name)
+    if key not in _model_classes:
+        c_globals = {}
+        exec(code, c_globals)
+        _model_classes[key] = c_globals[class_name]
+    return _model_classes[key]
+
+
+def reduce_model(model):
+    """
+    Implements `__reduce__` for the generated model-classes.
+    """
+    metadata = get_model_metadata(model)
+    bound_data = { d.name: model.data_values[d.name] for d in model.data
+                   if d.is_placeholder and d.name in model.data_values }
+    module_file = getattr(model, 'module_file', None)
+    if module_file is not None:
+        return _rebuild_model, (module_file, None, metadata, bound_data)
+    else:
+        return _rebuild_model, (None, model.code, metadata, bound_data)
+
+
+def _rebuild_model(module_file, code, metadata, bound_data):
+    from .backend.ppl_graph_generator import instantiate_model
+    options = metadata['options']
+    class_name = options.get('class_name', 'Model')
+    if module_file is not None:
+        module = _import_module(module_file, os.path.splitext(os.path.basename(module_file))[0])
+        model_class = getattr(module, class_name)
+        with open(module_file) as f:
+            code = f.read()
+    else:
+        model_class = get_model_class(code, class_name)
+    result = instantiate_model(model_class, decode_graph(metadata['graph']), code, options)
+    result.data_values.update(bound_data)
+    if module_file is not None:
+        result.module_file = module_file
+    return result
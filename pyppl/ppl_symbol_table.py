@@ -144,6 +144,12 @@ class SymbolTableGenerator(ScopedVisitor):
         return symbol
 
 
+    def visit(self, ast):
+        # The names are changed in place, which invalidates any analysis cached on the nodes
+        if isinstance(ast, AstNode):
+            ast.invalidate()
+        return super().visit(ast)
+
     def visit_node(self, node:AstNode):
         node.visit_children(self)
 
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Checks data placeholders: a model compiled with `data={'ys': (5,)}` refuses to run until a value is bound to `ys`,
+then agrees with the model that has the same data written into its code, and follows each new binding of the data.
+
+License: MIT
+'''
+import pickle
+import torch
+from pyppl import compile_model
+
+torch.distributions.Distribution.set_default_validate_args(False)
+
+model_placeholder_clojure = """
+(let [mu (sample (normal 0 1))]
+  (loop 5 nil (fn [i _] (observe (normal mu 1) (nth ys i))))
+  mu)
+"""
+
+def model_literal_clojure(ys):
+    return "(let [ys [{}]] {})".format(' '.join([str(float(y)) for y in ys]), model_placeholder_clojure)
+
+def check_unbound(f):
+    try:
+        f()
+        assert False, "an unbound placeholder was accepted"
+    except RuntimeError as e:
+        print(e)
+        assert "'ys' is not bound" in str(e)
+
+compiled = compile_model(model_placeholder_clojure, language='clojure', data={'ys': (5,)})
+mu = [v.name for v in compiled.vertices if v.is_sampled][0]
+check_unbound(lambda: compiled.gen_prior_samples())
+check_unbound(lambda: compiled.gen_log_prob({mu: torch.tensor(0.5)}))
+
+for ys in ([1.0, 2.0, 0.5, 1.5, -0.3], [0.0, 0.1, 0.2, 0.3, 0.4]):
+    compiled.bind_data(ys=torch.tensor(ys))
+    literal = compile_model(model_literal_clojure(ys), language='clojure')
+    literal_mu = [v.name for v in literal.vertices if v.is_sampled][0]
+    for value in (-1.0, 0.0, 2.5):
+        state = { mu: torch.tensor(value) }
+        log_prob = compiled.gen_log_prob(state)
+        expected = literal.gen_log_prob({ literal_mu: torch.tensor(value) })
+        assert abs(float(log_prob) - float(expected)) < 1e-5, (ys, value, float(log_prob), float(expected))
+        # The caller's state is left unchanged
+        assert list(state.keys()) == [mu]
+    print("bound {}: log-probabilities agree".format(ys))
+
+# The binding survives pickling
+copy = pickle.loads(pickle.dumps(compiled))
+state = { mu: torch.tensor(0.25) }
+assert abs(float(copy.gen_log_prob(state)) - float(compiled.gen_log_prob(state))) < 1e-6
+
+# Values of the wrong shape and unknown names are rejected
+for kwargs, error in (({'ys': torch.zeros(4)}, ValueError), ({'zs': torch.zeros(5)}, RuntimeError)):
+    try:
+        compiled.bind_data(**kwargs)
+        assert False, "invalid data was accepted"
+    except error as e:
+        print(e)
+
+# Plain vectors that are passed whole to a distribution become tensors, while those indexed in Python remain lists
+model_vectors_clojure = """
+(let [p [0.1 0.2 0.3 0.4]
+      ys [1.5 2.5 3.5 4.5]
+      k (sample (categorical p))]
+  (observe (normal 0 1) (nth ys k))
+  k)
+"""
+
+compiled = compile_model(model_vectors_clojure, language='clojure')
+values = sorted([(node.data_as_list, node.get_value()) for node in compiled.data], key=lambda item: item[0])
+print(values)
+assert [as_list for as_list, _ in values] == [False, True]
+assert isinstance(values[0][1], torch.Tensor) and values[0][1].dtype == torch.float32
+assert values[1][1] == [1.5, 2.5, 3.5, 4.5]
+state = compiled.gen_prior_samples()
+k = [v.name for v in compiled.vertices if v.is_sampled][0]
+expected = torch.log(torch.tensor([0.1, 0.2, 0.3, 0.4]))[state[k]] + \
+           torch.distributions.Normal(0.0, 1.0).log_prob(torch.tensor([1.5, 2.5, 3.5, 4.5])[state[k]])
+assert abs(float(compiled.gen_log_prob(state)) - float(expected)) < 1e-5
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Checks the block schedule and the Markov blankets used for (blocked) Gibbs sampling, and compares the conditional
+log-probabilities of each block (which evaluate the factors of a block as batched expressions) against the sum over
+the individual factors from `gen_log_prob_factors`.
+
+License: MIT
+'''
+import torch
+from pyppl import compile_model
+from pyppl import ppl_graph_analysis
+
+torch.distributions.Distribution.set_default_validate_args(False)
+
+# A chain `x1 -> x2 -> ... -> x8`, with one observation per link
+model_chain_clojure = """
+(let [ys [1.0 2.0 0.5 1.5 -0.3 0.7 0.9 1.1]]
+  (loop 8 (sample (normal 0 1))
+    (fn [i x]
+      (let [x2 (sample (normal x 1))]
+        (observe (normal x2 0.5) (nth ys i))
+        x2))))
+"""
+
+# Observations under conditions, with a parameter shared by all of them
+model_conditional_clojure = """
+(defn step [x y s]
+  (if (> x 0)
+    (observe (normal x s) y)
+    (observe (normal (- x) 2) y)))
+(let [s (sample (uniform 0.5 2))
+      x1 (sample (normal 0 1))
+      x2 (sample (normal 0 1))
+      x3 (sample (normal 0 1))
+      x4 (sample (normal 0 1))]
+  (step x1 1.0 s)
+  (step x2 2.0 s)
+  (step x3 0.5 s)
+  (step x4 -0.3 s)
+  s)
+"""
+
+
+def check_model(model):
+    sampled = set([v.name for v in model.vertices if v.is_sampled])
+    schedule = model.get_block_schedule()
+    print(schedule)
+
+    # Each sampled vertex is in exactly one block, and no two vertices of a block are neighbours
+    assert sorted([v for block in schedule for v in block]) == sorted(sampled)
+    graph = ppl_graph_analysis.compute_moral_graph(model.vertices)
+    for block in schedule:
+        for v in graph:
+            if v.name in block:
+                assert all([u.name not in block for u in graph[v]])
+
+    # The Markov blanket of each vertex consists of the vertex itself and all its children
+    blankets = model._markov_blankets
+    children = ppl_graph_analysis.get_children(model.vertices)
+    for v in model.vertices:
+        if v.is_sampled:
+            assert blankets[v.name][0] == v.name
+            assert set(blankets[v.name][1:]) == set([c.name for c in children[v]])
+
+    calls = []
+    gen_log_prob_factors = model.gen_log_prob_factors
+    for _ in range(5):
+        state = model.gen_prior_samples()
+        factors = gen_log_prob_factors(dict(state))
+        for index, block in enumerate(schedule):
+            model.gen_log_prob_factors = lambda *args: calls.append(args) or gen_log_prob_factors(*args)
+            result = model.gen_cond_log_prob(dict(state), index)
+            del model.gen_log_prob_factors
+            for v in block:
+                expected = sum([float(torch.as_tensor(factors[f]).sum()) for f in blankets[v] if f in factors])
+                assert abs(float(result[v]) - expected) < 1e-4, (v, float(result[v]), expected)
+    # All the blocks were evaluated as batched expressions
+    assert len(calls) == 0
+
+
+compiled_chain = compile_model(model_chain_clojure, language='clojure')
+check_model(compiled_chain)
+compiled_conditional = compile_model(model_conditional_clojure, language='clojure')
+check_model(compiled_conditional)
+
+# A block that is not part of the schedule is evaluated factor by factor
+state = compiled_chain.gen_prior_samples()
+block = list(reversed(compiled_chain.get_block_schedule()[0]))
+result = compiled_chain.gen_cond_log_prob(state, block)
+expected = compiled_chain.gen_cond_log_prob(state, 0)
+assert all([abs(float(result[v]) - float(expected[v])) < 1e-4 for v in block])
+print("all conditional log-probabilities agree with the factors")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Checks that the minibatch estimate of the log-probability is unbiased: averaged over all the stratified batches that
+`sample_minibatch` can draw, it must equal the exact log-probability. The model has two groups of observations of
+very different sizes (one group with a single observation and one with nine).
+
+License: MIT
+'''
+import itertools
+import random
+import torch
+from pyppl import compile_model
+
+torch.distributions.Distribution.set_default_validate_args(False)
+
+model_groups_clojure = """
+(let [slope (sample (normal 0 10))
+      bias (sample (normal 0 10))
+      xs [1.5 2.5 3.5 0.5 1.25 2.0 0.25 0.75 4.5]
+      ys [2.1 -3.9 8.3 1.2 -0.5 4.4 0.3 3.1 -0.8]]
+  (observe (normal bias 2.0) 0.7)
+  (loop 9 nil (fn [i _] (observe (normal (+ (* slope (nth xs i)) bias) 1.0) (nth ys i))))
+  slope)
+"""
+
+compiled = compile_model(model_groups_clojure, language='clojure')
+groups = compiled.get_observe_groups()
+print(groups)
+assert sorted([len(group) for group in groups]) == [1, 9]
+single, nine = sorted(groups, key=len)
+
+state = compiled.gen_prior_samples()
+exact = float(compiled.gen_log_prob(state))
+
+# The expectation over all batches of size 4 (the single observation plus three out of nine)
+estimates = [float(compiled.gen_log_prob_minibatch(state, single + list(batch)))
+             for batch in itertools.combinations(nine, 3)]
+expectation = sum(estimates) / len(estimates)
+print("expectation: {:.4f} (exact: {:.4f})".format(expectation, exact))
+assert abs(expectation - exact) < 1e-3 * max(1.0, abs(exact))
+
+# `sample_minibatch` draws exactly these batches
+rng = random.Random(42)
+for _ in range(20):
+    batch = compiled.sample_minibatch(rng, 4)
+    assert len(batch) == 4 and set(single) <= set(batch) and len(set(batch)) == 4
+
+# A batch without any observation of a group cannot be scaled, and is rejected
+try:
+    compiled.gen_log_prob_minibatch(state, nine[:3])
+    assert False, "a batch missing a group was accepted"
+except RuntimeError as e:
+    print(e)
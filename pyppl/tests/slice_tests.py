@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Checks the slicing of a model on a query: a model with two independent parts (each with its own data) is sliced on
+the variable of one part, through `Model.slice` as well as `compile_model(..., query=...)`. The slice keeps only the
+vertices and data of that part, in compute order, and its log-probability agrees with the respective terms of the
+full model.
+
+License: MIT
+'''
+import pickle
+import torch
+from pyppl import compile_model
+
+torch.distributions.Distribution.set_default_validate_args(False)
+
+model_two_parts_clojure = """
+(let [ys [1.5 2.5 3.5 4.5 5.5]
+      zs [0.5 0.25 0.125 1.0 2.0]
+      a (sample (normal 0 1))
+      b (sample (normal 0 1))
+      k (sample (categorical [0.2 0.2 0.2 0.2 0.2]))
+      j (sample (categorical [0.2 0.2 0.2 0.2 0.2]))]
+  (observe (normal a 1) (nth ys k))
+  (if (> b 0)
+    (observe (normal b 1) (nth zs j))
+    (observe (normal b 2) 1.0))
+  [a b])
+"""
+
+compiled = compile_model(model_two_parts_clojure, language='clojure')
+names = { v.original_name: v.name for v in compiled.vertices if v.is_sampled }
+
+def check_slice(sliced, label):
+    vertices = set([v.name for v in sliced.vertices])
+    print("{}: vertices {}, data {}".format(label, sorted(vertices), sorted([d.name for d in sliced.data])))
+    assert names['a'] in vertices and names['k'] in vertices
+    assert names['b'] not in vertices and names['j'] not in vertices
+    assert len(sliced.conditionals) == 0
+    # Only the data of the first part is kept, and the nodes remain in the order of the full model
+    assert [d.get_value() for d in sliced.data if d.data_as_list] == [[1.5, 2.5, 3.5, 4.5, 5.5]]
+    order = [node.name for node in compiled.nodes]
+    kept = set([node.name for node in sliced.nodes])
+    assert [node.name for node in sliced.nodes] == [name for name in order if name in kept]
+    for value in (-1.0, 0.5, 2.0):
+        for k in range(5):
+            state = { names['a']: torch.tensor(value), names['k']: torch.tensor(k) }
+            expected = torch.distributions.Normal(0.0, 1.0).log_prob(torch.tensor(value)) + \
+                       torch.log(torch.tensor(0.2)) + \
+                       torch.distributions.Normal(value, 1.0).log_prob(torch.tensor([1.5, 2.5, 3.5, 4.5, 5.5])[k])
+            assert abs(float(sliced.gen_log_prob(state)) - float(expected)) < 1e-5, (label, value, k)
+
+check_slice(compiled.slice(['a']), "Model.slice")
+check_slice(compile_model(model_two_parts_clojure, language='clojure', query=['a']), "compile_model(query=...)")
+check_slice(pickle.loads(pickle.dumps(compiled.slice('a'))), "pickled slice")
+
+# The other part keeps its condition and data (the probabilities of the categorical are shared by both parts)
+sliced = compiled.slice(['b'])
+print(sorted([v.name for v in sliced.vertices]), len(sliced.conditionals))
+assert names['a'] not in set([v.name for v in sliced.vertices]) and len(sliced.conditionals) == 1
+assert len([d for d in sliced.data if not d.data_as_list]) == 1
+assert [d.get_value() for d in sliced.data if d.data_as_list] == [[0.5, 0.25, 0.125, 1.0, 2.0]]
+
+# Unknown names are rejected
+try:
+    compiled.slice(['c'])
+    assert False, "an unknown name was accepted"
+except RuntimeError as e:
+    print(e)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Checks the batched SMC against a conjugate model, where the evidence and the posterior are known exactly:
+`mu ~ N(0, 1)` with observations `y_i ~ N(mu, 1)` gives `y ~ N(0, I + 11^T)` and a posterior mean of
+`sum(y) / (len(y) + 1)`.
+
+License: MIT
+'''
+import torch
+from pyppl import compile_model
+from pyppl.inference.ppl_smc import BatchedSMC
+
+torch.distributions.Distribution.set_default_validate_args(False)
+
+model_conjugate_clojure = """
+(let [mu (sample (normal 0 1))]
+  (observe (normal mu 1) 1.0)
+  (observe (normal mu 1) 2.0)
+  (observe (normal mu 1) 0.5)
+  mu)
+"""
+
+observations = torch.tensor([1.0, 2.0, 0.5])
+exact_evidence = float(torch.distributions.MultivariateNormal(
+    torch.zeros(3), torch.eye(3) + torch.ones(3, 3)).log_prob(observations))
+exact_mean = float(observations.sum() / (len(observations) + 1))
+
+compiled_clojure = compile_model(model_conjugate_clojure, language='clojure')
+result = BatchedSMC(compiled_clojure, seed=1).run(100000)
+print(result)
+print("log evidence: {:.4f} (exact: {:.4f})".format(result.log_evidence, exact_evidence))
+print("posterior mean: {:.4f} (exact: {:.4f})".format(float(result.mean('mu')), exact_mean))
+assert abs(result.log_evidence - exact_evidence) < 0.05
+assert abs(float(result.mean('mu')) - exact_mean) < 0.02
+
+# If the vectorized pass is abandoned after resampling took place (here, by pretending that the batch shapes are off),
+# the particles are drawn one by one, and the resampling steps of the aborted pass must not count towards the evidence
+from pyppl.backend import ppl_batch_ops
+
+model_resampling_clojure = """
+(let [mu (sample (normal 0 1))]
+  (observe (normal mu 0.3) 1.0)
+  (observe (normal mu 0.3) 2.0)
+  (observe (normal mu 0.3) 0.5)
+  (observe (normal mu 0.3) 3.5)
+  mu)
+"""
+
+observations = torch.tensor([1.0, 2.0, 0.5, 3.5])
+exact_evidence = float(torch.distributions.MultivariateNormal(
+    torch.zeros(4), 0.09 * torch.eye(4) + torch.ones(4, 4)).log_prob(observations))
+
+compiled_resampling = compile_model(model_resampling_clojure, language='clojure')
+result = BatchedSMC(compiled_resampling, seed=1).run(100000)
+print(result)
+assert result.num_resampled > 0
+
+has_batch_shapes = ppl_batch_ops.has_batch_shapes
+ppl_batch_ops.has_batch_shapes = lambda *args: False
+try:
+    result = BatchedSMC(compiled_resampling, seed=1).run(20000)
+finally:
+    ppl_batch_ops.has_batch_shapes = has_batch_shapes
+print(result)
+print("log evidence after fallback: {:.4f} (exact: {:.4f})".format(result.log_evidence, exact_evidence))
+assert result.num_resampled == 0
+assert abs(result.log_evidence - exact_evidence) < 0.5
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Checks that deeply nested ASTs are visited without exceeding the recursion limit, that no helper threads are left
+running after a visit, and that compiling a batch of models in worker processes still works after a deep model has
+been compiled in the main process (the workers are forked from it).
+
+License: MIT
+'''
+import os
+import shutil
+import tempfile
+import threading
+from pyppl import compile_model, compile_models
+from pyppl.ppl_ast import *
+
+# A sum of 10000 terms, nested to the left: `((((0 + 1) + 2) + 3) + ...)`
+N = 10000
+deep_sum = AstValue(0)
+for i in range(1, N):
+    deep_sum = AstBinary(deep_sum, '+', AstValue(i))
+
+class SumVisitor(Visitor):
+
+    __visit_iteratively__ = True
+
+    def visit_binary(self, node: AstBinary):
+        return self.visit(node.left) + self.visit(node.right)
+
+    def visit_value(self, node: AstValue):
+        return node.value
+
+threads_before = threading.active_count()
+result = SumVisitor().visit(deep_sum)
+print("sum of {} terms: {} (expected: {})".format(N, result, N * (N-1) // 2))
+assert result == N * (N-1) // 2
+assert threading.active_count() == threads_before
+
+# Exceptions are passed down from the segment where they occur
+class FailingVisitor(SumVisitor):
+
+    def visit_value(self, node: AstValue):
+        if node.value == 0:
+            raise ValueError("the innermost term")
+        return node.value
+
+try:
+    FailingVisitor().visit(deep_sum)
+    assert False, "the exception was not passed on"
+except ValueError as e:
+    print("exception passed on:", e)
+assert threading.active_count() == threads_before
+
+
+def deep_model(n: int):
+    return "(let [x (sample (normal 0 1))] (observe (normal {}x{} 1) 2.0))".format("(+ 1 " * n, ")" * n)
+
+compiled = compile_model(deep_model(400), language='clojure')
+print("compiled a model with a sum of 400 terms")
+assert threading.active_count() == threads_before
+
+directory = tempfile.mkdtemp()
+try:
+    for i in range(3):
+        with open(os.path.join(directory, 'model_{}.clj'.format(i)), 'w') as f:
+            f.write(deep_model(150 + i))
+    results = compile_models(directory, workers=2)
+    print(results)
+    assert len(results) == 3 and all(result.success for result in results)
+finally:
+    shutil.rmtree(directory)
@@ -12,12 +12,19 @@ from ..aux.ppl_transform_visitor import TransformVisitor
 from ..types import ppl_types, ppl_type_inference
 
 
+def _is_chain(op: str, node: AstNode):
+    return isinstance(node, (AstBinary, AstNary)) and node.op == op
+
+
 class Simplifier(TransformVisitor):
 
-    def __init__(self):
+    def __init__(self, data_types: Optional[dict]=None):
         super().__init__()
         self.type_inferencer = ppl_type_inference.TypeInferencer(self)
         self.bindings = {}
+        if data_types is not None:
+            for name in data_types:
+                self.define(name, data_types[name])
 
     def get_type(self, node: AstNode):
         result = self.type_inferencer.visit(node)
@@ -36,9 +43,17 @@ class Simplifier(TransformVisitor):
                         node.op in ('-', '/', '//') and node.left.name == node.right.name:
             return AstValue(0 if node.op == '-' else 1)
 
+        # Long sums and products are flattened into a single n-ary node (see `makeNary`)
+        if node.op in ('+', '*') and (_is_chain(node.op, node.left) or _is_chain(node.op, node.right)):
+            items = [self.visit(item) for item in flatten_operands(node.op, [node])]
+            return _cl(makeNary(node.op, items), node)
+
         left = self.visit(node.left)
         right = self.visit(node.right)
         op = node.op
+        if op in ('+', '*') and (_is_chain(op, left) or _is_chain(op, right)):
+            return _cl(makeNary(op, [left, right]), node)
+
         if is_number(left) and is_number(right):
             return AstValue(node.op_function(left.value, right.value))
 
@@ -46,16 +61,16 @@ class Simplifier(TransformVisitor):
             return _cl(AstValue(left.value + right.value), node)
 
         elif op == '+' and isinstance(left, AstValueVector) and isinstance(right, AstValueVector):
-            return _cl(AstValueVector(left.items + right.items), node)
+            return _cl(left.concat(right), node)
 
         elif op == '*' and (is_string(left) and is_integer(right)) or (is_integer(left) and is_string(right)):
             return _cl(AstValue(left.value * right.value), node)
 
         elif op == '*' and isinstance(left, AstValueVector) and is_integer(right):
-            return _cl(AstValueVector(left.items * right.value), node)
+            return _cl(left.repeat(right.value), node)
 
         elif op == '*' and is_integer(left) and isinstance(right, AstValueVector):
-            return _cl(AstValueVector(left.value * right.items), node)
+            return _cl(right.repeat(left.value), node)
 
         elif is_number(left):
             value = left.value
@@ -219,6 +234,9 @@ class Simplifier(TransformVisitor):
 
         if node.op in ('in', 'not in') and is_vector(right) and second_right is None:
             op = node.op
+            if isinstance(left, AstValue) and isinstance(right, AstValueVector):
+                found = left.value in right.items
+                return AstValue(found if op == 'in' else not found)
             for item in right:
                 if left == item:
                     return AstValue(True if op == 'in' else False)
@@ -229,7 +247,7 @@ class Simplifier(TransformVisitor):
     def visit_def(self, node: AstDef):
         value = self.visit(node.value)
         if isinstance(value, AstSample):
-            return node.clone(value=value)
+            return node if value is node.value else node.clone(value=value)
         self.define_name(node.name, value)
         return AstBody([])
 
@@ -300,6 +318,10 @@ class Simplifier(TransformVisitor):
 
         raise RuntimeError("cannot unroll the for-loop [line {}]".format(getattr(node, 'lineno', '?')))
 
+    def visit_nary(self, node: AstNary):
+        items = [self.visit(item) for item in node.items]
+        return _cl(makeNary(node.op, items), node)
+
     def visit_subscript(self, node: AstSubscript):
         base = self.visit(node.base)
         index = self.visit(node.index)
@@ -0,0 +1,204 @@
+#
+# This file is part of PyFOPPL, an implementation of a First Order Probabilistic Programming Language in Python.
+#
+# License: MIT (see LICENSE.txt)
+#
+# The pass manager runs the transformations of the AST (see `parser.parse`), one after the other. Since the
+# transformations return the original node if they have nothing to change, the pass manager can tell if a pass
+# changed the AST at all by comparing the identity of the nodes. This allows it to skip passes that would have
+# nothing to do, and to repeat passes until they reach a fixpoint.
+#
+import time
+from typing import Optional
+from ..ppl_ast import *
+from ..aux.ppl_transform_visitor import TransformVisitor
+from . import (ppl_new_simplifier, ppl_raw_simplifier, ppl_functions_inliner,
+               ppl_symbol_simplifier, ppl_static_assignments)
+
+
+class Pass(object):
+    """
+    A single transformation of the AST. The `factory` takes the pass manager as argument (providing the `namespace`
+    and `data_types`), and returns the visitor to transform the AST with.
+
+    - `idempotent`: running the pass a second time on its own output does not change anything. The pass is skipped
+      if the AST has not been changed since its last run.
+    - `fixpoint`: the pass is repeated (at most `max_iterations` times) until it no longer changes the AST.
+    - `shared`: all occurrences of the pass within the same run use the same visitor (and its scopes), instead of
+      creating a new one each time.
+    """
+
+    def __init__(self, name:str, factory, *, idempotent:bool=False, fixpoint:bool=False, max_iterations:int=10,
+                 shared:bool=False):
+        self.name = name
+        self.factory = factory
+        self.idempotent = idempotent
+        self.fixpoint = fixpoint
+        self.max_iterations = max_iterations
+        self.shared = shared
+        assert type(self.name) is str and self.name != ''
+        assert callable(self.factory)
+        assert type(self.max_iterations) is int and self.max_iterations > 0
+
+    def __repr__(self):
+        return "Pass({})".format(self.name)
+
+    def can_fuse(self, other):
+        return False
+
+
+class _Rewriter(TransformVisitor):
+
+    def __init__(self, rewrites:list):
+        super().__init__()
+        self.rewrites = rewrites
+
+    def visit(self, ast):
+        result = super().visit(ast)
+        if isinstance(result, AstNode):
+            for rewrite in self.rewrites:
+                result = rewrite(result)
+        return result
+
+
+class RewritePass(Pass):
+    """
+    A pass given by a function, which rewrites a single node, and returns either the node itself (if there is nothing
+    to change), or a new node. The function is applied to all nodes of the AST, bottom up, i.e. the children of the
+    node have already been rewritten.
+
+    As such rewrites do not depend on any scopes, consecutive rewrite passes are fused into a single traversal of the
+    AST, where each node is passed through all rewrite functions in turn.
+    """
+
+    def __init__(self, name:str, rewrite, *, fixpoint:bool=False, max_iterations:int=10):
+        if callable(rewrite):
+            rewrite = [rewrite]
+        super().__init__(name, lambda _: _Rewriter(self.rewrites), fixpoint=fixpoint, max_iterations=max_iterations)
+        self.rewrites = list(rewrite)
+        assert all([callable(item) for item in self.rewrites])
+
+    def can_fuse(self, other):
+        return isinstance(other, RewritePass) and other.fixpoint == self.fixpoint
+
+    def fuse(self, other):
+        return RewritePass("{}+{}".format(self.name, other.name), self.rewrites + other.rewrites,
+                           fixpoint=self.fixpoint, max_iterations=max(self.max_iterations, other.max_iterations))
+
+
+PASSES = {
+    'raw-simplify':
+        Pass('raw-simplify', lambda manager: ppl_raw_simplifier.RawSimplifier(manager.namespace),
+             idempotent=True, shared=True),
+    'inline-functions':
+        Pass('inline-functions', lambda _: ppl_functions_inliner.FunctionInliner()),
+    'static-assignments':
+        Pass('static-assignments', lambda _: ppl_static_assignments.StaticAssignments()),
+    'simplify':
+        Pass('simplify', lambda manager: ppl_new_simplifier.Simplifier(manager.data_types)),
+    'simplify-symbols':
+        Pass('simplify-symbols', lambda _: ppl_symbol_simplifier.SymbolSimplifier()),
+}
+
+DEFAULT_PASSES = ('raw-simplify', 'inline-functions', 'raw-simplify', 'static-assignments', 'simplify',
+                  'simplify-symbols')
+
+# The passes used with `parse(..., simplify=False)`
+RAW_PASSES = ('raw-simplify', 'simplify-symbols')
+
+
+def get_pass(name):
+    if isinstance(name, Pass):
+        return name
+    elif type(name) is str and name in PASSES:
+        return PASSES[name]
+    else:
+        raise RuntimeError("unknown pass: '{}'".format(name))
+
+
+class PassStatistics(object):
+    """
+    Records how often a pass was run (`runs` counts the iterations of fixpoint passes), how often it was skipped,
+    how many of the runs changed the AST, and the total `time` in seconds.
+    """
+
+    def __init__(self, name:str):
+        self.name = name
+        self.runs = 0
+        self.skipped = 0
+        self.changes = 0
+        self.time = 0.0
+
+    def __repr__(self):
+        return "PassStatistics({}: {} runs, {} skipped, {} changes, {:.3f}s)".format(
+            self.name, self.runs, self.skipped, self.changes, self.time)
+
+
+class PassManager(object):
+    """
+    Runs a list of passes (given as names from `PASSES`, or as `Pass`-objects) over the AST:
+      ```
+      manager = PassManager(['raw-simplify', 'inline-functions', 'raw-simplify'])
+      ast = manager.run(ast, namespace=namespace)
+      print(manager.format_statistics())
+      ```
+    A `PassManager` can also be passed as `passes` to `compile_model`, to get at the statistics afterwards.
+    With `fuse=True`, consecutive passes that allow it (see `RewritePass`) are combined into a single pass.
+    """
+
+    def __init__(self, passes=None, *, fuse:bool=True):
+        if passes is None:
+            passes = DEFAULT_PASSES
+        passes = [get_pass(item) for item in passes]
+        if fuse:
+            fused = []
+            for item in passes:
+                if len(fused) > 0 and fused[-1].can_fuse(item):
+                    fused[-1] = fused[-1].fuse(item)
+                else:
+                    fused.append(item)
+            passes = fused
+        self.passes = passes
+        self.namespace = {}
+        self.data_types = None
+        self.statistics = [PassStatistics(item.name) for item in passes]
+
+    def __repr__(self):
+        return "PassManager({})".format(', '.join([item.name for item in self.passes]))
+
+    def run(self, ast, *, namespace:Optional[dict]=None, data_types:Optional[dict]=None):
+        if ast is None:
+            return None
+        self.namespace = namespace if namespace is not None else {}
+        self.data_types = data_types
+        visitors = {}
+        last_outputs = {}
+        for item, stats in zip(self.passes, self.statistics):
+            if item.idempotent and last_outputs.get(item, None) is ast:
+                stats.skipped += 1
+                continue
+
+            start_time = time.perf_counter()
+            for _ in range(item.max_iterations if item.fixpoint else 1):
+                if item.shared:
+                    if item not in visitors:
+                        visitors[item] = item.factory(self)
+                    visitor = visitors[item]
+                else:
+                    visitor = item.factory(self)
+                result = visitor.visit(ast)
+                stats.runs += 1
+                if result is ast:
+                    break
+                stats.changes += 1
+                ast = result
+            stats.time += time.perf_counter() - start_time
+            last_outputs[item] = ast
+        return ast
+
+    def format_statistics(self):
+        result = ["{:<24}{:>6}{:>9}{:>9}{:>10}".format('pass', 'runs', 'skipped', 'changes', 'time')]
+        for stats in self.statistics:
+            result.append("{:<24}{:>6}{:>9}{:>9}{:>9.3f}s".format(
+                stats.name, stats.runs, stats.skipped, stats.changes, stats.time))
+        return '\n'.join(result)
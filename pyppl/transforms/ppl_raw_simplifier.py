@@ -78,7 +78,11 @@ class RawSimplifier(ScopedVisitor):
                     items = items[:i+1]
             i -= 1
 
-        return _cl(makeBody(items), node)
+        result = makeBody(items)
+        if isinstance(result, AstBody) and len(result.items) == len(node.items) and \
+                all([a is b for a, b in zip(result.items, node.items)]):
+            return node
+        return _cl(result, node)
 
     def visit_call(self, node: AstCall):
         if node.arg_count > 0:
@@ -89,6 +93,8 @@ class RawSimplifier(ScopedVisitor):
                 p, a = self._visit_expr(arg)
                 prefix += p
                 args.append(a)
+            if len(prefix) == 0 and function is node.function and all([a is b for a, b in zip(args, node.args)]):
+                return node
             return makeBody(prefix, node.clone(function=function, args=args))
         else:
             function = self.visit(node.function)
@@ -206,6 +212,8 @@ class RawSimplifier(ScopedVisitor):
         return node # AstBody([]) # _cl(AstImport(module_name), node)
 
     def visit_let(self, node: AstLet):
+        if getattr(node.source, 'original_name', None) is None:
+            node.source.original_name = node.original_target
         prefix, source = self._visit_expr(node.source)
         body = self.visit(node.body)
         if source is node.source and body is node.body:
@@ -222,6 +230,19 @@ class RawSimplifier(ScopedVisitor):
         else:
             return makeBody(prefix, node.clone(target=target, source=source, expr=expr))
 
+    def visit_nary(self, node: AstNary):
+        prefix = []
+        items = []
+        for item in node.items:
+            p, i = self._visit_expr(item)
+            prefix += p
+            items.append(i)
+        if all([a is b for a, b in zip(items, node.items)]):
+            return node
+        else:
+            prefix.append(AstNary(node.op, items))
+            return _cl(makeBody(prefix), node)
+
     def visit_observe(self, node: AstObserve):
         d_prefix, dist = self._visit_expr(node.dist)
         v_prefix, value = self._visit_expr(node.value)
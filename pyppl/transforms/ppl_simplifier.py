@@ -105,16 +105,16 @@ class Simplifier(BranchScopeVisitor):
             return _cl(AstValue(left.value + right.value), node)
 
         elif op == '+' and isinstance(left, AstValueVector) and isinstance(right, AstValueVector):
-            return _cl(AstValueVector(left.items + right.items), node)
+            return _cl(left.concat(right), node)
 
         elif op == '*' and (is_string(left) and is_integer(right)) or (is_integer(left) and is_string(right)):
             return _cl(AstValue(left.value * right.value), node)
 
         elif op == '*' and isinstance(left, AstValueVector) and is_integer(right):
-            return _cl(AstValueVector(left.items * right.value), node)
+            return _cl(left.repeat(right.value), node)
 
         elif op == '*' and is_integer(left) and isinstance(right, AstValueVector):
-            return _cl(AstValueVector(left.value * right.items), node)
+            return _cl(right.repeat(left.value), node)
 
         elif is_number(left):
             value = left.value
@@ -29,32 +29,41 @@ class Symbol(object):
 
 
 class SymbolScope(object):
+    """
+    Maps the names to their current instances. As with `Scope` (see `ppl_ast`), all scopes of a chain share a table,
+    which maps each name to the stack of scopes binding it (innermost last), so that looking up a name does not
+    walk the chain of scopes. Scopes must be left in the reverse order of their creation (through `release`).
+    """
 
     def __init__(self, prev, items=None, is_loop:bool=False):
         self.prev = prev
         self.bindings = {}
         self.items = items
         self.is_loop = is_loop
+        self._table = prev._table if prev is not None else {}
 
     def get_current_symbol(self, name: str):
-        if name in self.bindings:
-            return self.bindings[name]
-        elif self.prev is not None:
-            return self.prev.get_current_symbol(name)
+        stack = self._table.get(name, None)
+        if stack is not None:
+            return stack[-1].bindings[name]
         else:
             return name
 
     def has_current_symbol(self, name: str):
-        if name in self.bindings:
-            return True
-        elif self.prev is not None:
-            return self.prev.has_current_symbol(name)
-        else:
-            return False
+        return name in self._table
 
     def set_current_symbol(self, name: str, instance_name: str):
+        if name not in self.bindings:
+            self._table.setdefault(name, []).append(self)
         self.bindings[name] = instance_name
 
+    def release(self):
+        for name in self.bindings:
+            stack = self._table[name]
+            stack.pop()
+            if len(stack) == 0:
+                del self._table[name]
+
     def append(self, item):
         if self.items is not None:
             self.items.append(item)
@@ -89,6 +98,7 @@ class StaticAssignments(TransformVisitor):
 
     def end_scope(self):
         scope = self.symbol_scope
+        scope.release()
         self.symbol_scope = scope.prev
         return scope.bindings
 
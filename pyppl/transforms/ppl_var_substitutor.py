@@ -11,6 +11,8 @@ from ..ppl_ast import *
 
 class VarSubstitutor(Visitor):
 
+    __visit_iteratively__ = True
+
     def __init__(self, bindings:dict):
         self.bindings = bindings
         assert type(self.bindings) is dict
@@ -93,6 +95,13 @@ class VarSubstitutor(Visitor):
     def visit_list_for(self, node: AstListFor):
         return self.visit_node(node)
 
+    def visit_nary(self, node: AstNary):
+        items = [self.visit(item) for item in node.items]
+        if all([a is b for a, b in zip(items, node.items)]):
+            return node
+        else:
+            return _cl(AstNary(node.op, items), node)
+
     def visit_observe(self, node: AstObserve):
         dist = self.visit(node.dist)
         value = self.visit(node.value)
@@ -7,15 +7,49 @@
 # 22. Mar 2018, Tobias Kohn
 #
 from ..ppl_ast import *
+from ..ppl_ast_annotators import get_info
 from .ppl_types import *
 
 class TypeInferencer(Visitor):
+    """
+    Infers the type of an expression. Symbols are resolved through the `parent`, which is usually the visitor
+    asking for the type (a simplifier, say), so that the type of a symbol is the type of the value it is bound to.
+
+    As the children are visited first, and then again by the `visit_XXX`-methods, each query remembers the types
+    of the nodes it has already seen. Moreover, the type of an expression without free variables does not depend on
+    the parent, and is therefore cached on the node itself (see `AstNode.invalidate`).
+    """
 
     __visit_children_first__ = True
+    __visit_iteratively__ = True
 
     def __init__(self, parent):
         super().__init__()
         self.parent = parent
+        self._types = None
+
+    def visit(self, ast):
+        if not isinstance(ast, AstNode):
+            return super().visit(ast)
+        if '_type' in ast.__dict__:
+            return ast._type
+        if self._types is not None:
+            return self._visit_node(ast)
+        self._types = {}
+        try:
+            return self._visit_node(ast)
+        finally:
+            self._types = None
+
+    def _visit_node(self, node: AstNode):
+        key = id(node)
+        if key in self._types:
+            return self._types[key][1]
+        result = super().visit(node)
+        self._types[key] = (node, result)
+        if not get_info(node).has_free_vars:
+            node._type = result
+        return result
 
     def define(self, name:str, value):
         if name is None or name == '_':
@@ -182,6 +216,13 @@ class TypeInferencer(Visitor):
         else:
             return AnyType
 
+    def visit_nary(self, node: AstNary):
+        items = [self.visit(item) for item in node.items]
+        result = items[0]
+        for item in items[1:]:
+            result = node.op_function(result, item)
+        return result
+
     def visit_sample(self, node: AstSample):
         return Numeric
 
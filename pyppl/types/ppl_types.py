@@ -7,6 +7,7 @@
 # 16. Mar 2018, Tobias Kohn
 #
 from typing import Optional
+import array as _array
 
 class Type(object):
 
@@ -139,7 +140,8 @@ class SequenceType(Type):
             return False
 
     def __hash__(self):
-        if self.item_type is None:
+        # A recursive type (such as `String`) is its own item-type, so its hash must not depend on the item-type
+        if self.item_type is None or self.recursive:
             return hash(self.name)
         elif self.size is None:
             return hash((self.name, hash(self.item_type)))
@@ -163,23 +165,21 @@ class SequenceType(Type):
                 result = self.__getitem__(item[0])
                 return result.__getitem__(item[1])
 
-            elif isinstance(item, SequenceType):
-                return SequenceType(name=self.name, base=self, item_type=item)
-
             elif isinstance(item, Type):
-                if item not in self._sub_types:
-                    self._sub_types[item] = SequenceType(name=self.name, base=self, item_type=item)
-                return self._sub_types[item]
+                # The specialised types are interned, so that, e.g., `List[Integer][3]` is always the same instance
+                result = self._sub_types.get(item, None)
+                if result is None:
+                    result = SequenceType(name=self.name, base=self, item_type=item)
+                    self._sub_types[item] = result
+                return result
 
         elif self.size is None:
             if type(item) is int and item >= 0:
-                if 0 <= item <= 3:
-                    if item not in self._sub_types:
-                        self._sub_types[item] = SequenceType(name=self.name, base=self,
-                                                             item_type=self.item_type, size=item)
-                    return self._sub_types[item]
-                else:
-                    return SequenceType(name=self.name, base=self, item_type=self.item_type, size=item)
+                result = self._sub_types.get(item, None)
+                if result is None:
+                    result = SequenceType(name=self.name, base=self, item_type=self.item_type, size=item)
+                    self._sub_types[item] = result
+                return result
 
         raise TypeError("cannot construct '{}'-subtype of '{}'".format(item, self))
 
@@ -388,7 +388,12 @@ def from_python(value):
         return _types[value]
 
     t = type(value)
-    if t in [list, tuple]:
+    if t is _array.array:
+        # Compact numeric vectors (see `AstValueVector`) hold either only floats or only integers
+        item = Float if value.typecode in ('d', 'f') else Integer
+        return List[item][len(value)]
+
+    elif t in [list, tuple]:
         item = union(*[from_python(item) for item in value])
         if t is list:
             return List[item][len(value)]
@@ -402,6 +407,37 @@ def from_python(value):
     else:
         return AnyType
 
+def from_shape(shape, item_type: Type=Float):
+    """
+    Returns the type of a tensor with the given shape and item-type, e. g., `Tensor[Tensor[Float;3];5]` for the
+    shape `(5, 3)`.
+    """
+    result = item_type
+    for size in reversed(shape):
+        result = Tensor[result, size]
+    return result
+
+def from_data(value):
+    """
+    Returns the type of the given data, which is either a list, a NumPy-array or tensor, or the shape of the data as
+    a tuple of integers (in which case the data is assumed to contain floats).
+    """
+    if type(value) is int:
+        return from_shape((value,))
+    elif type(value) is tuple and all([type(item) is int for item in value]):
+        return from_shape(value)
+    elif hasattr(value, 'shape') and hasattr(value, 'dtype'):
+        dtype = str(value.dtype)
+        if 'bool' in dtype:
+            item_type = Boolean
+        elif 'int' in dtype:
+            item_type = Integer
+        else:
+            item_type = Float
+        return from_shape(tuple(value.shape), item_type)
+    else:
+        return from_python(value)
+
 def makeArray(base):
     if isinstance(base, SequenceType):
         item = makeArray(base.item) if isinstance(base.item, SequenceType) else base.item